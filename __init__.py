@@ -1,39 +1,176 @@
 import asyncio
-import re
-import sqlite3
+import functools
+import io
+import json
+import math
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import NamedTuple
 
+import aiohttp
 import discord
 from discord import app_commands
 from discord.ext import commands
-from youtubesearchpython.__future__ import Video
 
 import breadcord
-from .api import helpers
-from .api.abc import AbstractAPI, AbstractOAuthAPI, UniversalTrack, AbstractPlaylistAPI
-from .api.errors import InvalidURLError
-from .api.helpers import track_embed, track_to_query, url_to_file
-from .api.platforms import SpotifyAPI, YoutubeAPI
+from .api import helpers, metrics
+from .api.abc import UniversalTrack, AbstractPlaylistAPI
+from .api.cache import ConversionCache
+from .api.catalog import TrackCatalog
+from .api.converter import TrackConverter
+from .api.covers import CoverCache
+from .api.database import AsyncDatabase
+from .api.hedging import HedgePolicy
+from .api.errors import CoverTooLargeError, InvalidURLError, QueueFullError
+from .api.helpers import track_embed, url_to_file
+from .api.metrics import MetricsServer
+from .api.negative_cache import FailureKind, NegativeCache
+from .api.platforms import YoutubeAPI
+from .api.prefetch import Prefetcher
+from .api.ratelimit import Priority, request_priority
+from .api.scheduler import ConversionScheduler
 from .api.types import APIInterface
 
+# Append new migrations to the end, never edit or reorder existing ones
+DATABASE_MIGRATIONS = (
+    # language=SQLite
+    "CREATE TABLE IF NOT EXISTS community_playlist ("
+    "    track_url TEXT UNIQUE,"
+    "    addition_author_id INTEGER,"
+    "    rejected INT,"
+    "    PRIMARY KEY (track_url)"
+    ")",
+    # language=SQLite
+    "CREATE INDEX IF NOT EXISTS community_playlist_rejected ON community_playlist (rejected)",
+    # language=SQLite
+    "CREATE TABLE IF NOT EXISTS playlist_messages ("
+    "    message_id INTEGER PRIMARY KEY,"
+    "    track_url TEXT NOT NULL,"
+    "    approvals INTEGER NOT NULL DEFAULT 0,"
+    "    rejections INTEGER NOT NULL DEFAULT 0,"
+    "    embed TEXT NOT NULL"
+    ")",
+    # language=SQLite
+    # Tracks added before canonical keys were kept have none, and are only deduplicated by their URL
+    "ALTER TABLE community_playlist ADD COLUMN canonical_key TEXT;"
+    "CREATE INDEX IF NOT EXISTS community_playlist_canonical_key ON community_playlist (canonical_key)",
+)
+APPROVE_EMOJI = "\N{WHITE HEAVY CHECK MARK}"
+REJECT_EMOJI = "\N{NEGATIVE SQUARED CROSS MARK}"
+
+
+class CommunityPlaylistPage(NamedTuple):
+    content: str
+    index: int
+    # The rowid this page starts after
+    after_rowid: int
+    # The rowid the next page starts after, None if this is the last page
+    next_after_rowid: int | None
+
+
+class LateReplies:
+    """Sends the URLs that were converted late to every message that shares a conversion.
+
+    Only the first ``max_listeners`` messages get a late reply, and nothing is sent once ``ttl`` seconds have passed,
+    since by then the conversation has moved on.
+    """
+
+    def __init__(self, *, max_listeners: int = 5, ttl: float = 60):
+        self.max_listeners = max_listeners
+        self.expires_at = time.monotonic() + ttl
+        self.urls: str | None = None
+        self._listeners: list[Callable[[str], Awaitable[None]]] = []
+
+    def add(self, listener: Callable[[str], Awaitable[None]]) -> str | None:
+        """Calls ``listener`` with the late URLs once they're in, or returns them if they already are."""
+        if self.urls is not None:
+            return self.urls
+        if len(self._listeners) < self.max_listeners and time.monotonic() < self.expires_at:
+            self._listeners.append(listener)
+        return None
+
+    async def send(self, urls: str) -> None:
+        self.urls = urls
+        listeners, self._listeners = self._listeners, []
+        if time.monotonic() >= self.expires_at:
+            return
+        await asyncio.gather(*(listener(urls) for listener in listeners))
+
+
+class CommunityPlaylistView(discord.ui.View):
+    def __init__(self, cog: "PlatformConverter", *, author_id: int, page: CommunityPlaylistPage):
+        super().__init__(timeout=300)
+        self.cog = cog
+        self.author_id = author_id
+        self.page = page
+        # Where each page we've been through starts, so that we can go back without an offset
+        self.previous_pages: list[int] = []
+        self.message: discord.Message | None = None
+        self._update_buttons()
+
+    def _update_buttons(self) -> None:
+        self.previous_page.disabled = not self.previous_pages
+        self.next_page.disabled = self.page.next_after_rowid is None
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.author_id:
+            await interaction.response.send_message("Run the command yourself to browse the playlist.", ephemeral=True)
+            return False
+        return True
+
+    async def _show_page(self, interaction: discord.Interaction, after_rowid: int, index: int) -> None:
+        page = await self.cog.community_playlist_page(after_rowid, index)
+        if page is None:
+            self.stop()
+            await interaction.response.edit_message(content="The community playlist is empty.", view=None)
+            return
+        self.page = page
+        self._update_buttons()
+        await interaction.response.edit_message(content=page.content, view=self)
+
+    # noinspection PyUnusedLocal
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        await self._show_page(interaction, self.previous_pages.pop(), self.page.index - 1)
+
+    # noinspection PyUnusedLocal
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        self.previous_pages.append(self.page.after_rowid)
+        await self._show_page(interaction, self.page.next_after_rowid, self.page.index + 1)
+
+    async def on_timeout(self) -> None:
+        if self.message is None:
+            return
+        for item in self.children:
+            item.disabled = True
+        try:
+            await self.message.edit(view=self)
+        except discord.HTTPException:
+            pass
+
 
 # noinspection SqlResolve
 class PlatformConverter(helpers.PlatformAPICog):
+    # Tracks in the community playlist are rejected once their score (approvals - rejections) drops this low
+    REJECTED_AT_SCORE = -2
+    # How long to wait for more votes before updating a community playlist message, in seconds
+    VOTE_EDIT_DELAY = 2.0
+    # How many messages in the community playlist channel that aren't playlist messages are remembered as such
+    NON_PLAYLIST_MESSAGES_REMEMBERED = 1024
+    # How many tracks are shown on each page of the community_playlist command
+    COMMUNITY_PLAYLIST_PAGE_SIZE = 15
+    # The least time between edits of the playlist_convert reply while it shows progress, in seconds
+    PLAYLIST_CONVERT_EDIT_INTERVAL = 3.0
+
     def __init__(self, module_id: str):
         super().__init__(module_id)
 
-        self.logger.debug("Creating database")
-        self.db_connection = sqlite3.connect(self.module.storage_path / "platform_converter.db")
-        self.db_cursor = self.db_connection.cursor()
-        self.db_cursor.execute(
-            "CREATE TABLE IF NOT EXISTS community_playlist ("
-            "    track_url TEXT UNIQUE,"
-            "    addition_author_id INTEGER,"
-            "    rejected INT,"
-            "    PRIMARY KEY (track_url)"
-            ")"
+        self.database = AsyncDatabase(
+            self.module.storage_path / "platform_converter.db",
+            migrations=DATABASE_MIGRATIONS,
         )
-        self.db_connection.commit()
-        self.logger.debug("Database created")
 
         self.ctx_menu = app_commands.ContextMenu(
             name="Convert music/video URLs",
@@ -41,6 +178,116 @@ class PlatformConverter(helpers.PlatformAPICog):
         )
         self.bot.tree.add_command(self.ctx_menu)
 
+        self.converter: TrackConverter | None = None
+        self.catalog: TrackCatalog | None = None
+        self.prefetcher: Prefetcher | None = None
+        scheduler_settings: breadcord.config.SettingsGroup = self.settings.scheduler
+        self.scheduler = ConversionScheduler(
+            workers=scheduler_settings.workers.value,
+            max_queued=scheduler_settings.max_queued.value,
+        )
+        cover_cache_settings: breadcord.config.SettingsGroup = self.settings.cover_cache
+        self.cover_cache = CoverCache(
+            self.module.storage_path / "covers",
+            max_bytes=cover_cache_settings.max_size_mb.value * 1024 * 1024,
+            max_file_bytes=cover_cache_settings.max_file_size_mb.value * 1024 * 1024,
+        )
+        self.metrics_server: MetricsServer | None = None
+        self._pending_vote_evaluations: dict[int, asyncio.TimerHandle] = {}
+        self._community_playlist_pages: dict[tuple[int, int], CommunityPlaylistPage] = {}
+        self._community_playlist_size: int | None = None
+        self._community_playlist_generation = 0
+        self._vote_evaluation_tasks: set[asyncio.Task] = set()
+        # Messages that votes were cast on which turned out not to be playlist messages, so they aren't fetched again
+        self._non_playlist_message_ids: OrderedDict[int, None] = OrderedDict()
+
+    async def cog_load(self) -> None:
+        await super().cog_load()
+        self.logger.debug("Connecting to database")
+        await self.database.connect()
+        self.logger.debug("Connected to database")
+
+        catalog_settings: breadcord.config.SettingsGroup = self.settings.catalog
+        if catalog_settings.max_tracks.value > 0:
+            self.catalog = TrackCatalog(
+                self.module.storage_path / "catalog.db",
+                self.api_interfaces,
+                max_tracks=catalog_settings.max_tracks.value,
+                refresh_after=catalog_settings.refresh_after_seconds.value,
+                min_confidence=catalog_settings.min_confidence.value,
+            )
+            await self.catalog.connect()
+
+        cache_settings: breadcord.config.SettingsGroup = self.settings.conversion_cache
+        negative_cache_settings: breadcord.config.SettingsGroup = self.settings.negative_cache
+        hedging_settings: breadcord.config.SettingsGroup = self.settings.hedging
+        self.converter = TrackConverter(
+            self.api_interfaces,
+            cache=ConversionCache(
+                self.module.storage_path / "conversion_cache.db",
+                memory_size=cache_settings.memory_size.value,
+                memory_ttl=cache_settings.memory_ttl_seconds.value,
+                disk_ttl=cache_settings.disk_ttl_seconds.value,
+            ),
+            router=self.url_router,
+            catalog=self.catalog,
+            negative_cache=NegativeCache({
+                FailureKind.NOT_FOUND: negative_cache_settings.not_found_ttl_seconds.value,
+                FailureKind.PRIVATE: negative_cache_settings.private_ttl_seconds.value,
+                FailureKind.NO_MATCH: negative_cache_settings.no_match_ttl_seconds.value,
+            }),
+            hedge_policy=HedgePolicy(
+                percentile=hedging_settings.percentile.value,
+                min_delay=hedging_settings.min_delay_seconds.value,
+            ) if hedging_settings.enabled.value else None,
+        )
+        await self.converter.cache.connect()
+        await self.cover_cache.load()
+        self.scheduler.start()
+
+        prefetch_settings: breadcord.config.SettingsGroup = self.settings.prefetch
+        if prefetch_settings.enabled.value:
+            self.prefetcher = Prefetcher(
+                self.converter,
+                guild_budget=prefetch_settings.guild_budget.value,
+                budget_window=prefetch_settings.guild_budget_window_seconds.value,
+                max_concurrency=prefetch_settings.max_concurrency.value,
+            )
+            if prefetch_settings.warm_up_community_playlist.value:
+                self.prefetcher.warm_up(track_url for track_url, in await self.database.fetchall(
+                    # language=SQLite
+                    "SELECT track_url FROM community_playlist WHERE rejected = 0"
+                ))
+
+        if prometheus_port := self.settings.metrics.prometheus_port.value:
+            self.metrics_server = MetricsServer(metrics.registry, port=prometheus_port)
+            await self.metrics_server.start()
+            self.logger.info(f"Serving metrics at http://127.0.0.1:{prometheus_port}/metrics")
+
+    async def cog_unload(self) -> None:
+        # Everything that might still use the session or the databases is stopped before they're closed
+        if self.prefetcher is not None:
+            await self.prefetcher.close()
+        await self.scheduler.close()
+        for handle in self._pending_vote_evaluations.values():
+            handle.cancel()
+        self._pending_vote_evaluations.clear()
+        vote_evaluation_tasks = list(self._vote_evaluation_tasks)
+        for task in vote_evaluation_tasks:
+            task.cancel()
+        await asyncio.gather(*vote_evaluation_tasks, return_exceptions=True)
+        # Also closes the platforms, stopping their background token refreshes
+        if self.converter is not None:
+            await self.converter.close()
+        if self.catalog is not None:
+            await self.catalog.close()
+        await self.cover_cache.close()
+
+        await super().cog_unload()
+        await self.database.close()
+        if self.metrics_server is not None:
+            await self.metrics_server.close()
+
     # noinspection PyUnusedLocal
     async def platform_autocomplete(
         self,
@@ -76,64 +323,149 @@ class PlatformConverter(helpers.PlatformAPICog):
         if url.startswith("<") and url.endswith(">"):
             url = url[1:-1]
 
-        from_platform = self.api_interfaces.get(from_platform.lower())
-        to_platform = self.api_interfaces.get(to_platform.lower())
-        if not all((from_platform, to_platform)):
+        from_platform, to_platform = from_platform.lower(), to_platform.lower()
+        if from_platform not in self.api_interfaces or to_platform not in self.api_interfaces:
             await ctx.reply("Unknown platform")
             return
 
         try:
-            track_id = from_platform.get_track_id(url)
+            track_id = self.api_interfaces[from_platform].get_track_id(url)
         except InvalidURLError:
             await ctx.reply("Invalid url")
             return
-        query = track_to_query(await from_platform.track_from_id(track_id))
 
-        tracks = await to_platform.search_tracks(query)
-        if not tracks:
+        track = await self.converter.convert(from_platform, track_id, to_platform)
+        if track is None:
             await ctx.reply("No results found")
             return
-        await ctx.reply(tracks[0].url)
+        await ctx.reply(track.url)
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
+        if not self.url_router.might_contain_urls(message.content):
+            return
         if not self.settings.disliked_platforms.value:
+            self.prefetch_message_urls(message)
+            return
+
+        reply: discord.Message | None = None
+        replied = asyncio.Event()
+
+        async def send_late_urls(urls: str) -> None:
+            nonlocal reply
+            await replied.wait()
+            if reply is None:
+                reply = await message.reply(urls, mention_author=False)
+            else:
+                await reply.edit(content=urls)
+
+        async def convert() -> tuple[str | None, LateReplies]:
+            late_replies = LateReplies(
+                max_listeners=self.settings.deadlines.max_late_replies.value,
+                ttl=self.settings.deadlines.late_reply_ttl_seconds.value,
+            )
+            urls = await self.convert_message_urls(
+                message,
+                budget=self.settings.deadlines.message_budget_seconds.value,
+                on_late_urls=late_replies.send,
+            )
+            return urls, late_replies
+
+        try:
+            urls, late_replies = await self.scheduler.submit(
+                convert,
+                guild_id=message.guild and message.guild.id,
+                channel_id=message.channel.id,
+                # The same links posted over and over, such as during a raid, are only converted once
+                key=(self.settings.preferred_platform.value, *self.url_router.find_urls(message.content)),
+            )
+            # Every message sharing the conversion gets its own late reply, late URLs that are already in just go in the
+            # first reply
+            if (late_urls := late_replies.add(send_late_urls)) is not None:
+                urls = late_urls
+            if urls:
+                reply = await message.reply(urls, mention_author=False)
+        except QueueFullError:
+            self.logger.debug(f"Not converting the URLs in message {message.id}, too many conversions are queued")
+            return
+        finally:
+            replied.set()
+        # Only once the message has been converted, so that its conversions don't end up waiting behind prefetches
+        self.prefetch_message_urls(message, exclude=(self.settings.preferred_platform.value,))
+
+    def prefetch_message_urls(self, message: discord.Message, *, exclude: tuple[str, ...] = ()) -> None:
+        if self.prefetcher is None or message.guild is None or message.author.bot:
             return
-        if urls := await self.convert_message_urls(message):
-            await message.reply(urls, mention_author=False)
+        self.prefetcher.prefetch_text(message.content, guild_id=message.guild.id, exclude=exclude)
 
     async def url_convert_ctx_menu(self, interaction: discord.Interaction, message: discord.Message) -> None:
+        request_priority.set(Priority.INTERACTIVE)
         await interaction.response.defer(thinking=True, ephemeral=True)
-        await interaction.followup.send(await self.convert_message_urls(message) or "Nothing to convert")
+        replied = asyncio.Event()
 
-    async def convert_message_urls(self, message: discord.Message) -> str | None:
-        preferred_platform_interface = self.api_interfaces.get(self.settings.preferred_platform.value)
-        if preferred_platform_interface is None:
-            raise ValueError("No valid preferred platform is set")
+        async def send_late_urls(late_urls: str) -> None:
+            await replied.wait()
+            await interaction.edit_original_response(content=late_urls)
 
-        urls = re.findall("<?(?:https:|http:)\S+>?", message.content)
-        urls = tuple(filter(
-            lambda found_url: not found_url.startswith("<") and not found_url.endswith(">"),
-            urls
-        ))
-        if not urls:
+        try:
+            urls = await self.scheduler.submit(
+                functools.partial(
+                    self.convert_message_urls,
+                    message,
+                    budget=self.settings.deadlines.interaction_budget_seconds.value,
+                    on_late_urls=send_late_urls,
+                ),
+                priority=Priority.INTERACTIVE,
+                guild_id=interaction.guild_id,
+                channel_id=interaction.channel_id,
+            )
+        except QueueFullError:
+            replied.set()
+            await interaction.followup.send("Too many conversions are queued right now, try again in a bit")
             return
+        try:
+            if urls:
+                await interaction.followup.send(urls)
+            elif any(self.url_router.resolve(url, kind="track") for url in self.url_router.find_urls(message.content)):
+                await interaction.followup.send("No match found")
+            else:
+                await interaction.followup.send("Nothing to convert")
+        finally:
+            replied.set()
 
-        async def convert_url(url: str) -> str:
-            for api_interface in self.api_interfaces.values():
-                if api_interface == preferred_platform_interface:
-                    continue
-                try:
-                    track_id = api_interface.get_track_id(url)
-                except InvalidURLError:
-                    continue
+    async def convert_message_urls(
+        self,
+        message: discord.Message,
+        *,
+        budget: float | None = None,
+        on_late_urls: Callable[[str], Awaitable[None]] | None = None,
+    ) -> str | None:
+        """Converts the URLs in a message to the preferred platform, giving up on them after ``budget`` seconds.
 
-                query = track_to_query(await api_interface.track_from_id(track_id))
-                tracks = await preferred_platform_interface.search_tracks(query)
-                return tracks[0].url
+        If late replies are enabled, ``on_late_urls`` is called with every converted URL if more of them were
+        converted after giving up on them.
+        """
+        preferred_platform = self.settings.preferred_platform.value
+        if preferred_platform not in self.api_interfaces:
+            raise ValueError("No valid preferred platform is set")
+        deadline_settings: breadcord.config.SettingsGroup = self.settings.deadlines
+
+        async def on_late_results(tracks: list[UniversalTrack]) -> None:
+            await on_late_urls(" ".join(track.url for track in tracks))
 
-        converted_urls = tuple(filter(bool, await asyncio.gather(*map(convert_url, urls))))
-        return " ".join(converted_urls) or None
+        with metrics.message_conversions_in_progress.track_in_progress():
+            tracks = await self.converter.convert_text(
+                message.content,
+                preferred_platform,
+                budget=budget,
+                url_timeout=deadline_settings.url_timeout_seconds.value or None,
+                on_late_results=(
+                    on_late_results
+                    if on_late_urls is not None and deadline_settings.late_replies.value
+                    else None
+                ),
+            )
+        return " ".join(track.url for track in tracks) or None
 
     # noinspection PyIncorrectDocstring
     @commands.hybrid_command()
@@ -166,16 +498,30 @@ class PlatformConverter(helpers.PlatformAPICog):
             )))
             return
 
-        results = await platform.search_tracks(query)
+        result_count = min(10, max(1, count)) if compact_embeds else max(1, count)
+        platform_name = self.platform_name(platform)
+        results = await self.catalog.search(platform_name, query, limit=result_count) if self.catalog else []
+        # Only the catalog's answer is used if it has enough confident matches, otherwise the platform is searched
+        if len(results) < result_count:
+            results = await platform.search_tracks(query) or []
+            if self.catalog is not None:
+                for i, result in enumerate(results[:result_count]):
+                    # Only the top result is remembered as what the query was looking for
+                    await self.catalog.add(platform_name, result, query=query if i == 0 else None)
+
+        if not results:
+            await ctx.reply("No match found")
+            return
+
         if compact_embeds:
             embeds = []
             files = []
             for i, result in enumerate(results[:min(10, max(1, count))]):
                 result: UniversalTrack
-                files.append(discord.File(
-                    await url_to_file(result.cover_url, session=self.session),
-                    filename=f"{i}.png"
-                ))
+                if (cover := await self.cover_file(result.cover_url, filename=f"{i}.png")) is None:
+                    embeds.append(track_embed(result, random_colour=True))
+                    continue
+                files.append(cover)
                 embeds.append(track_embed(result, random_colour=True, cover_url=f"attachment://{i}.png"))
             await ctx.reply(embeds=embeds, files=files)
         else:
@@ -229,21 +575,31 @@ class PlatformConverter(helpers.PlatformAPICog):
 
         description = discord.utils.escape_markdown(playlist.description.strip()) if playlist.description else ""
         description += "\n\n**Tracks**"
-        for i, track in enumerate(playlist.tracks):
+        # One more than we show, so that we know whether there are more tracks without fetching every page
+        tracks = await playlist.tracks.take(max_tracks + 1)
+        truncated = len(tracks) > max_tracks
+        tracks = tracks[:max_tracks]
+
+        def more_tracks_text(shown_count: int) -> str:
+            # The total can include local and unavailable tracks, which are never listed, so it's only an upper bound
+            if (total_tracks := playlist.tracks.total) is not None and total_tracks > shown_count:
+                return f"\n\nAnd up to {total_tracks - shown_count} more..."
+            return "\n\nAnd more..."
+
+        shown_count = 0
+        for i, track in enumerate(tracks):
             title = discord.utils.escape_markdown(track.title)
             artists = ", ".join(map(discord.utils.escape_markdown, track.artist_names))
-
-            fallback_text = f"\n\nAnd {len(playlist.tracks) - i} more..." if i != len(playlist.tracks) - 1 else ""
-            addition = f"{i + 1}. [{title}]({track.url}) - {artists}"
-            if len(description) + len(addition) + len(fallback_text) >= 4096 or i >= max_tracks:
-                description += fallback_text
+            addition = f"\n{i + 1}. [{title}]({track.url}) - {artists}"
+            # Room is kept for saying that there are more tracks, in case this is the last one that fits
+            if len(description) + len(addition) + len(more_tracks_text(i + 1)) >= 4096:
                 break
-            description += f"\n{addition}"
+            description += addition
+            shown_count += 1
+        if truncated or shown_count < len(tracks):
+            description += more_tracks_text(shown_count)
 
-        cover = discord.File(
-            await url_to_file(playlist.cover_url, session=self.session),
-            filename="cover.png"
-        )
+        cover = await self.cover_file(playlist.cover_url, filename="cover.png")
         await ctx.reply(
             embed=discord.Embed(
                 title=playlist.name,
@@ -251,13 +607,153 @@ class PlatformConverter(helpers.PlatformAPICog):
                 url=playlist.url,
                 colour=discord.Colour.random(seed=playlist.url),
             ).set_thumbnail(
-                url="attachment://cover.png"
+                url="attachment://cover.png" if cover is not None else playlist.cover_url
             ).set_footer(
                 text=f"By {', '.join(playlist.owner_names)}" if playlist.owner_names else None,
             ),
             file=cover
         )
 
+    async def cover_file(self, cover_url: str | None, *, filename: str) -> discord.File | None:
+        """Downloads a cover to attach to a message, or returns None if it can't be, leaving it to Discord to load."""
+        if cover_url is None:
+            return None
+        try:
+            return discord.File(
+                await url_to_file(cover_url, session=self.session, cover_cache=self.cover_cache),
+                filename=filename
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError, CoverTooLargeError) as error:
+            self.logger.warning(f"Could not download the cover at {cover_url}: {error}")
+            return None
+
+    # noinspection PyIncorrectDocstring
+    @commands.hybrid_command()
+    @app_commands.autocomplete(
+        platform=playlist_platform_autocomplete, # type: ignore
+        to_platform=platform_autocomplete, # type: ignore
+    )
+    async def playlist_convert(
+        self,
+        ctx: commands.Context,
+        platform: helpers.PlatformConverter,
+        playlist_url: str,
+        to_platform: str | None = None,
+        as_file: bool = False
+    ):
+        """Converts every track in a playlist to another platform
+
+        Parameters
+        -----------
+        platform: APIInterface
+            The platform the playlist is on
+        playlist_url: str
+            The url to the playlist to convert
+        to_platform: str
+            The platform to convert to, the preferred platform if not given
+        as_file: bool
+            Whether to send the results as a file rather than in the message
+        """
+        platform: APIInterface | None
+        if not isinstance(platform, AbstractPlaylistAPI):
+            await ctx.reply("Invalid platform! Available platforms with playlist support are: " + ", ".join([
+                f"`{platform}`"
+                for platform in self.api_interfaces
+                if isinstance(self.api_interfaces[platform], AbstractPlaylistAPI)
+            ]))
+            return
+        source_platform = self.platform_name(platform)
+        target_platform = (to_platform or self.settings.preferred_platform.value).lower()
+        if target_platform not in self.api_interfaces:
+            await ctx.reply("Unknown platform")
+            return
+
+        if playlist_url.startswith("<") and playlist_url.endswith(">"):
+            playlist_url = playlist_url[1:-1]
+        try:
+            playlist_id = platform.get_playlist_id(playlist_url)
+        except InvalidURLError:
+            await ctx.reply("Invalid playlist url")
+            return
+
+        await ctx.defer()
+        playlist = await platform.get_playlist_content(playlist_id)
+        if playlist is None:
+            await ctx.reply("Could not find that playlist. Ensure that it exists and is public.")
+            return
+
+        settings: breadcord.config.SettingsGroup = self.settings.playlist_convert
+        max_tracks = settings.max_tracks.value
+        total = min(playlist.tracks.total, max_tracks) if playlist.tracks.total is not None else None
+        title = discord.utils.escape_markdown(playlist.name)
+        converted_count = found_count = 0
+
+        def progress_text() -> str:
+            return (
+                f"Converting **{title}** to {target_platform}..."
+                f" {converted_count}/{total if total is not None else '?'} tracks, {found_count} found"
+            )
+
+        def on_result(_: int, __: UniversalTrack, converted: UniversalTrack | None) -> None:
+            nonlocal converted_count, found_count
+            converted_count += 1
+            found_count += converted is not None
+
+        reply = await ctx.reply(progress_text(), mention_author=False)
+
+        async def show_progress() -> None:
+            # Edits are rate limited by Discord, so progress is only shown every so often rather than per track
+            shown_count = 0
+            while True:
+                await asyncio.sleep(self.PLAYLIST_CONVERT_EDIT_INTERVAL)
+                if converted_count == shown_count:
+                    continue
+                shown_count = converted_count
+                try:
+                    await reply.edit(content=progress_text())
+                except discord.HTTPException:
+                    pass
+
+        started_at = time.perf_counter()
+        progress_task = asyncio.create_task(show_progress())
+        try:
+            results = await self.converter.convert_all(
+                source_platform,
+                playlist.tracks,
+                target_platform,
+                workers=settings.workers.value,
+                limit=max_tracks,
+                on_result=on_result,
+            )
+        finally:
+            progress_task.cancel()
+
+        lines = []
+        for i, (track, converted) in enumerate(results, start=1):
+            artists = ", ".join(track.artist_names)
+            lines.append(f"{i}. {converted.url if converted else 'No match'} - {track.title} - {artists}")
+        summary = (
+            f"Converted **{title}** to {target_platform} in {time.perf_counter() - started_at:.1f}s,"
+            f" found {found_count} of {len(results)} tracks"
+        )
+        if playlist.tracks.total is not None and playlist.tracks.total > max_tracks:
+            summary += f" (only the first {max_tracks} tracks were converted)"
+
+        content = summary + "\n" + "\n".join(
+            f"{i}. <{converted.url}>" if converted else f"{i}. ~~{discord.utils.escape_markdown(track.title)}~~"
+            for i, (track, converted) in enumerate(results, start=1)
+        )
+        if as_file or len(content) > 2000:
+            await reply.edit(
+                content=summary,
+                attachments=[discord.File(
+                    io.BytesIO("\n".join(lines).encode("utf-8")),
+                    filename=f"{target_platform}_playlist.txt",
+                )],
+            )
+        else:
+            await reply.edit(content=content)
+
     @commands.hybrid_command(aliases=["pl_add", "pladd"])
     async def add_to_playlist(self, ctx: commands.Context, track_url_to_add: str):
         community_playlist_channel = self.bot.get_channel(int(self.settings.community_playlist_channel_id.value))
@@ -266,25 +762,14 @@ class PlatformConverter(helpers.PlatformAPICog):
             return
 
         async def get_standardised_track(url: str) -> UniversalTrack | None:
-            preferred_platform_interface = self.api_interfaces[self.settings.preferred_platform.value]
-            for api_interface in self.api_interfaces.values():
-                if not await api_interface.is_valid_track_url(url):
-                    continue
-                elif isinstance(api_interface, YoutubeAPI):
-                    video = await Video.getInfo(api_interface.get_track_id(url))
-                    return UniversalTrack(
-                        title=video["title"],
-                        artist_names=[video["channel"]["name"]],
-                        url=video["link"],
-                        cover_url=max(
-                            video["thumbnails"],
-                            key=lambda image: image.get("width", 0) * image.get("height", 0)
-                        )["url"]
-                    )
-                query = await api_interface.url_to_query(url)
-                tracks = await preferred_platform_interface.search_tracks(query)
-                return tracks[0]
-            return None
+            if (route := self.url_router.resolve(url, kind="track")) is None:
+                return None
+            # YouTube links are kept as they are, everything else is converted to the preferred platform
+            if isinstance(self.api_interfaces[route.platform], YoutubeAPI):
+                target_platform = route.platform
+            else:
+                target_platform = self.settings.preferred_platform.value
+            return await self.converter.convert(route.platform, route.id, target_platform)
 
         track = await get_standardised_track(track_url_to_add)
         del track_url_to_add
@@ -293,11 +778,13 @@ class PlatformConverter(helpers.PlatformAPICog):
             await ctx.reply("Invalid track URL.")
             return
 
-        result = self.db_cursor.execute(
-            # langauge=SQLite
-            "SELECT track_url, rejected FROM community_playlist WHERE track_url = ?",
-            (track.url,)
-        ).fetchone()
+        # Other releases and uploads of a track count as the same track
+        canonical_key = track.canonical_key
+        result = await self.database.fetchone(
+            # language=SQLite
+            "SELECT track_url, rejected FROM community_playlist WHERE track_url = ? OR canonical_key = ?",
+            (track.url, canonical_key)
+        )
         if result is not None:
             if result[1]:
                 await ctx.reply("That track has already been rejected.")
@@ -305,58 +792,103 @@ class PlatformConverter(helpers.PlatformAPICog):
             await ctx.reply("That track is already in the community playlist.")
             return
 
-        self.db_cursor.execute(
+        inserted = await self.database.execute(
             # language=SQLite
             (
-                "INSERT INTO community_playlist (track_url, addition_author_id, rejected)"
-                "VALUES (?, ?, ?)"
+                "INSERT OR IGNORE INTO community_playlist (track_url, addition_author_id, rejected, canonical_key)"
+                "VALUES (?, ?, ?, ?)"
             ),
             (
                 track.url,
                 ctx.author.id,
-                0 # false
+                0, # false
+                canonical_key
             )
         )
-        self.db_connection.commit()
+        if not inserted:
+            # Someone else added it while we were looking the track up
+            await ctx.reply("That track is already in the community playlist.")
+            return
 
+        self.invalidate_community_playlist_pages()
         await ctx.reply("Added to the community playlist!")
-        msg = await community_playlist_channel.send(
-            "New track added to the community playlist!",
-            embed=discord.Embed(
-                title=track.title.strip(),
-                url=track.url,
-                description=f"**Artist{'s' if len(track.artist_names) > 1 else ''}:** {', '.join(track.artist_names)}",
-                colour=discord.Colour.green()
-            ).set_thumbnail(
-                url=track.cover_url
-            ).set_footer(
-                text=f"Added by {ctx.author.display_name}",
-            )
+        embed = discord.Embed(
+            title=track.title.strip(),
+            url=track.url,
+            description=f"**Artist{'s' if len(track.artist_names) > 1 else ''}:** {', '.join(track.artist_names)}",
+            colour=discord.Colour.green()
+        ).set_thumbnail(
+            url=track.cover_url
+        ).set_footer(
+            text=f"Added by {ctx.author.display_name}",
         )
-        await msg.add_reaction("\N{WHITE HEAVY CHECK MARK}")
-        await msg.add_reaction("\N{NEGATIVE SQUARED CROSS MARK}")
+        msg = await community_playlist_channel.send("New track added to the community playlist!", embed=embed)
+        # Votes are tallied from the reaction events alone, which only carry the message id
+        await self.database.execute(
+            # language=SQLite
+            "INSERT INTO playlist_messages (message_id, track_url, embed) VALUES (?, ?, ?)",
+            (msg.id, track.url, json.dumps(embed.to_dict()))
+        )
+        await msg.add_reaction(APPROVE_EMOJI)
+        await msg.add_reaction(REJECT_EMOJI)
 
     @commands.hybrid_command()
     @app_commands.checks.cooldown(1, 10)
     async def community_playlist(self, ctx: commands.Context):
-        track_urls = self.db_cursor.execute(
-            # language=SQLite
-            "SELECT track_url FROM community_playlist WHERE rejected = 0"
-        ).fetchall()
-        if not track_urls:
+        page = await self.community_playlist_page(0, 0)
+        if page is None:
             await ctx.reply("The community playlist is empty.")
             return
-        track_urls = [track_url[0] for track_url in track_urls]
+        view = CommunityPlaylistView(self, author_id=ctx.author.id, page=page)
+        view.message = await ctx.reply(page.content, view=view, mention_author=False)
 
-        msg_content = "## Community playlist\n"
-        for i, track_url in enumerate(track_urls, start=1):
-            additions = f"{i}. <{track_url}>\n"
-            if len(msg_content) + len(additions) >= 2000:
-                await ctx.reply(msg_content, mention_author=False)
-                msg_content = ""
-            msg_content += additions
-        await ctx.reply(msg_content, mention_author=False)
+    async def community_playlist_page(self, after_rowid: int, index: int) -> "CommunityPlaylistPage | None":
+        """Renders the page of the community playlist starting after a rowid, or returns None if it's empty.
 
+        Pages are found by their first rowid rather than an offset, so that only the rows on the page are read.
+        They're cached until the playlist changes.
+        """
+        if (page := self._community_playlist_pages.get((after_rowid, index))) is not None:
+            return page
+        generation = self._community_playlist_generation
+
+        rows = await self.database.fetchall(
+            # language=SQLite
+            "SELECT rowid, track_url FROM community_playlist WHERE rejected = 0 AND rowid > ? ORDER BY rowid LIMIT ?",
+            (after_rowid, self.COMMUNITY_PLAYLIST_PAGE_SIZE + 1)
+        )
+        if not rows:
+            return None
+        if self._community_playlist_size is None:
+            self._community_playlist_size = (await self.database.fetchone(
+                # language=SQLite
+                "SELECT COUNT(*) FROM community_playlist WHERE rejected = 0"
+            ))[0]
+
+        # One more row than we show, so that we know whether there is a next page
+        has_next_page = len(rows) > self.COMMUNITY_PLAYLIST_PAGE_SIZE
+        rows = rows[:self.COMMUNITY_PLAYLIST_PAGE_SIZE]
+        page_count = max(1, math.ceil(self._community_playlist_size / self.COMMUNITY_PLAYLIST_PAGE_SIZE))
+        content = "## Community playlist\n" + "".join(
+            f"{i}. <{track_url}>\n"
+            for i, (_, track_url) in enumerate(rows, start=index * self.COMMUNITY_PLAYLIST_PAGE_SIZE + 1)
+        ) + f"-# Page {index + 1} of {max(page_count, index + 1)}"
+
+        page = CommunityPlaylistPage(
+            content=content,
+            index=index,
+            after_rowid=after_rowid,
+            next_after_rowid=rows[-1][0] if has_next_page else None,
+        )
+        # The playlist might have changed while this page was being read, in which case it's already outdated
+        if generation == self._community_playlist_generation:
+            self._community_playlist_pages[(after_rowid, index)] = page
+        return page
+
+    def invalidate_community_playlist_pages(self) -> None:
+        self._community_playlist_pages.clear()
+        self._community_playlist_size = None
+        self._community_playlist_generation += 1
 
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
@@ -369,62 +901,165 @@ class PlatformConverter(helpers.PlatformAPICog):
     async def handle_reactions(self, payload: discord.RawReactionActionEvent, add: bool):
         if payload.channel_id != int(self.settings.community_playlist_channel_id.value):
             return
-        if not (channel := self.bot.get_channel(payload.channel_id)):
+        if payload.emoji.name not in (APPROVE_EMOJI, REJECT_EMOJI):
             return
-        if not (message := await channel.fetch_message(payload.message_id)):
+        # The bot's own reactions are only there for people to click on, and don't count as votes
+        if self.bot.user is not None and payload.user_id == self.bot.user.id:
             return
-        if payload.emoji.name not in ["\N{WHITE HEAVY CHECK MARK}", "\N{NEGATIVE SQUARED CROSS MARK}"]:
+
+        column = "approvals" if payload.emoji.name == APPROVE_EMOJI else "rejections"
+        updated = await self.database.execute(
+            # language=SQLite
+            f"UPDATE playlist_messages SET {column} = {column} + ? WHERE message_id = ?",
+            (1 if add else -1, payload.message_id)
+        )
+        if not updated and not await self.track_legacy_playlist_message(payload.channel_id, payload.message_id):
             return
+        self.schedule_vote_evaluation(payload.channel_id, payload.message_id)
 
-        score = 0
+    async def track_legacy_playlist_message(self, channel_id: int, message_id: int) -> bool:
+        """Starts tracking the votes on a message sent before votes were tallied as they came in.
+
+        This is the only time the message has to be fetched, its reactions at that point are used as the initial tally.
+        Messages that turn out not to be playlist messages are remembered, so that votes on them are ignored right away.
+        """
+        if message_id in self._non_playlist_message_ids:
+            return False
+        if not (channel := self.bot.get_channel(channel_id)):
+            return False
+        try:
+            message = await channel.fetch_message(message_id)
+        except discord.NotFound:
+            message = None
+        if message is None or message.author != self.bot.user or not message.embeds or message.embeds[0].url is None:
+            self._non_playlist_message_ids[message_id] = None
+            while len(self._non_playlist_message_ids) > self.NON_PLAYLIST_MESSAGES_REMEMBERED:
+                self._non_playlist_message_ids.popitem(last=False)
+            return False
+
+        approvals = rejections = 0
         for reaction in message.reactions:
-            if reaction.emoji == "\N{WHITE HEAVY CHECK MARK}":
-                score += reaction.count
-            elif reaction.emoji == "\N{NEGATIVE SQUARED CROSS MARK}":
-                score -= reaction.count
-            else:
-                print(reaction.emoji)
-
-        message_embed = message.embeds[0]
-        def reconstruct_embed_with_colour(colour: discord.Colour) -> discord.Embed:
-            return discord.Embed(
-                title=message_embed.title,
-                url=message_embed.url,
-                description=message_embed.description,
-                colour=colour
-            ).set_thumbnail(
-                url=message_embed.thumbnail.url
-            ).set_footer(
-                text=message_embed.footer.text,
-                icon_url=message_embed.footer.icon_url
-            )
+            count = reaction.count - reaction.me
+            if reaction.emoji == APPROVE_EMOJI:
+                approvals = count
+            elif reaction.emoji == REJECT_EMOJI:
+                rejections = count
+        await self.database.execute(
+            # language=SQLite
+            "INSERT OR IGNORE INTO playlist_messages (message_id, track_url, approvals, rejections, embed) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (message_id, message.embeds[0].url, approvals, rejections, json.dumps(message.embeds[0].to_dict()))
+        )
+        return True
+
+    def schedule_vote_evaluation(self, channel_id: int, message_id: int) -> None:
+        # Votes arriving while an evaluation is already scheduled are picked up by it, so a burst of votes
+        # results in at most one edit
+        if message_id in self._pending_vote_evaluations:
+            return
+        self._pending_vote_evaluations[message_id] = asyncio.get_running_loop().call_later(
+            self.VOTE_EDIT_DELAY,
+            self._start_vote_evaluation,
+            channel_id,
+            message_id,
+        )
 
-        gets_denied_at_score = -2
+    def _start_vote_evaluation(self, channel_id: int, message_id: int) -> None:
+        del self._pending_vote_evaluations[message_id]
+        task = asyncio.create_task(self.evaluate_votes(channel_id, message_id))
+        self._vote_evaluation_tasks.add(task)
+        task.add_done_callback(self._vote_evaluation_tasks.discard)
 
-        if message_embed.colour != discord.Colour.red() and score <= gets_denied_at_score:
-            self.db_cursor.execute(
-                # language=SQLite
-                "UPDATE community_playlist SET rejected = 1 WHERE track_url = ?",
-                (message.embeds[0].url,)
-            )
-            self.db_connection.commit()
-            await message.edit(
-                content="This track has been rejected.",
-                embed=reconstruct_embed_with_colour(discord.Colour.red())
-            )
+    async def evaluate_votes(self, channel_id: int, message_id: int) -> None:
+        row = await self.database.fetchone(
+            # language=SQLite
+            "SELECT playlist_messages.track_url, approvals - rejections, embed, rejected "
+            "FROM playlist_messages JOIN community_playlist USING (track_url) "
+            "WHERE message_id = ?",
+            (message_id,)
+        )
+        if row is None:
             return
-        elif message_embed.colour == discord.Colour.red() and score > gets_denied_at_score:
-            self.db_cursor.execute(
-                # language=SQLite
-                "UPDATE community_playlist SET rejected = 0 WHERE track_url = ?",
-                (message.embeds[0].url,)
+        track_url, score, embed_data, rejected = row
+
+        if not rejected and score <= self.REJECTED_AT_SCORE:
+            rejected, content, colour = 1, "This track has been rejected.", discord.Colour.red()
+        elif rejected and score > self.REJECTED_AT_SCORE:
+            rejected, content, colour = 0, "This track has been re-accepted.", discord.Colour.green()
+        else:
+            return
+
+        await self.database.execute(
+            # language=SQLite
+            "UPDATE community_playlist SET rejected = ? WHERE track_url = ?",
+            (rejected, track_url)
+        )
+        self.invalidate_community_playlist_pages()
+        embed = discord.Embed.from_dict(json.loads(embed_data))
+        embed.colour = colour
+        try:
+            await self.bot.get_partial_messageable(channel_id).get_partial_message(message_id).edit(
+                content=content,
+                embed=embed,
             )
-            self.db_connection.commit()
-            await message.edit(
-                content="This track has been re-accepted.",
-                embed=reconstruct_embed_with_colour(discord.Colour.green())
+        except discord.HTTPException:
+            self.logger.exception(f"Could not update community playlist message {message_id}")
+
+    @commands.hybrid_command()
+    @commands.is_owner()
+    async def converter_stats(self, ctx: commands.Context):
+        """Shows how the converter has been performing since it was loaded"""
+        def format_seconds(seconds: float | None) -> str:
+            return f"{seconds * 1000:.0f}ms" if seconds is not None else "-"
+
+        embed = discord.Embed(title="Platform converter stats", colour=discord.Colour.blurple())
+
+        requests_by_platform: dict[str, dict[str, float]] = {}
+        for (platform, status), count in metrics.platform_requests.items():
+            requests_by_platform.setdefault(platform, {})[status] = count
+        platform_lines = []
+        for platform, statuses in sorted(requests_by_platform.items()):
+            total = sum(statuses.values())
+            failed = sum(count for status, count in statuses.items() if not status.startswith("2"))
+            platform_lines.append(
+                f"**{platform}:** {total:.0f} requests, {failed / total:.1%} failed,"
+                f" p50 {format_seconds(metrics.platform_request_duration.quantile(0.5, platform=platform))},"
+                f" p95 {format_seconds(metrics.platform_request_duration.quantile(0.95, platform=platform))}"
             )
-            return
+        embed.add_field(name="Platforms", value="\n".join(platform_lines) or "No requests yet", inline=False)
+
+        results = metrics.conversions.total_by("result")
+        total_conversions = sum(results.values())
+        embed.add_field(
+            name="Conversions",
+            value=(
+                f"{total_conversions:.0f} total, {results.get('converted', 0) / total_conversions:.1%} successful\n"
+                f"{results.get('not_found', 0):.0f} not found, {results.get('error', 0):.0f} errors\n"
+                f"{metrics.message_conversions_in_progress.value():.0f} messages in progress,"
+                f" {len(self.scheduler)} queued"
+            ) if total_conversions else "No conversions yet",
+            inline=False,
+        )
+
+        tiers = metrics.conversion_cache_lookups.total_by("tier")
+        total_lookups = sum(tiers.values())
+        embed.add_field(
+            name="Conversion cache",
+            value=(
+                f"{(tiers.get('memory', 0) + tiers.get('disk', 0)) / total_lookups:.1%} hit ratio"
+                f" ({tiers.get('memory', 0):.0f} memory, {tiers.get('disk', 0):.0f} disk,"
+                f" {tiers.get('miss', 0):.0f} misses)"
+            ) if total_lookups else "No lookups yet",
+            inline=False,
+        )
+
+        refreshes = metrics.token_refreshes.total_by("result")
+        embed.add_field(
+            name="Token refreshes",
+            value=f"{refreshes.get('ok', 0):.0f} successful, {refreshes.get('error', 0):.0f} failed",
+            inline=False,
+        )
+        await ctx.reply(embed=embed, ephemeral=True)
 
     async def cog_command_error(self, ctx: commands.Context, error: Exception) -> None:
         if isinstance(error, commands.MissingRequiredArgument):
@@ -1 +1,5 @@
-from . import platforms, abc, errors, helpers, types
+# helpers is left out since it needs the bot framework, so that everything else can be used without it
+from . import (
+    platforms, abc, batching, cache, catalog, coalescing, converter, covers, database, errors, hedging, http_client,
+    metrics, negative_cache, normalization, prefetch, ratelimit, routing, scheduler, types
+)
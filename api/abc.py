@@ -1,30 +1,104 @@
+import asyncio
+import contextlib
+import functools
+import logging
+import re
+import time
 from abc import abstractmethod, ABC
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterable
 from datetime import datetime, timedelta
+from typing import Any, NamedTuple
 
 import aiohttp
 
+from . import metrics
+from .coalescing import SingleFlight, coalesced
 from .errors import InvalidURLError
+from .normalization import canonical_key
+from .ratelimit import RateLimiter
 
+_logger = logging.getLogger(__name__)
+
+
+class UrlPattern(NamedTuple):
+    # What the URL points to, for example "track" or "playlist"
+    kind: str
+    # Lowercase hostnames the pattern applies to
+    hosts: tuple[str, ...]
+    # Matched against the path and query string of the URL, the first group being the id
+    path: re.Pattern
+
+
+class _Record:
+    """Base for the slotted, immutable records that platform data is converted to.
+
+    Records compare and hash by ``_identity()``.
+    """
+    __slots__ = ()
+
+    def _init(self, **fields: Any) -> None:
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+
+    def _identity(self) -> tuple:
+        raise NotImplementedError
+
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError(f"{type(self).__name__} is immutable, use replace() instead")
+
+    def __delattr__(self, name: str):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __eq__(self, other: object) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return self._identity() == other._identity()
+
+    def __hash__(self) -> int:
+        return hash(self._identity())
+
+
+class UniversalAlbum(_Record):
+    __slots__ = ("title", "artist_names", "url", "release_date", "cover_url")
 
-class UniversalAlbum:
     def __init__(
         self,
         *,
         title: str,
-        artist_names: list[str],
+        artist_names: Iterable[str],
         url: str,
-        release_date: datetime | None = None,
+        release_date: datetime | str | None = None,
         cover_url: str | None = None,
     ):
-        self.title = title
-        self.artist_names = artist_names
-        self.url = url
-        self.cover_url = cover_url
-        self.release_date = release_date
+        self._init(
+            title=title,
+            artist_names=tuple(artist_names),
+            url=url,
+            release_date=release_date,
+            cover_url=cover_url,
+        )
+
+    def _identity(self) -> tuple:
+        return self.url, self.title, self.artist_names
 
     def __str__(self):
         return f"{self.title} by {', '.join(self.artist_names)}"
 
+    def to_dict(self) -> dict:
+        return {
+            "title": self.title,
+            "artist_names": list(self.artist_names),
+            "url": self.url,
+            "cover_url": self.cover_url,
+            "release_date": (
+                self.release_date.isoformat() if isinstance(self.release_date, datetime) else self.release_date
+            ),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "UniversalAlbum":
+        return cls(**data)
+
     def __repr__(self):
         return (
             f"<UniversalAlbum"
@@ -37,25 +111,78 @@ class UniversalAlbum:
         )
 
 
-class UniversalTrack:
+class UniversalTrack(_Record):
+    __slots__ = ("title", "artist_names", "url", "cover_url", "album", "isrc", "duration_ms")
+
     def __init__(
         self,
         *,
         title: str,
-        artist_names: list[str],
+        artist_names: Iterable[str],
         url: str,
         cover_url: str | None = None,
         album: UniversalAlbum | None = None,
+        isrc: str | None = None,
+        duration_ms: int | None = None,
     ):
-        self.title = title
-        self.artist_names = artist_names
-        self.url = url
-        self.album = album
-        self.cover_url = cover_url
+        self._init(
+            title=title,
+            artist_names=tuple(artist_names),
+            url=url,
+            # International Standard Recording Code, which identifies a recording across platforms
+            isrc=isrc.upper() if isrc else None,
+            duration_ms=duration_ms,
+            cover_url=cover_url,
+            album=album,
+        )
+
+    @property
+    def canonical_key(self) -> str:
+        """A key shared by other releases and uploads of the same track, see :func:`normalization.canonical_key`."""
+        return canonical_key(self)
+
+    def _identity(self) -> tuple:
+        return self.url, self.title, self.artist_names
+
+    def replace(self, **changes: Any) -> "UniversalTrack":
+        """Returns a copy of the track with some fields changed."""
+        fields = {
+            "title": self.title,
+            "artist_names": self.artist_names,
+            "url": self.url,
+            "cover_url": self.cover_url,
+            "album": self.album,
+            "isrc": self.isrc,
+            "duration_ms": self.duration_ms,
+        }
+        return UniversalTrack(**(fields | changes))
 
     def __str__(self):
         return f"{self.title} by {', '.join(self.artist_names)}"
 
+    def to_dict(self) -> dict:
+        return {
+            "title": self.title,
+            "artist_names": list(self.artist_names),
+            "url": self.url,
+            "cover_url": self.cover_url,
+            "album": self.album.to_dict() if self.album else None,
+            "isrc": self.isrc,
+            "duration_ms": self.duration_ms,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "UniversalTrack":
+        return cls(
+            title=data["title"],
+            artist_names=data["artist_names"],
+            url=data["url"],
+            cover_url=data.get("cover_url"),
+            album=UniversalAlbum.from_dict(album) if (album := data.get("album")) else None,
+            isrc=data.get("isrc"),
+            duration_ms=data.get("duration_ms"),
+        )
+
     def __repr__(self):
         return (
             f"<UniversalTrack"
@@ -64,30 +191,124 @@ class UniversalTrack:
             f" url={self.url!r}"
             f" album={self.album!r}"
             f" cover_url={self.cover_url!r}"
+            f" isrc={self.isrc!r}"
+            f" duration_ms={self.duration_ms!r}"
             f">"
         )
 
 
-class UniversalPlaylist:
+class PlaylistTracks:
+    """The tracks of a playlist, fetched a page at a time as they are iterated over.
+
+    ``fetch_page`` is called with the index of the page to fetch, and returns ``None`` once there are no more pages.
+    When the number of pages is known up front, up to ``max_prefetch`` pages ahead of the one being read are
+    fetched concurrently, otherwise pages are fetched one after another.
+    Fetched pages are kept, so iterating over the tracks again doesn't make any more requests.
+    """
+
+    def __init__(
+        self,
+        fetch_page: Callable[[int], Awaitable[list[UniversalTrack] | None]] | None = None,
+        *,
+        first_page: list[UniversalTrack],
+        total: int | None = None,
+        page_count: int | None = None,
+        max_prefetch: int = 4,
+    ):
+        self.fetch_page = fetch_page
+        self.total = total
+        self.page_count = page_count if fetch_page else 1
+        self.max_prefetch = max(1, max_prefetch)
+
+        self._pages: dict[int, list[UniversalTrack] | None] = {0: first_page}
+        self._fetches: dict[int, asyncio.Task] = {}
+
+    @classmethod
+    def from_list(cls, tracks: list[UniversalTrack]) -> "PlaylistTracks":
+        return cls(first_page=tracks, total=len(tracks))
+
+    def __aiter__(self) -> AsyncIterator[UniversalTrack]:
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[UniversalTrack]:
+        index = 0
+        while (page := await self._get_page(index)) is not None:
+            for track in page:
+                yield track
+            index += 1
+
+    async def _get_page(self, index: int) -> list[UniversalTrack] | None:
+        if index in self._pages:
+            return self._pages[index]
+        if self.page_count is not None and index >= self.page_count:
+            return None
+
+        if self.page_count is None:
+            # Without knowing how many pages there are, the next page can only be fetched once we have this one
+            to_fetch = (index,)
+        else:
+            to_fetch = range(index, min(index + self.max_prefetch, self.page_count))
+        for fetch_index in to_fetch:
+            if fetch_index not in self._pages and fetch_index not in self._fetches:
+                task = self._fetches[fetch_index] = asyncio.create_task(self._fetch_page(fetch_index))
+                task.add_done_callback(functools.partial(self._forget_fetch, fetch_index))
+        return await asyncio.shield(self._fetches[index])
+
+    async def _fetch_page(self, index: int) -> list[UniversalTrack] | None:
+        page = self._pages[index] = await self.fetch_page(index)
+        return page
+
+    def _forget_fetch(self, index: int, task: asyncio.Task) -> None:
+        del self._fetches[index]
+        if not task.cancelled():
+            # Failed pages are fetched again next time, mark the exception as retrieved in case nobody awaited it
+            task.exception()
+
+    async def take(self, count: int) -> list[UniversalTrack]:
+        """Returns up to ``count`` tracks, fetching no more pages than needed."""
+        tracks = []
+        if count <= 0:
+            return tracks
+        async for track in self:
+            tracks.append(track)
+            if len(tracks) >= count:
+                break
+        return tracks
+
+    async def to_list(self) -> list[UniversalTrack]:
+        return [track async for track in self]
+
+    def __repr__(self):
+        return f"<PlaylistTracks total={self.total!r} fetched_pages={len(self._pages)!r}>"
+
+
+class UniversalPlaylist(_Record):
+    __slots__ = ("name", "description", "owner_names", "url", "tracks", "cover_url")
+
     def __init__(
         self,
         *,
         name: str,
         description: str | None,
-        owner_names: list[str] | None,
+        owner_names: Iterable[str] | None,
         url: str,
-        tracks: list[UniversalTrack],
+        tracks: PlaylistTracks | list[UniversalTrack],
         cover_url: str | None = None,
     ):
-        self.name = name
-        self.description = description
-        self.owner_names = owner_names
-        self.url = url
-        self.tracks = tracks
-        self.cover_url = cover_url
+        self._init(
+            name=name,
+            description=description,
+            owner_names=tuple(owner_names) if owner_names is not None else None,
+            url=url,
+            tracks=tracks if isinstance(tracks, PlaylistTracks) else PlaylistTracks.from_list(tracks),
+            cover_url=cover_url,
+        )
+
+    def _identity(self) -> tuple:
+        return self.url, self.name
 
     def __str__(self):
-        return f"Playlist {self.name} by {', '.join(self.owner_names)}"
+        return f"Playlist {self.name} by {', '.join(self.owner_names or ())}"
 
     def __repr__(self):
         return (
@@ -102,8 +323,58 @@ class UniversalPlaylist:
 
 
 class AbstractAPI(ABC):
-    def __init__(self, *, session: aiohttp.ClientSession):
+    # Concurrent calls to these with the same arguments share a single request
+    COALESCED_METHODS = ("track_from_id", "track_from_isrc", "search_tracks", "get_playlist_content")
+    # Used by the URL router to map URLs to this platform without going through get_track_id
+    URL_PATTERNS: tuple[UrlPattern, ...] = ()
+    # Requests per second and burst size of the token bucket shared by every request to this platform
+    RATE_LIMIT: tuple[float, int] = (10, 10)
+    # Platforms sharing a backend should share a bucket, by default each platform gets its own
+    RATE_LIMIT_KEY: str | None = None
+
+    def __init__(self, *, session: aiohttp.ClientSession, rate_limiter: RateLimiter | None = None):
         self.session = session
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self._rate_limit_bucket = self.rate_limiter.bucket(
+            self.rate_limit_key,
+            rate=self.RATE_LIMIT[0],
+            capacity=self.RATE_LIMIT[1],
+        )
+        self._single_flight = SingleFlight()
+
+    @property
+    def rate_limit_key(self) -> str:
+        """The name of the backend serving this platform, shared by every platform it serves."""
+        return self.RATE_LIMIT_KEY or type(self).__name__
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for method_name in cls.COALESCED_METHODS:
+            method = cls.__dict__.get(method_name)
+            if method is None or getattr(method, "__isabstractmethod__", False):
+                continue
+            if not getattr(method, "__coalesced__", False):
+                setattr(cls, method_name, coalesced(method))
+
+    @contextlib.asynccontextmanager
+    async def request(self, method: str, url: str, **kwargs) -> AsyncIterator[aiohttp.ClientResponse]:
+        """Makes a rate limited request through the shared session, to be used like ``session.request``."""
+        platform = type(self).__name__
+        started_at = time.perf_counter()
+        responded = False
+        try:
+            async with self.rate_limiter.request(
+                self.session, self._rate_limit_bucket, method, url, **kwargs
+            ) as response:
+                responded = True
+                metrics.platform_request_duration.observe(time.perf_counter() - started_at, platform=platform)
+                metrics.platform_requests.inc(platform=platform, status=response.status)
+                yield response
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            # Errors raised while the caller handles the response are already counted under its status
+            if not responded:
+                metrics.platform_requests.inc(platform=platform, status="error")
+            raise
 
     def is_valid_track_url(self, track_url: str, /) -> bool:
         try:
@@ -121,28 +392,141 @@ class AbstractAPI(ABC):
     async def track_from_id(self, track_id: str) -> UniversalTrack | None:
         raise NotImplementedError
 
+    async def tracks_from_ids(self, track_ids: list[str]) -> list[UniversalTrack | None]:
+        """Looks up several tracks at once, returning them in the same order as the ids.
+
+        Platforms with an endpoint for fetching several tracks in one request should override this,
+        by default each track is looked up on its own.
+        """
+        return list(await asyncio.gather(*map(self.track_from_id, track_ids)))
+
     @abstractmethod
     async def search_tracks(self, query: str) -> list[UniversalTrack] | None:
         raise NotImplementedError
 
+    # Whether track_from_isrc is supported, which is much more precise than a text search
+    SUPPORTS_ISRC_LOOKUP = False
+
+    async def track_from_isrc(self, isrc: str) -> UniversalTrack | None:
+        raise NotImplementedError
+
+    def is_equivalent_to(self, other: "AbstractAPI") -> bool:
+        """Whether another platform has the same tracks as this one, so that its tracks can be adopted by this one."""
+        return False
+
+    def adopt_track(self, track: UniversalTrack) -> UniversalTrack:
+        """Turns a track from an equivalent platform into one on this platform."""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        """Stops any background work, such as batches waiting to be sent. The session is closed by its owner."""
+
 
 class AbstractOAuthAPI(AbstractAPI, ABC):
-    def __init__(self, *, client_id: str, client_secret: str, session: aiohttp.ClientSession):
-        super().__init__(session=session)
+    """A platform which needs an access token for its requests.
+
+    Tokens are fetched when they are first needed, rather than up front. Once a token gets close to expiring it's
+    refreshed in the background while requests keep using it, and a request rejected with a 401 refreshes the token
+    and is retried once. Concurrent refreshes share a single request for a new token.
+    """
+    # Tokens expiring within this long are refreshed in the background
+    TOKEN_REFRESH_MARGIN = timedelta(minutes=15)
+
+    def __init__(
+        self,
+        *,
+        client_id: str,
+        client_secret: str,
+        session: aiohttp.ClientSession,
+        rate_limiter: RateLimiter | None = None,
+    ):
+        super().__init__(session=session, rate_limiter=rate_limiter)
         self.client_id = client_id
         self.client_secret = client_secret
         self._token: str | None = None
         self._token_expires_at: datetime | None = None
+        self._background_refresh: asyncio.Task | None = None
 
     @property
     def should_update_token(self) -> bool:
-        leniency = timedelta(minutes=15)
-        return self._token_expires_at is None or self._token_expires_at < datetime.now() + leniency
+        return self._token_expires_at is None or self._token_expires_at < datetime.now() + self.TOKEN_REFRESH_MARGIN
+
+    @property
+    def has_valid_token(self) -> bool:
+        if self._token is None or self._token_expires_at is None:
+            return False
+        return self._token_expires_at > datetime.now()
+
+    async def access_token(self) -> str:
+        """Returns a token which can be used right away, only waiting on a refresh if there isn't one."""
+        if not self.has_valid_token:
+            return await self.refresh_access_token()
+        if self.should_update_token and (self._background_refresh is None or self._background_refresh.done()):
+            self._background_refresh = asyncio.create_task(self.refresh_access_token())
+            self._background_refresh.add_done_callback(self._log_background_refresh_error)
+        return self._token
+
+    async def close(self) -> None:
+        if self._background_refresh is not None:
+            self._background_refresh.cancel()
+            await asyncio.gather(self._background_refresh, return_exceptions=True)
+            self._background_refresh = None
+        await super().close()
+
+    def _log_background_refresh_error(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and (error := task.exception()) is not None:
+            _logger.error(f"Refreshing the {type(self).__name__} access token failed", exc_info=error)
+
+    async def refresh_access_token(self, *, rejected_token: str | None = None) -> str:
+        """Gets a new access token, sharing the request with any other refresh already in progress.
+
+        If the refresh was prompted by a token being rejected, ``rejected_token`` should be that token, so that
+        nothing is refreshed if it has already been replaced in the meantime.
+        """
+        if rejected_token is not None and self._token != rejected_token and self.has_valid_token:
+            return self._token
+        return await self._single_flight.run("access_token", self._refresh_access_token)
+
+    async def _refresh_access_token(self) -> str:
+        platform = type(self).__name__
+        try:
+            token, expires_in = await self.fetch_access_token()
+        except Exception:
+            metrics.token_refreshes.inc(platform=platform, result="error")
+            raise
+        metrics.token_refreshes.inc(platform=platform, result="ok")
+        self._token = token
+        self._token_expires_at = datetime.now() + timedelta(seconds=expires_in)
+        return token
 
     @abstractmethod
-    async def refresh_access_token(self):
+    async def fetch_access_token(self) -> tuple[str, float]:
+        """Requests a new access token, returning it along with how many seconds it's valid for."""
         raise NotImplementedError
 
+    @contextlib.asynccontextmanager
+    async def authorized_request(
+        self,
+        method: str,
+        url: str,
+        *,
+        headers: dict[str, str] | None = None,
+        **kwargs,
+    ) -> AsyncIterator[aiohttp.ClientResponse]:
+        """Like ``request``, but with the access token added. Requests rejected with a 401 are retried once."""
+        token = await self.access_token()
+        for attempt in range(2):
+            async with self.request(
+                method,
+                url,
+                headers={**(headers or {}), "Authorization": f"Bearer {token}"},
+                **kwargs
+            ) as response:
+                if response.status != 401 or attempt > 0:
+                    yield response
+                    return
+            token = await self.refresh_access_token(rejected_token=token)
+
 
 class AbstractPlaylistAPI(ABC):
     async def is_valid_playlist_url(self, playlist_url: str, /) -> bool:
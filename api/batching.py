@@ -0,0 +1,102 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable, Iterable, Sequence
+from typing import Generic, TypeVar
+
+from .ratelimit import Priority, request_priority
+
+__all__ = [
+    "MicroBatcher",
+]
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class MicroBatcher(Generic[K, V]):
+    """Merges single lookups that arrive close together into batched calls.
+
+    Items submitted within ``window`` seconds of the first one are passed to ``function`` together, which has to
+    return one result per item, in the same order. A batch is sent off early once it reaches ``max_size`` items.
+    Each batch is sent at the highest priority of the lookups in it, so a prefetch can't hold up anyone it's batched
+    with.
+    """
+
+    def __init__(
+        self,
+        function: Callable[[list[K]], Awaitable[Sequence[V]]],
+        *,
+        window: float = 0.01,
+        max_size: int = 50,
+    ):
+        self.function = function
+        self.window = window
+        self.max_size = max_size
+
+        self._pending: dict[K, asyncio.Future] = {}
+        self._pending_priority = Priority.PREFETCH
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(self, item: K) -> V:
+        self._pending_priority = min(self._pending_priority, request_priority.get())
+        if (future := self._pending.get(item)) is None:
+            future = self._pending[item] = asyncio.get_running_loop().create_future()
+            if len(self._pending) >= self.max_size:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        priority, self._pending_priority = self._pending_priority, Priority.PREFETCH
+        if not batch:
+            return
+        task = asyncio.create_task(self._run_batch(batch, priority))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: dict[K, asyncio.Future], priority: Priority) -> None:
+        request_priority.set(priority)
+        try:
+            results = list(await self.function(list(batch)))
+        except asyncio.CancelledError:
+            for future in batch.values():
+                future.cancel()
+            raise
+        except Exception as error:
+            self._fail(batch.values(), error)
+            return
+
+        futures = list(batch.values())
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
+        if len(results) < len(futures):
+            self._fail(futures[len(results):], RuntimeError(
+                f"Expected {len(futures)} results from the batch, but only got {len(results)}"
+            ))
+
+    @staticmethod
+    def _fail(futures: Iterable[asyncio.Future], error: Exception) -> None:
+        for future in futures:
+            if not future.done():
+                future.set_exception(error)
+                # Marks the exception as retrieved in case every caller has already given up
+                future.exception()
+
+    async def close(self) -> None:
+        """Cancels every batch, including the one still being gathered."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        for future in self._pending.values():
+            future.cancel()
+        self._pending = {}
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
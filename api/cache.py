@@ -0,0 +1,205 @@
+import json
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from . import metrics
+from .abc import UniversalTrack
+from .database import AsyncDatabase
+
+__all__ = [
+    "ConversionKey",
+    "ConversionCache",
+]
+
+# (source platform, source track id, target platform)
+ConversionKey = tuple[str, str, str]
+# Share the in-memory LRU with conversions, told apart by the first element
+_ISRC_KEY_PREFIX = "\0isrc"
+_CANONICAL_KEY_PREFIX = "\0canonical"
+
+CONVERSION_CACHE_MIGRATIONS = (
+    # language=SQLite
+    "CREATE TABLE IF NOT EXISTS conversions ("
+    "    source_platform TEXT NOT NULL,"
+    "    track_id TEXT NOT NULL,"
+    "    target_platform TEXT NOT NULL,"
+    "    track TEXT NOT NULL,"
+    "    expires_at REAL NOT NULL,"
+    "    PRIMARY KEY (source_platform, track_id, target_platform)"
+    ")",
+    # language=SQLite
+    "CREATE TABLE IF NOT EXISTS isrc_index ("
+    "    isrc TEXT NOT NULL,"
+    "    platform TEXT NOT NULL,"
+    "    track TEXT NOT NULL,"
+    "    expires_at REAL NOT NULL,"
+    "    PRIMARY KEY (isrc, platform)"
+    ")",
+    # language=SQLite
+    "CREATE TABLE IF NOT EXISTS canonical_key_index ("
+    "    canonical_key TEXT NOT NULL,"
+    "    platform TEXT NOT NULL,"
+    "    track TEXT NOT NULL,"
+    "    expires_at REAL NOT NULL,"
+    "    PRIMARY KEY (canonical_key, platform)"
+    ")",
+)
+
+
+# noinspection SqlResolve
+class ConversionCache:
+    """Two-tier cache of track conversions.
+
+    A bounded in-memory LRU sits in front of an SQLite table, so that a track which has already been converted
+    once can be answered again without any requests to the platforms involved.
+    It also keeps indexes of which track an ISRC or a canonical key resolved to on each platform, which lets a track
+    that was reached through a different link, platform or release be converted without a search.
+    """
+
+    def __init__(
+        self,
+        database_path: Path,
+        *,
+        memory_size: int = 1024,
+        memory_ttl: float = 60 * 60,
+        disk_ttl: float = 60 * 60 * 24 * 7,
+    ):
+        self.memory_size = memory_size
+        self.memory_ttl = memory_ttl
+        self.disk_ttl = disk_ttl
+        self._memory: OrderedDict[ConversionKey, tuple[float, UniversalTrack]] = OrderedDict()
+
+        self.database = AsyncDatabase(database_path, migrations=CONVERSION_CACHE_MIGRATIONS)
+
+    async def connect(self) -> None:
+        await self.database.connect()
+        await self.database.execute(
+            # language=SQLite
+            "DELETE FROM conversions WHERE expires_at < ?",
+            (time.time(),)
+        )
+        await self.database.execute(
+            # language=SQLite
+            "DELETE FROM isrc_index WHERE expires_at < ?",
+            (time.time(),)
+        )
+        await self.database.execute(
+            # language=SQLite
+            "DELETE FROM canonical_key_index WHERE expires_at < ?",
+            (time.time(),)
+        )
+
+    def _get_from_memory(self, key: ConversionKey) -> UniversalTrack | None:
+        if (entry := self._memory.get(key)) is None:
+            return None
+        expires_at, track = entry
+        if expires_at < time.monotonic():
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return track
+
+    def _set_in_memory(self, key: ConversionKey, track: UniversalTrack) -> None:
+        if self.memory_size <= 0:
+            return
+        self._memory[key] = (time.monotonic() + self.memory_ttl, track)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    async def get(self, source_platform: str, track_id: str, target_platform: str) -> UniversalTrack | None:
+        key = (source_platform, track_id, target_platform)
+        if (track := self._get_from_memory(key)) is not None:
+            metrics.conversion_cache_lookups.inc(tier="memory")
+            return track
+
+        row = await self.database.fetchone(
+            # language=SQLite
+            "SELECT track FROM conversions "
+            "WHERE source_platform = ? AND track_id = ? AND target_platform = ? AND expires_at >= ?",
+            (*key, time.time())
+        )
+        if row is None:
+            metrics.conversion_cache_lookups.inc(tier="miss")
+            return None
+        metrics.conversion_cache_lookups.inc(tier="disk")
+
+        track = UniversalTrack.from_dict(json.loads(row[0]))
+        self._set_in_memory(key, track)
+        return track
+
+    async def set(self, source_platform: str, track_id: str, target_platform: str, track: UniversalTrack) -> None:
+        key = (source_platform, track_id, target_platform)
+        self._set_in_memory(key, track)
+        if self.disk_ttl <= 0:
+            return
+
+        # Nobody needs to wait for the write to hit the disk, as it's already in memory
+        self.database.queue(
+            # language=SQLite
+            "INSERT OR REPLACE INTO conversions (source_platform, track_id, target_platform, track, expires_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (*key, json.dumps(track.to_dict()), time.time() + self.disk_ttl)
+        )
+
+    async def get_by_isrc(self, isrc: str, platform: str) -> UniversalTrack | None:
+        key = (_ISRC_KEY_PREFIX, isrc, platform)
+        if (track := self._get_from_memory(key)) is not None:
+            return track
+
+        row = await self.database.fetchone(
+            # language=SQLite
+            "SELECT track FROM isrc_index WHERE isrc = ? AND platform = ? AND expires_at >= ?",
+            (isrc, platform, time.time())
+        )
+        if row is None:
+            return None
+
+        track = UniversalTrack.from_dict(json.loads(row[0]))
+        self._set_in_memory(key, track)
+        return track
+
+    async def set_by_isrc(self, isrc: str, platform: str, track: UniversalTrack) -> None:
+        self._set_in_memory((_ISRC_KEY_PREFIX, isrc, platform), track)
+        if self.disk_ttl <= 0:
+            return
+
+        self.database.queue(
+            # language=SQLite
+            "INSERT OR REPLACE INTO isrc_index (isrc, platform, track, expires_at) VALUES (?, ?, ?, ?)",
+            (isrc, platform, json.dumps(track.to_dict()), time.time() + self.disk_ttl)
+        )
+
+    async def get_by_canonical_key(self, canonical_key: str, platform: str) -> UniversalTrack | None:
+        key = (_CANONICAL_KEY_PREFIX, canonical_key, platform)
+        if (track := self._get_from_memory(key)) is not None:
+            return track
+
+        row = await self.database.fetchone(
+            # language=SQLite
+            "SELECT track FROM canonical_key_index WHERE canonical_key = ? AND platform = ? AND expires_at >= ?",
+            (canonical_key, platform, time.time())
+        )
+        if row is None:
+            return None
+
+        track = UniversalTrack.from_dict(json.loads(row[0]))
+        self._set_in_memory(key, track)
+        return track
+
+    async def set_by_canonical_key(self, canonical_key: str, platform: str, track: UniversalTrack) -> None:
+        self._set_in_memory((_CANONICAL_KEY_PREFIX, canonical_key, platform), track)
+        if self.disk_ttl <= 0:
+            return
+
+        self.database.queue(
+            # language=SQLite
+            "INSERT OR REPLACE INTO canonical_key_index (canonical_key, platform, track, expires_at) "
+            "VALUES (?, ?, ?, ?)",
+            (canonical_key, platform, json.dumps(track.to_dict()), time.time() + self.disk_ttl)
+        )
+
+    async def close(self) -> None:
+        self._memory.clear()
+        await self.database.close()
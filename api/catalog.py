@@ -0,0 +1,300 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from pathlib import Path
+
+from . import metrics
+from .abc import UniversalTrack
+from .database import AsyncDatabase
+from .errors import InvalidURLError
+from .normalization import fold
+from .ratelimit import Priority, request_priority
+from .types import APIInterface
+
+__all__ = [
+    "TrackCatalog",
+]
+
+_logger = logging.getLogger(__name__)
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+CATALOG_MIGRATIONS = (
+    # language=SQLite
+    "CREATE TABLE IF NOT EXISTS catalog_tracks ("
+    "    platform TEXT NOT NULL,"
+    "    url TEXT NOT NULL,"
+    "    title TEXT NOT NULL,"
+    "    artists TEXT NOT NULL,"
+    # The last search query that resolved to the track, so that it's found by the same query next time
+    "    query TEXT NOT NULL DEFAULT '',"
+    "    track TEXT NOT NULL,"
+    "    last_seen REAL NOT NULL,"
+    "    refreshed_at REAL NOT NULL,"
+    "    PRIMARY KEY (platform, url)"
+    ");"
+    "CREATE INDEX IF NOT EXISTS catalog_tracks_last_seen ON catalog_tracks (last_seen);"
+    "CREATE INDEX IF NOT EXISTS catalog_tracks_refreshed_at ON catalog_tracks (refreshed_at)",
+    # language=SQLite
+    # Its rowids are the ids of catalog_tracks, kept in sync by hand since triggers can't be split into statements
+    "CREATE VIRTUAL TABLE IF NOT EXISTS catalog_search USING fts5("
+    "    title, artists, query, tokenize = 'unicode61 remove_diacritics 2'"
+    ")",
+    # language=SQLite
+    # The implicit rowid of a table with a composite primary key can change when it's vacuumed, which would leave the
+    # search index pointing at the wrong tracks, so it's made an explicit column, keeping the rowids already in use
+    "CREATE TABLE catalog_tracks_new ("
+    "    id INTEGER PRIMARY KEY,"
+    "    platform TEXT NOT NULL,"
+    "    url TEXT NOT NULL,"
+    "    title TEXT NOT NULL,"
+    "    artists TEXT NOT NULL,"
+    "    query TEXT NOT NULL DEFAULT '',"
+    "    track TEXT NOT NULL,"
+    "    last_seen REAL NOT NULL,"
+    "    refreshed_at REAL NOT NULL,"
+    "    UNIQUE (platform, url)"
+    ");"
+    "INSERT INTO catalog_tracks_new (id, platform, url, title, artists, query, track, last_seen, refreshed_at) "
+    "SELECT rowid, platform, url, title, artists, query, track, last_seen, refreshed_at FROM catalog_tracks;"
+    "DROP TABLE catalog_tracks;"
+    "ALTER TABLE catalog_tracks_new RENAME TO catalog_tracks;"
+    "CREATE INDEX IF NOT EXISTS catalog_tracks_last_seen ON catalog_tracks (last_seen);"
+    "CREATE INDEX IF NOT EXISTS catalog_tracks_refreshed_at ON catalog_tracks (refreshed_at)",
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """Splits text into lowercase words without diacritics, close to how the full text index does it."""
+    return _TOKEN_PATTERN.findall(fold(text))
+
+
+def similarity(first: str, second: str) -> float:
+    """How much two pieces of text share the same words, from 0 to 1."""
+    first_tokens, second_tokens = set(tokenize(first)), set(tokenize(second))
+    if not first_tokens or not second_tokens:
+        return 0.0
+    return len(first_tokens & second_tokens) / len(first_tokens | second_tokens)
+
+
+# noinspection SqlResolve
+class TrackCatalog:
+    """A local, full text searchable catalog of every track that has been resolved on any platform.
+
+    Searches are answered from the catalog when one of its tracks is a close enough match for the query, so that
+    popular tracks don't need a request to the platform every time someone looks for them.
+    The catalog only keeps the ``max_tracks`` most recently seen tracks, and tracks that haven't been looked up
+    for ``refresh_after`` seconds are fetched again in the background, dropping those which no longer exist.
+    """
+
+    # How often stale tracks are refreshed and the catalog is trimmed down to size, in seconds
+    MAINTENANCE_INTERVAL = 10 * 60
+    # The most tracks refreshed at each maintenance
+    REFRESH_BATCH_SIZE = 50
+    # The most tracks the full text index is asked for before they're scored
+    CANDIDATE_COUNT = 20
+
+    def __init__(
+        self,
+        database_path: Path,
+        api_interfaces: dict[str, APIInterface],
+        *,
+        max_tracks: int = 50_000,
+        refresh_after: float = 60 * 60 * 24 * 7,
+        min_confidence: float = 0.9,
+    ):
+        self.api_interfaces = api_interfaces
+        self.max_tracks = max_tracks
+        self.refresh_after = refresh_after
+        self.min_confidence = min_confidence
+
+        self.database = AsyncDatabase(database_path, migrations=CATALOG_MIGRATIONS)
+        self._maintenance_task: asyncio.Task | None = None
+
+    async def connect(self) -> None:
+        await self.database.connect()
+        self._maintenance_task = asyncio.create_task(self._maintain())
+
+    async def add(self, platform: str, track: UniversalTrack, *, query: str | None = None) -> None:
+        """Adds a track to the catalog, or marks it as recently seen if it's already in it."""
+        now = time.time()
+        # Both writes end up in the same batch, so the search index can't fall behind the tracks table
+        self.database.queue(
+            # language=SQLite
+            "INSERT INTO catalog_tracks (platform, url, title, artists, query, track, last_seen, refreshed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (platform, url) DO UPDATE SET "
+            "    title = excluded.title,"
+            "    artists = excluded.artists,"
+            "    query = CASE WHEN ? IS NULL THEN query ELSE excluded.query END,"
+            "    track = excluded.track,"
+            "    last_seen = excluded.last_seen,"
+            "    refreshed_at = excluded.refreshed_at",
+            (
+                platform,
+                track.url,
+                track.title,
+                " ".join(track.artist_names),
+                query or "",
+                json.dumps(track.to_dict()),
+                now,
+                now,
+                query,
+            )
+        )
+        self._queue_search_index_update(platform, track.url)
+
+    def _queue_search_index_update(self, platform: str, url: str) -> None:
+        self.database.queue(
+            # language=SQLite
+            "INSERT OR REPLACE INTO catalog_search (rowid, title, artists, query) "
+            "SELECT id, title, artists, query FROM catalog_tracks WHERE platform = ? AND url = ?",
+            (platform, url)
+        )
+
+    async def search(self, platform: str, query: str, *, limit: int = 1) -> list[UniversalTrack]:
+        """Returns up to ``limit`` tracks on a platform that confidently match a search query, best first."""
+        if not (tokens := tokenize(query)):
+            metrics.catalog_lookups.inc(platform=platform, result="miss")
+            return []
+        # Every word has to appear either in the title and artists, or in a query that previously found the track
+        words = " AND ".join(f'"{token}"' for token in dict.fromkeys(tokens))
+        rows = await self.database.fetchall(
+            # language=SQLite
+            "SELECT catalog_tracks.id, catalog_tracks.title, catalog_tracks.artists, catalog_tracks.query, track "
+            "FROM catalog_search JOIN catalog_tracks ON catalog_tracks.id = catalog_search.rowid "
+            "WHERE catalog_search MATCH ? AND platform = ? "
+            "ORDER BY bm25(catalog_search) LIMIT ?",
+            (f"({{title artists}} : ({words})) OR (query : ({words}))", platform, self.CANDIDATE_COUNT)
+        )
+
+        scored = []
+        for track_id, title, artists, previous_query, track_data in rows:
+            confidence = max(similarity(query, f"{title} {artists}"), similarity(query, previous_query))
+            if confidence >= self.min_confidence:
+                scored.append((confidence, track_id, track_data))
+        scored.sort(key=lambda entry: entry[0], reverse=True)
+        scored = scored[:limit]
+        metrics.catalog_lookups.inc(platform=platform, result="hit" if len(scored) >= limit else "miss")
+        if not scored:
+            return []
+
+        self.database.queue(
+            # language=SQLite
+            f"UPDATE catalog_tracks SET last_seen = ? WHERE id IN ({', '.join('?' * len(scored))})",
+            (time.time(), *(track_id for _, track_id, _ in scored))
+        )
+        return [UniversalTrack.from_dict(json.loads(track_data)) for _, _, track_data in scored]
+
+    async def find(self, platform: str, query: str) -> UniversalTrack | None:
+        """Returns the track on a platform that most confidently matches a search query, if any do."""
+        tracks = await self.search(platform, query, limit=1)
+        return tracks[0] if tracks else None
+
+    async def _maintain(self) -> None:
+        while True:
+            await asyncio.sleep(self.MAINTENANCE_INTERVAL)
+            try:
+                await self.trim()
+                await self.refresh_stale()
+            except Exception:
+                _logger.exception("Could not maintain the track catalog")
+
+    async def trim(self) -> None:
+        """Removes the least recently seen tracks until at most ``max_tracks`` are left."""
+        count = (await self.database.fetchone(
+            # language=SQLite
+            "SELECT COUNT(*) FROM catalog_tracks"
+        ))[0]
+        if count <= self.max_tracks:
+            return
+        excess = count - self.max_tracks
+        # The search index goes first, since the tracks to remove are picked from the tracks table
+        await self.database.execute(
+            # language=SQLite
+            "DELETE FROM catalog_search WHERE rowid IN "
+            "(SELECT id FROM catalog_tracks ORDER BY last_seen LIMIT ?)",
+            (excess,)
+        )
+        await self.database.execute(
+            # language=SQLite
+            "DELETE FROM catalog_tracks WHERE id IN "
+            "(SELECT id FROM catalog_tracks ORDER BY last_seen LIMIT ?)",
+            (excess,)
+        )
+
+    async def refresh_stale(self) -> None:
+        """Fetches the tracks that haven't been refreshed in a while again, a batch at a time.
+
+        Only tracks that no longer exist are removed, those that can't be fetched for any other reason are kept.
+        """
+        rows = await self.database.fetchall(
+            # language=SQLite
+            "SELECT platform, url FROM catalog_tracks WHERE refreshed_at < ? ORDER BY refreshed_at LIMIT ?",
+            (time.time() - self.refresh_after, self.REFRESH_BATCH_SIZE)
+        )
+        # Nobody is waiting on these, so they shouldn't hold up anyone who is, nor be sent all at once
+        request_priority.set(Priority.PREFETCH)
+        for platform, url in rows:
+            await self._refresh(platform, url)
+
+    async def _refresh(self, platform: str, url: str) -> None:
+        if (api_interface := self.api_interfaces.get(platform)) is None:
+            return
+        try:
+            track_id = api_interface.get_track_id(url)
+        except InvalidURLError:
+            await self.remove(platform, url)
+            return
+        try:
+            track = await api_interface.track_from_id(track_id)
+        except Exception as error:
+            # Private tracks and failed requests may well work again later, so the track is kept but goes to the
+            # back of the line, rather than being picked again at every maintenance
+            _logger.debug(f"Could not refresh {url}: {error!r}")
+            self.database.queue(
+                # language=SQLite
+                "UPDATE catalog_tracks SET refreshed_at = ? WHERE platform = ? AND url = ?",
+                (time.time(), platform, url)
+            )
+            return
+        if track is None:
+            await self.remove(platform, url)
+            return
+
+        # Being refreshed doesn't count as being seen, so it doesn't keep unpopular tracks around
+        self.database.queue(
+            # language=SQLite
+            "UPDATE catalog_tracks SET title = ?, artists = ?, track = ?, refreshed_at = ? "
+            "WHERE platform = ? AND url = ?",
+            (
+                track.title,
+                " ".join(track.artist_names),
+                json.dumps(track.to_dict()),
+                time.time(),
+                platform,
+                url,
+            )
+        )
+        self._queue_search_index_update(platform, url)
+
+    async def remove(self, platform: str, url: str) -> None:
+        self.database.queue(
+            # language=SQLite
+            "DELETE FROM catalog_search "
+            "WHERE rowid = (SELECT id FROM catalog_tracks WHERE platform = ? AND url = ?)",
+            (platform, url)
+        )
+        self.database.queue(
+            # language=SQLite
+            "DELETE FROM catalog_tracks WHERE platform = ? AND url = ?",
+            (platform, url)
+        )
+
+    async def close(self) -> None:
+        if self._maintenance_task is not None:
+            self._maintenance_task.cancel()
+            await asyncio.gather(self._maintenance_task, return_exceptions=True)
+            self._maintenance_task = None
+        await self.database.close()
@@ -0,0 +1,88 @@
+import asyncio
+import contextvars
+import functools
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any, TypeVar
+
+from .ratelimit import Priority, request_priority
+
+__all__ = [
+    "SingleFlight",
+    "coalesced",
+    "uncoalesced",
+]
+
+T = TypeVar("T")
+
+# Set while an uncoalesced call is running, so that the coalesced methods it calls in turn make their own requests too
+_coalescing_bypassed: contextvars.ContextVar[bool] = contextvars.ContextVar("coalescing_bypassed", default=False)
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into a single shared call.
+
+    The first caller for a key starts the call, and everyone who asks for the same key while it is still running
+    awaits the same result instead of starting a call of their own.
+    Calls made at :attr:`Priority.PREFETCH` are only shared with each other, since anyone joining one would have
+    to wait behind every other request along with it.
+    """
+
+    def __init__(self):
+        self._in_flight: dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    async def run(self, key: Hashable, function: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any) -> T:
+        key = (key, request_priority.get() is Priority.PREFETCH)
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(function(*args, **kwargs))
+            self._in_flight[key] = task
+            task.add_done_callback(functools.partial(self._forget, key))
+        # Shielded so that one caller giving up does not cancel the call for everyone else
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # Marks the exception as retrieved, every remaining caller still gets it raised
+            task.exception()
+
+
+def coalesced(method: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """Makes concurrent calls to an API method with the same arguments share one request.
+
+    The instance is expected to have a ``_single_flight`` attribute holding a :class:`SingleFlight`.
+    """
+
+    @functools.wraps(method)
+    async def wrapper(self, *args: Any, **kwargs: Any) -> T:
+        if _coalescing_bypassed.get():
+            return await method(self, *args, **kwargs)
+        key = (method.__qualname__, args, tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return await method(self, *args, **kwargs)
+        return await self._single_flight.run(key, method, self, *args, **kwargs)
+
+    wrapper.__coalesced__ = True
+    return wrapper
+
+
+def uncoalesced(method: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """Returns an API method that makes its own request rather than sharing one, for when that's wanted on purpose.
+
+    This goes for every coalesced method it calls as well, such as an overridden method calling its parent's.
+    """
+
+    async def wrapper(*args: Any, **kwargs: Any) -> T:
+        token = _coalescing_bypassed.set(True)
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            _coalescing_bypassed.reset(token)
+
+    return wrapper
@@ -0,0 +1,380 @@
+import asyncio
+import functools
+import logging
+import time
+from collections.abc import AsyncIterable, Awaitable, Callable
+
+from . import metrics
+from .abc import UniversalTrack
+from .cache import ConversionCache
+from .catalog import TrackCatalog
+from .coalescing import SingleFlight, uncoalesced
+from .errors import InvalidURLError, PrivateTrackError
+from .hedging import HedgePolicy, hedged
+from .negative_cache import FailureKind, NegativeCache
+from .normalization import search_query
+from .routing import UrlRouter
+from .types import APIInterface
+
+__all__ = [
+    "TrackConverter",
+]
+
+_logger = logging.getLogger(__name__)
+
+
+class TrackConverter:
+    """Converts tracks between platforms, answering from the conversion cache whenever possible.
+
+    When given a track catalog, every track that is looked up or found is added to it,
+    and searches are answered from it when it has a confident match.
+    When given a negative cache, lookups and searches that recently failed are turned away without any requests.
+    When given a hedge policy, searches that take unusually long are sent a second time, see :meth:`search`.
+    """
+
+    def __init__(
+        self,
+        api_interfaces: dict[str, APIInterface],
+        *,
+        cache: ConversionCache,
+        router: UrlRouter,
+        catalog: TrackCatalog | None = None,
+        negative_cache: NegativeCache | None = None,
+        hedge_policy: HedgePolicy | None = None,
+    ):
+        self.api_interfaces = api_interfaces
+        self.cache = cache
+        self.router = router
+        self.catalog = catalog
+        self.negative_cache = negative_cache
+        self.hedge_policy = hedge_policy
+        self._single_flight = SingleFlight()
+        # The tasks reporting late results, and the conversions each of them is waiting on
+        self._late_conversions: dict[asyncio.Task, set[asyncio.Task]] = {}
+
+    async def convert_text(
+        self,
+        text: str,
+        target_platform: str,
+        *,
+        budget: float | None = None,
+        url_timeout: float | None = None,
+        on_late_results: Callable[[list[UniversalTrack]], Awaitable[None]] | None = None,
+    ) -> list[UniversalTrack]:
+        """Converts every track URL in a piece of text that isn't already on the target platform.
+
+        Each URL is converted on its own, so that one failing or taking longer than ``url_timeout`` seconds only
+        leaves out its own track. Whatever has been converted once ``budget`` seconds have passed is returned.
+        The URLs that weren't converted in time are given up on, unless ``on_late_results`` is given, in which case
+        they're left to finish and it's called with every converted track once they have, if any more were converted.
+        """
+        urls = self.router.find_urls(text)
+        if not urls:
+            return []
+
+        async def convert_url(url: str) -> UniversalTrack | None:
+            route = self.router.resolve(url, kind="track", exclude=(target_platform,))
+            if route is None:
+                return None
+            try:
+                return await asyncio.wait_for(self.convert(route.platform, route.id, target_platform), url_timeout)
+            except asyncio.TimeoutError:
+                metrics.deadlines_exceeded.inc(scope="url")
+                _logger.warning(f"Converting {url} to {target_platform} took longer than {url_timeout}s")
+            except Exception:
+                _logger.exception(f"Could not convert {url} to {target_platform}")
+            return None
+
+        def converted_tracks() -> list[UniversalTrack]:
+            return [
+                track
+                for task in tasks
+                if task.done() and not task.cancelled() and (track := task.result()) is not None
+            ]
+
+        tasks = [asyncio.create_task(convert_url(url)) for url in urls]
+        try:
+            _, pending = await asyncio.wait(tasks, timeout=budget)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        if not pending:
+            return converted_tracks()
+
+        metrics.deadlines_exceeded.inc(scope="text")
+        tracks = converted_tracks()
+        if on_late_results is None:
+            for task in pending:
+                task.cancel()
+            return tracks
+
+        async def report_late_results() -> None:
+            await asyncio.wait(pending)
+            if len(late_tracks := converted_tracks()) > len(tracks):
+                await on_late_results(late_tracks)
+
+        late_conversion = asyncio.create_task(report_late_results())
+        self._late_conversions[late_conversion] = pending
+        late_conversion.add_done_callback(self._forget_late_conversion)
+        return tracks
+
+    async def close(self) -> None:
+        """Gives up on every late conversion and batched lookup, and closes the cache.
+
+        This has to happen before the session is closed.
+        """
+        tasks = [
+            task
+            for late_conversion, pending in self._late_conversions.items()
+            for task in (late_conversion, *pending)
+        ]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for api_interface in self.api_interfaces.values():
+            await api_interface.close()
+        await self.cache.close()
+
+    def _forget_late_conversion(self, task: asyncio.Task) -> None:
+        self._late_conversions.pop(task, None)
+        if not task.cancelled() and (error := task.exception()) is not None:
+            _logger.error("Could not report late conversions", exc_info=error)
+
+    async def convert_all(
+        self,
+        source_platform: str,
+        tracks: AsyncIterable[UniversalTrack],
+        target_platform: str,
+        *,
+        workers: int = 4,
+        limit: int | None = None,
+        on_result: Callable[[int, UniversalTrack, UniversalTrack | None], None] | None = None,
+    ) -> list[tuple[UniversalTrack, UniversalTrack | None]]:
+        """Converts every track from an async iterable, such as the tracks of a playlist, keeping their order.
+
+        At most ``workers`` tracks are converted at once, and tracks are only taken from the iterable as workers
+        free up, so that pages of a playlist aren't fetched long before they're needed.
+        Tracks that fail to convert are logged and treated as not found, rather than failing everything else.
+        ``on_result`` is called with the index, source track and converted track as each conversion finishes.
+        """
+        results: list[tuple[UniversalTrack, UniversalTrack | None]] = []
+        queue: asyncio.Queue[tuple[int, UniversalTrack] | None] = asyncio.Queue(maxsize=workers)
+
+        async def worker() -> None:
+            while (item := await queue.get()) is not None:
+                index, track = item
+                try:
+                    converted = await self.convert_track(source_platform, track, target_platform)
+                except Exception:
+                    _logger.exception(f"Could not convert {track.url} to {target_platform}")
+                    converted = None
+                results[index] = (track, converted)
+                if on_result is not None:
+                    on_result(index, track, converted)
+
+        worker_tasks = [asyncio.create_task(worker()) for _ in range(max(1, workers))]
+        try:
+            iterator = aiter(tracks)
+            # Checked before taking the next track, so that reaching the limit never fetches another page
+            while limit is None or len(results) < limit:
+                try:
+                    track = await anext(iterator)
+                except StopAsyncIteration:
+                    break
+                results.append((track, None))
+                await queue.put((len(results) - 1, track))
+            for _ in worker_tasks:
+                await queue.put(None)
+            await asyncio.gather(*worker_tasks)
+        finally:
+            for task in worker_tasks:
+                task.cancel()
+        return results
+
+    async def convert_track(
+        self,
+        source_platform: str,
+        track: UniversalTrack,
+        target_platform: str,
+    ) -> UniversalTrack | None:
+        """Like :meth:`convert`, but for a track that has already been looked up, such as one from a playlist."""
+        try:
+            track_id = self.api_interfaces[source_platform].get_track_id(track.url)
+        except InvalidURLError:
+            # Without an id there's nothing to cache the conversion under
+            return await self.find_track(track, target_platform)
+        return await self.convert(source_platform, track_id, target_platform, source_track=track)
+
+    async def convert(
+        self,
+        source_platform: str,
+        track_id: str,
+        target_platform: str,
+        *,
+        source_track: UniversalTrack | None = None,
+    ) -> UniversalTrack | None:
+        """Finds the equivalent of a track on another platform.
+
+        If the source and target platforms are the same, the track itself is looked up instead.
+        Concurrent conversions of the same track share a single conversion.
+        If the source track has already been looked up, it can be passed as ``source_track`` to skip looking it up again.
+        """
+        try:
+            track = await self._single_flight.run(
+                (source_platform, track_id, target_platform),
+                self._convert,
+                source_platform, track_id, target_platform, source_track
+            )
+        except Exception:
+            metrics.conversions.inc(source=source_platform, target=target_platform, result="error")
+            raise
+        metrics.conversions.inc(
+            source=source_platform,
+            target=target_platform,
+            result="converted" if track is not None else "not_found",
+        )
+        return track
+
+    async def _convert(
+        self,
+        source_platform: str,
+        track_id: str,
+        target_platform: str,
+        source_track: UniversalTrack | None,
+    ) -> UniversalTrack | None:
+        if (track := await self.cache.get(source_platform, track_id, target_platform)) is not None:
+            return track
+
+        if source_track is None:
+            source_track = await self.cache.get(source_platform, track_id, source_platform)
+        if source_track is None:
+            source_track = await self._track_from_id(source_platform, track_id)
+            if source_track is None:
+                return None
+            await self.cache.set(source_platform, track_id, source_platform, source_track)
+            if self.catalog is not None:
+                await self.catalog.add(source_platform, source_track)
+            if source_track.isrc:
+                await self.cache.set_by_isrc(source_track.isrc, source_platform, source_track)
+
+        if source_platform == target_platform:
+            return source_track
+
+        track = await self.find_track(source_track, target_platform)
+        if track is None:
+            return None
+        await self.cache.set(source_platform, track_id, target_platform, track)
+        return track
+
+    async def find_track(self, track: UniversalTrack, target_platform: str) -> UniversalTrack | None:
+        """Finds the closest match for a track on a platform.
+
+        Exact lookups by ISRC are tried before falling back to a text search, which the catalog gets a go at first.
+        Search results are remembered by the track's canonical key, so other releases of it don't need a search.
+        """
+        target_interface = self.api_interfaces[target_platform]
+        if track.isrc:
+            if (found_track := await self.cache.get_by_isrc(track.isrc, target_platform)) is not None:
+                return found_track
+            if target_interface.SUPPORTS_ISRC_LOOKUP and not self._has_failed(target_platform, "isrc", track.isrc):
+                if (found_track := await target_interface.track_from_isrc(track.isrc)) is not None:
+                    await self.cache.set_by_isrc(track.isrc, target_platform, found_track)
+                    if self.catalog is not None:
+                        await self.catalog.add(target_platform, found_track)
+                    return found_track
+                self._add_failure(target_platform, "isrc", track.isrc, FailureKind.NO_MATCH)
+
+        canonical_key = track.canonical_key
+        if (found_track := await self.cache.get_by_canonical_key(canonical_key, target_platform)) is not None:
+            return found_track
+        query = search_query(track)
+        if self.catalog is not None and (found_track := await self.catalog.find(target_platform, query)) is not None:
+            return found_track
+        if self._has_failed(target_platform, "search", query):
+            return None
+        tracks = await self.search(target_platform, query)
+        if not tracks:
+            # None means the search itself failed, which is worth trying again
+            if tracks is not None:
+                self._add_failure(target_platform, "search", query, FailureKind.NO_MATCH)
+            return None
+        found_track = tracks[0]
+        if track.isrc:
+            await self.cache.set_by_isrc(track.isrc, target_platform, found_track)
+        await self.cache.set_by_canonical_key(canonical_key, target_platform, found_track)
+        if self.catalog is not None:
+            await self.catalog.add(target_platform, found_track, query=query)
+        return found_track
+
+    async def search(self, platform: str, query: str) -> list[UniversalTrack] | None:
+        """Searches a platform, hedging the search if the hedge policy says it has been taking too long.
+
+        The hedge is the same search on an equivalent platform with a backend of its own if there is one, otherwise
+        it's the same search on the same platform again.
+        """
+        if self.hedge_policy is None:
+            return await self.api_interfaces[platform].search_tracks(query)
+        if (delay := self.hedge_policy.delay(platform)) is None:
+            return await self._timed_search(platform, platform, query)
+
+        api_interface = self.api_interfaces[platform]
+        # An equivalent platform served by the same backend, such as YouTube Music for YouTube, would be just as slow
+        equivalent_platform = next((
+            name
+            for name, other_interface in self.api_interfaces.items()
+            if api_interface.is_equivalent_to(other_interface)
+            and other_interface.rate_limit_key != api_interface.rate_limit_key
+        ), None)
+        return await hedged(
+            functools.partial(self._timed_search, platform, platform, query, primary=True),
+            # Never shared with other searches, since joining one that is already taking too long is no hedge at all
+            functools.partial(self._timed_search, equivalent_platform or platform, platform, query, coalesce=False),
+            delay=delay,
+            platform=platform,
+        )
+
+    async def _timed_search(
+        self,
+        platform: str,
+        target_platform: str,
+        query: str,
+        *,
+        coalesce: bool = True,
+        primary: bool = False,
+    ) -> list[UniversalTrack] | None:
+        api_interface = self.api_interfaces[platform]
+        search_tracks = api_interface.search_tracks if coalesce else uncoalesced(api_interface.search_tracks)
+        started_at = time.perf_counter()
+        try:
+            tracks = await search_tracks(query)
+        except asyncio.CancelledError:
+            # A primary search is cancelled when its hedge wins, which only happens when it's slow. How long it ran
+            # for is still a lower bound on its latency, leaving it out would make the platform look faster than it is
+            if primary:
+                self.hedge_policy.observe(platform, time.perf_counter() - started_at)
+            raise
+        self.hedge_policy.observe(platform, time.perf_counter() - started_at)
+        if tracks and platform != target_platform:
+            target_interface = self.api_interfaces[target_platform]
+            tracks = [target_interface.adopt_track(track) for track in tracks]
+        return tracks
+
+    async def _track_from_id(self, platform: str, track_id: str) -> UniversalTrack | None:
+        if self._has_failed(platform, "track", track_id):
+            return None
+        try:
+            track = await self.api_interfaces[platform].track_from_id(track_id)
+        except PrivateTrackError:
+            self._add_failure(platform, "track", track_id, FailureKind.PRIVATE)
+            return None
+        if track is None:
+            self._add_failure(platform, "track", track_id, FailureKind.NOT_FOUND)
+        return track
+
+    def _has_failed(self, platform: str, lookup: str, key: str) -> bool:
+        return self.negative_cache is not None and self.negative_cache.get(platform, lookup, key) is not None
+
+    def _add_failure(self, platform: str, lookup: str, key: str, kind: FailureKind) -> None:
+        if self.negative_cache is not None:
+            self.negative_cache.add(platform, lookup, key, kind)
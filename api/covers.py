@@ -0,0 +1,155 @@
+import asyncio
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import BinaryIO
+
+import aiohttp
+
+from .coalescing import SingleFlight
+from .errors import CoverTooLargeError
+
+__all__ = [
+    "CoverCache",
+]
+
+
+def _url_key(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+class CoverCache:
+    """An on-disk cache of cover art, with a cap on its total size.
+
+    Images are stored under the hash of their content, so covers shared between several URLs are only stored once,
+    and each URL points to the content it last resolved to. When the cache grows past ``max_bytes``, the least
+    recently used images are evicted.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, directory: Path, *, max_bytes: int, max_file_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+
+        self._objects = directory / "objects"
+        self._urls = directory / "urls"
+        self._downloads = directory / "downloads"
+        self._size = 0
+        self._single_flight = SingleFlight()
+        self._eviction: asyncio.Task | None = None
+
+    async def load(self) -> None:
+        await asyncio.to_thread(self._load)
+
+    def _load(self) -> None:
+        for directory in (self._objects, self._urls, self._downloads):
+            directory.mkdir(parents=True, exist_ok=True)
+        # Anything left over in here is from a download that was interrupted
+        for leftover in self._downloads.iterdir():
+            leftover.unlink(missing_ok=True)
+        self._size = sum(path.stat().st_size for path in self._objects.iterdir())
+
+    def _lookup(self, url_key: str) -> Path | None:
+        try:
+            content_hash = (self._urls / url_key).read_text().strip()
+        except FileNotFoundError:
+            return None
+        path = self._objects / content_hash
+        try:
+            # Bumping the modification time is what keeps recently used covers from being evicted
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    async def open(self, url: str, *, session: aiohttp.ClientSession) -> BinaryIO:
+        """Returns an open binary file handle for the cover at the URL, downloading it if it isn't cached."""
+        url_key = _url_key(url)
+        if (path := await asyncio.to_thread(self._lookup, url_key)) is not None:
+            try:
+                return await asyncio.to_thread(open, path, "rb")
+            except FileNotFoundError:
+                # Evicted since it was looked up, which is no different from it not being cached
+                pass
+        path = await self._single_flight.run(url_key, self._download, url, url_key, session)
+        return await asyncio.to_thread(open, path, "rb")
+
+    async def _download(self, url: str, url_key: str, session: aiohttp.ClientSession) -> Path:
+        download_path = self._downloads / uuid.uuid4().hex
+        content_hash = hashlib.sha256()
+        size = 0
+        try:
+            async with session.get(url) as response:
+                response.raise_for_status()
+                if (response.content_length or 0) > self.max_file_bytes:
+                    raise CoverTooLargeError(f"Cover at {url} is larger than {self.max_file_bytes} bytes")
+
+                file = await asyncio.to_thread(open, download_path, "wb")
+                try:
+                    async for chunk in response.content.iter_chunked(self.CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > self.max_file_bytes:
+                            raise CoverTooLargeError(f"Cover at {url} is larger than {self.max_file_bytes} bytes")
+                        content_hash.update(chunk)
+                        await asyncio.to_thread(file.write, chunk)
+                finally:
+                    await asyncio.to_thread(file.close)
+        except BaseException:
+            await asyncio.to_thread(download_path.unlink, True)
+            raise
+
+        path = self._objects / content_hash.hexdigest()
+        added = await asyncio.to_thread(self._store, download_path, path, url_key)
+        self._size += size if added else 0
+        if self._size > self.max_bytes and (self._eviction is None or self._eviction.done()):
+            self._eviction = asyncio.create_task(self._run_eviction())
+        return path
+
+    async def _run_eviction(self) -> None:
+        # The size is only ever changed on the event loop, since downloads keep adding to it while evicting
+        self._size -= await asyncio.to_thread(self._evict)
+
+    async def close(self) -> None:
+        """Waits for an eviction in progress to finish, so that its files aren't left half deleted."""
+        if self._eviction is not None:
+            await asyncio.gather(self._eviction, return_exceptions=True)
+            self._eviction = None
+
+    def _store(self, download_path: Path, path: Path, url_key: str) -> bool:
+        added = not path.exists()
+        if added:
+            download_path.replace(path)
+        else:
+            # The same image is already cached under another URL
+            download_path.unlink()
+            os.utime(path)
+        (self._urls / url_key).write_text(path.name)
+        return added
+
+    def _evict(self) -> int:
+        """Evicts the least recently used covers, returning how many bytes were freed."""
+        objects = sorted(
+            ((path, path.stat()) for path in self._objects.iterdir()),
+            key=lambda entry: entry[1].st_mtime
+        )
+        size = sum(stat.st_size for _, stat in objects)
+        # Evict down to 90% of the cap, so that we aren't evicting again after every single download
+        target = self.max_bytes * 0.9
+        freed = 0
+        for path, stat in objects:
+            if size - freed <= target:
+                break
+            path.unlink(missing_ok=True)
+            freed += stat.st_size
+
+        remaining = {path.name for path in self._objects.iterdir()}
+        for url_path in self._urls.iterdir():
+            try:
+                if url_path.read_text().strip() not in remaining:
+                    url_path.unlink(missing_ok=True)
+            except FileNotFoundError:
+                pass
+        return freed
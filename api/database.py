@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import sqlite3
+from collections.abc import Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, TypeVar
+
+__all__ = [
+    "AsyncDatabase",
+]
+
+T = TypeVar("T")
+
+_logger = logging.getLogger(__name__)
+
+
+class AsyncDatabase:
+    """An SQLite database that is only ever touched from its own dedicated thread.
+
+    Reads are run in that thread and awaited, while writes are queued and committed together in a single
+    transaction once ``batch_window`` seconds have passed since the first queued write.
+
+    Migrations are plain SQL scripts, applied in order. The index of the last applied script is kept in the
+    database's ``user_version``, so adding a migration means appending a script to the end of the list.
+    """
+
+    def __init__(self, path: Path, *, migrations: Sequence[str] = (), batch_window: float = 0.05):
+        self.path = path
+        self.migrations = migrations
+        self.batch_window = batch_window
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"sqlite-{path.stem}")
+        self._connection: sqlite3.Connection | None = None
+        self._pending_writes: list[tuple[str, Sequence[Any], asyncio.Future | None]] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._flush_tasks: set[asyncio.Task] = set()
+
+    async def _run(self, function: Callable[..., T], *args: Any) -> T:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def connect(self) -> None:
+        await self._run(self._connect)
+
+    def _connect(self) -> None:
+        # Transactions are managed by hand, so that batched writes end up in a single transaction
+        self._connection = sqlite3.connect(self.path, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+
+        current_version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+        for version, migration in enumerate(self.migrations[current_version:], start=current_version + 1):
+            self._connection.execute("BEGIN")
+            try:
+                self._execute_script(migration)
+                self._connection.execute(f"PRAGMA user_version = {version:d}")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def _execute_script(self, script: str) -> None:
+        # executescript() would commit the migration's transaction, so statements are run one at a time instead
+        for statement in filter(str.strip, script.split(";")):
+            self._connection.execute(statement)
+
+    async def fetchone(self, sql: str, parameters: Sequence[Any] = ()) -> tuple | None:
+        return await self._run(lambda: self._connection.execute(sql, parameters).fetchone())
+
+    async def fetchall(self, sql: str, parameters: Sequence[Any] = ()) -> list[tuple]:
+        return await self._run(lambda: self._connection.execute(sql, parameters).fetchall())
+
+    async def execute(self, sql: str, parameters: Sequence[Any] = ()) -> int:
+        """Queues a write to be committed with any other writes arriving close to it.
+
+        Returns the number of rows modified by the statement once it has been committed.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queue_write(sql, parameters, future)
+        return await future
+
+    def queue(self, sql: str, parameters: Sequence[Any] = ()) -> None:
+        """Queues a write without waiting for it to be committed. Failures are logged rather than raised."""
+        self._queue_write(sql, parameters, None)
+
+    def _queue_write(self, sql: str, parameters: Sequence[Any], future: asyncio.Future | None) -> None:
+        self._pending_writes.append((sql, parameters, future))
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.batch_window, self._schedule_flush)
+
+    def _schedule_flush(self) -> None:
+        self._flush_handle = None
+        task = asyncio.create_task(self.flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def flush(self) -> None:
+        """Commits all queued writes right away."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        writes, self._pending_writes = self._pending_writes, []
+        if not writes:
+            return
+
+        try:
+            results = await self._run(self._write_batch, [(sql, parameters) for sql, parameters, _ in writes])
+        except Exception as error:
+            results = [error] * len(writes)
+
+        for (sql, _, future), result in zip(writes, results):
+            if future is None:
+                if isinstance(result, Exception):
+                    _logger.error(f"Queued write {sql!r} failed", exc_info=result)
+            elif future.done():
+                continue
+            elif isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _write_batch(self, writes: list[tuple[str, Sequence[Any]]]) -> list[int | Exception]:
+        results: list[int | Exception] = []
+        self._connection.execute("BEGIN")
+        try:
+            for sql, parameters in writes:
+                # A savepoint per statement means one failing write doesn't take the rest of the batch down with it
+                self._connection.execute("SAVEPOINT batched_write")
+                try:
+                    results.append(self._connection.execute(sql, parameters).rowcount)
+                except sqlite3.Error as error:
+                    self._connection.execute("ROLLBACK TO batched_write")
+                    results.append(error)
+                self._connection.execute("RELEASE batched_write")
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+        return results
+
+    async def close(self) -> None:
+        await self.flush()
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+        if self._connection is not None:
+            await self._run(self._connection.close)
+            self._connection = None
+        self._executor.shutdown(wait=False)
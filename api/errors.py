@@ -1,2 +1,14 @@
 class InvalidURLError(Exception):
     pass
+
+
+class CoverTooLargeError(Exception):
+    pass
+
+
+class QueueFullError(Exception):
+    """Raised when there is no room left to queue more work."""
+
+
+class PrivateTrackError(Exception):
+    """Raised when a track exists, but can't be looked up, such as a private video."""
@@ -0,0 +1,107 @@
+import asyncio
+import bisect
+from collections import deque
+from collections.abc import Awaitable, Callable
+from typing import TypeVar
+
+from . import metrics
+
+__all__ = [
+    "LatencyTracker",
+    "HedgePolicy",
+    "hedged",
+]
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """Keeps the latencies of the most recent ``window`` calls to something, to tell how long it usually takes."""
+
+    def __init__(self, *, window: int = 256):
+        self._latencies: deque[float] = deque(maxlen=window)
+        # Kept sorted alongside the deque, so that percentiles don't need sorting every time
+        self._sorted: list[float] = []
+
+    def __len__(self) -> int:
+        return len(self._latencies)
+
+    def observe(self, seconds: float) -> None:
+        if len(self._latencies) == self._latencies.maxlen:
+            oldest = self._latencies[0]
+            del self._sorted[bisect.bisect_left(self._sorted, oldest)]
+        self._latencies.append(seconds)
+        bisect.insort(self._sorted, seconds)
+
+    def percentile(self, percentile: float) -> float | None:
+        if not self._sorted:
+            return None
+        return self._sorted[min(len(self._sorted) - 1, int(percentile * len(self._sorted)))]
+
+
+class HedgePolicy:
+    """Decides how long to wait on a request before sending a second one, from how long requests recently took.
+
+    The delay is the ``percentile`` of each platform's recent latency, so only the slowest requests are hedged.
+    Platforms are only hedged once ``min_samples`` latencies have been seen for them.
+    """
+
+    def __init__(self, *, percentile: float = 0.95, min_delay: float = 0.2, min_samples: int = 20):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self._trackers: dict[str, LatencyTracker] = {}
+
+    def observe(self, platform: str, seconds: float) -> None:
+        if (tracker := self._trackers.get(platform)) is None:
+            tracker = self._trackers[platform] = LatencyTracker()
+        tracker.observe(seconds)
+
+    def delay(self, platform: str) -> float | None:
+        """How long to wait before hedging a request to a platform, or None if it shouldn't be hedged yet."""
+        tracker = self._trackers.get(platform)
+        if tracker is None or len(tracker) < self.min_samples:
+            return None
+        return max(self.min_delay, tracker.percentile(self.percentile))
+
+
+async def hedged(
+    primary: Callable[[], Awaitable[T]],
+    backup: Callable[[], Awaitable[T]],
+    *,
+    delay: float,
+    platform: str,
+) -> T:
+    """Awaits ``primary``, starting ``backup`` as well if it hasn't finished after ``delay`` seconds.
+
+    Whichever succeeds first is returned and the other is cancelled. If one fails, the other is waited on instead,
+    and if both fail the primary's exception is raised.
+    """
+    primary_task = asyncio.ensure_future(primary())
+    try:
+        return await asyncio.wait_for(asyncio.shield(primary_task), delay)
+    except asyncio.TimeoutError:
+        pass
+    except BaseException:
+        primary_task.cancel()
+        raise
+
+    backup_task = asyncio.ensure_future(backup())
+    names = {primary_task: "primary", backup_task: "backup"}
+    pending = {primary_task, backup_task}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is None:
+                    metrics.hedged_requests.inc(platform=platform, winner=names[task])
+                    return task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+    metrics.hedged_requests.inc(platform=platform, winner="none")
+    # Marks the backup's exception as retrieved, it's the primary's that gets raised
+    if not backup_task.cancelled():
+        backup_task.exception()
+    return primary_task.result()
@@ -1,11 +1,20 @@
+import contextvars
 import io
+import time
+from typing import BinaryIO
 
 import aiohttp
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 
 import breadcord
+from . import metrics
 from .abc import AbstractOAuthAPI, AbstractAPI, UniversalTrack
+from .covers import CoverCache
+from .http_client import HTTPStats, create_session
+from .normalization import search_query
+from .ratelimit import Priority, RateLimiter, request_priority
+from .routing import UrlRouter
 from .types import APIInterface
 
 __all__ = [
@@ -24,6 +33,10 @@ from .platforms import (
 )
 
 
+# When the command being handled in the current context started, for timing it
+_command_started_at: contextvars.ContextVar[float | None] = contextvars.ContextVar("command_started_at", default=None)
+
+
 class PlatformConverter(commands.Converter):
     async def convert(self, ctx: commands.Context, argument: str) -> APIInterface | None:
         # This should only ever be used in this cog, and thus we know that ctx.cog will never be None
@@ -36,6 +49,9 @@ class PlatformAPICog(breadcord.module.ModuleCog):
         super().__init__(module_id)
 
         self.session: None | aiohttp.ClientSession = None
+        self.http_stats = HTTPStats()
+        self.rate_limiter = RateLimiter()
+        self.url_router: UrlRouter | None = None
         # Lie to make the type checker happy
         # It will get sorted out in cog_load
         self.api_interfaces: dict[str, APIInterface] = {
@@ -46,7 +62,17 @@ class PlatformAPICog(breadcord.module.ModuleCog):
         }
 
     async def cog_load(self) -> None:
-        self.session = aiohttp.ClientSession()
+        http_settings: breadcord.config.SettingsGroup = self.settings.http
+        self.session = create_session(
+            stats=self.http_stats,
+            max_connections=http_settings.max_connections.value,
+            max_connections_per_host=http_settings.max_connections_per_host.value,
+            keepalive_timeout=http_settings.keepalive_timeout_seconds.value,
+            dns_cache_ttl=http_settings.dns_cache_ttl_seconds.value,
+            connect_timeout=http_settings.connect_timeout_seconds.value,
+            read_timeout=http_settings.read_timeout_seconds.value,
+            total_timeout=http_settings.total_timeout_seconds.value,
+        )
         handled_api_interfaces: dict[str, APIInterface] = {}
 
         for platform_name in self.settings.active_platforms.value:
@@ -60,26 +86,37 @@ class PlatformAPICog(breadcord.module.ModuleCog):
                 handled_api_interfaces[platform_name] = api_interface(
                     client_id=platform_settings.client_id.value,
                     client_secret=platform_settings.client_secret.value,
-                    session=self.session
+                    session=self.session,
+                    rate_limiter=self.rate_limiter,
                 )
             elif issubclass(api_interface, AbstractAPI):
-                handled_api_interfaces[platform_name] = api_interface(session=self.session)
+                handled_api_interfaces[platform_name] = api_interface(
+                    session=self.session,
+                    rate_limiter=self.rate_limiter,
+                )
 
         self.api_interfaces = handled_api_interfaces
-        self.refresh_access_tokens.start()
+        self.url_router = UrlRouter(self.api_interfaces)
+
+    def platform_name(self, api_interface: APIInterface) -> str:
+        return next(name for name, interface in self.api_interfaces.items() if interface is api_interface)
 
     async def cog_unload(self) -> None:
         await self.session.close()
 
-    @tasks.loop(minutes=20)
-    async def refresh_access_tokens(self):
-        if self.session.closed:
+    async def cog_before_invoke(self, ctx: commands.Context) -> None:
+        # Someone is waiting on a reply, so let their requests skip ahead of passive conversions
+        request_priority.set(Priority.INTERACTIVE)
+        _command_started_at.set(time.perf_counter())
+
+    async def cog_after_invoke(self, ctx: commands.Context) -> None:
+        if (started_at := _command_started_at.get()) is None:
             return
-        for api in self.api_interfaces.values():
-            if hasattr(api, "refresh_access_token"):
-                self.logger.debug(f"Refreshing {api.__class__.__name__} access token")
-                await api.refresh_access_token()
-                self.logger.debug(f"Refreshed {api.__class__.__name__} access token")
+        metrics.command_duration.observe(
+            time.perf_counter() - started_at,
+            command=ctx.command.qualified_name,
+            result="error" if ctx.command_failed else "ok",
+        )
 
 
 def track_embed(
@@ -102,10 +139,17 @@ def track_embed(
 
 
 def track_to_query(track: UniversalTrack) -> str:
-    return f"{track.title} {' '.join(track.artist_names)}"
+    return search_query(track)
 
 
-async def url_to_file(url: str, *, session: aiohttp.ClientSession) -> io.BytesIO:
+async def url_to_file(
+    url: str,
+    *,
+    session: aiohttp.ClientSession,
+    cover_cache: CoverCache | None = None,
+) -> BinaryIO:
+    if cover_cache is not None:
+        return await cover_cache.open(url, session=session)
     async with session.get(url) as response:
         return io.BytesIO(await response.read())
 
@@ -0,0 +1,91 @@
+import asyncio
+from types import SimpleNamespace
+
+import aiohttp
+
+from . import metrics
+
+__all__ = [
+    "HTTPStats",
+    "create_session",
+]
+
+
+class HTTPStats:
+    """Records the requests, response bytes, latency and statuses of every host requested through a session."""
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_request_end.append(self._on_request_end)
+        trace_config.on_request_exception.append(self._on_request_exception)
+        trace_config.on_response_chunk_received.append(self._on_response_chunk_received)
+        return trace_config
+
+    # noinspection PyUnusedLocal
+    async def _on_request_start(
+        self,
+        session: aiohttp.ClientSession,
+        context: SimpleNamespace,
+        params: aiohttp.TraceRequestStartParams
+    ) -> None:
+        context.host = params.url.host
+        context.started_at = asyncio.get_running_loop().time()
+
+    # noinspection PyUnusedLocal
+    async def _on_request_end(
+        self,
+        session: aiohttp.ClientSession,
+        context: SimpleNamespace,
+        params: aiohttp.TraceRequestEndParams
+    ) -> None:
+        latency = asyncio.get_running_loop().time() - context.started_at
+        metrics.http_request_duration.observe(latency, host=context.host)
+        metrics.http_requests.inc(host=context.host, status=params.response.status)
+
+    # noinspection PyUnusedLocal
+    async def _on_request_exception(
+        self,
+        session: aiohttp.ClientSession,
+        context: SimpleNamespace,
+        params: aiohttp.TraceRequestExceptionParams
+    ) -> None:
+        metrics.http_requests.inc(host=context.host, status="error")
+
+    # noinspection PyUnusedLocal
+    async def _on_response_chunk_received(
+        self,
+        session: aiohttp.ClientSession,
+        context: SimpleNamespace,
+        params: aiohttp.TraceResponseChunkReceivedParams
+    ) -> None:
+        metrics.http_response_bytes.inc(len(params.chunk), host=params.url.host)
+
+
+def create_session(
+    *,
+    stats: HTTPStats | None = None,
+    max_connections: int = 100,
+    max_connections_per_host: int = 10,
+    keepalive_timeout: float = 30,
+    dns_cache_ttl: int = 300,
+    connect_timeout: float = 5,
+    read_timeout: float = 10,
+    total_timeout: float = 30,
+) -> aiohttp.ClientSession:
+    """Creates the session shared by every platform, with bounded connection pools and timeouts on every request."""
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=max_connections,
+            limit_per_host=max_connections_per_host,
+            keepalive_timeout=keepalive_timeout,
+            ttl_dns_cache=dns_cache_ttl,
+            use_dns_cache=dns_cache_ttl > 0,
+        ),
+        timeout=aiohttp.ClientTimeout(
+            total=total_timeout,
+            sock_connect=connect_timeout,
+            sock_read=read_timeout,
+        ),
+        trace_configs=[stats.trace_config()] if stats is not None else None,
+    )
@@ -0,0 +1,351 @@
+import bisect
+import contextlib
+import math
+import time
+from collections.abc import Iterable, Iterator
+
+from aiohttp import web
+
+__all__ = [
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "MetricsRegistry",
+    "MetricsServer",
+    "registry",
+]
+
+LabelValues = tuple[str, ...]
+# Upper bounds in seconds, spread out to cover everything from a cache hit to a request that times out
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    labels = ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in zip(names, values))
+    return f"{{{labels}}}" if labels else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    TYPE: str
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+
+    def _key(self, labels: dict[str, object]) -> LabelValues:
+        if len(labels) != len(self.labels) or not all(label in labels for label in self.labels):
+            raise ValueError(f"{self.name} takes the labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def samples(self) -> Iterator[tuple[str, tuple[str, ...], LabelValues, float]]:
+        """Yields the name suffix, label names, label values and value of every sample."""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.TYPE}"]
+        lines.extend(
+            f"{self.name}{suffix}{_format_labels(names, values)} {_format_value(value)}"
+            for suffix, names, values, value in self.samples()
+        )
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """A value which only ever goes up, such as the number of requests made."""
+    TYPE = "counter"
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, description, labels)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def items(self) -> list[tuple[LabelValues, float]]:
+        return list(self._values.items())
+
+    def total_by(self, label: str) -> dict[str, float]:
+        """Sums the counter over every label but one."""
+        index = self.labels.index(label)
+        totals: dict[str, float] = {}
+        for key, value in self._values.items():
+            totals[key[index]] = totals.get(key[index], 0) + value
+        return totals
+
+    def samples(self) -> Iterator[tuple[str, tuple[str, ...], LabelValues, float]]:
+        for key, value in self._values.items():
+            yield "", self.labels, key, value
+
+
+class Gauge(_Metric):
+    """A value which can go up and down, such as the number of conversions in progress."""
+    TYPE = "gauge"
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, description, labels)
+        self._values: dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    @contextlib.contextmanager
+    def track_in_progress(self, **labels) -> Iterator[None]:
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def samples(self) -> Iterator[tuple[str, tuple[str, ...], LabelValues, float]]:
+        for key, value in self._values.items():
+            yield "", self.labels, key, value
+
+
+class _HistogramSeries:
+    __slots__ = ("bucket_counts", "sum", "count")
+
+    def __init__(self, bucket_count: int):
+        self.bucket_counts = [0] * bucket_count
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(_Metric):
+    """Counts observations, such as request latencies, into buckets so that percentiles can be estimated."""
+    TYPE = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: tuple[str, ...] = (),
+        *,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, description, labels)
+        self.buckets = (*sorted(buckets), math.inf)
+        self._series: dict[LabelValues, _HistogramSeries] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        if (series := self._series.get(key)) is None:
+            series = self._series[key] = _HistogramSeries(len(self.buckets))
+        # Counts are stored per bucket and only made cumulative when rendered
+        series.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return series.count if series else 0
+
+    def quantile(self, quantile: float, **labels) -> float | None:
+        """Estimates a quantile by interpolating within the bucket it falls in, like Prometheus does."""
+        series = self._series.get(self._key(labels))
+        if series is None or series.count == 0:
+            return None
+        rank = quantile * series.count
+        seen = 0
+        for index, bucket_count in enumerate(series.bucket_counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index]
+                if upper == math.inf:
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-2]
+
+    def samples(self) -> Iterator[tuple[str, tuple[str, ...], LabelValues, float]]:
+        bucket_labels = (*self.labels, "le")
+        for key, series in self._series.items():
+            cumulative = 0
+            for upper, bucket_count in zip(self.buckets, series.bucket_counts):
+                cumulative += bucket_count
+                yield "_bucket", bucket_labels, (*key, _format_value(upper)), cumulative
+            yield "_sum", self.labels, key, series.sum
+            yield "_count", self.labels, key, series.count
+
+
+class MetricsRegistry:
+    """Holds every metric, and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self.metrics: dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"A metric named {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, description: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, description, labels))
+
+    def gauge(self, name: str, description: str, labels: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, description, labels))
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        labels: tuple[str, ...] = (),
+        *,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, description, labels, buckets=buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+class MetricsServer:
+    """Serves a registry in the Prometheus text format at /metrics.
+
+    Only ever listens on localhost, anything further away should go through a reverse proxy or an exporter.
+    """
+
+    def __init__(self, metrics_registry: MetricsRegistry, *, port: int):
+        self.registry = metrics_registry
+        self.port = port
+        self._runner: web.AppRunner | None = None
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.add_routes([web.get("/metrics", self._handle_metrics)])
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", self.port).start()
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle_metrics(self, _: web.Request) -> web.Response:
+        return web.Response(
+            text=self.registry.render(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+
+registry = MetricsRegistry()
+
+# Every metric lives here, so that there is a single place to see what is being measured
+platform_requests = registry.counter(
+    "platform_converter_platform_requests_total",
+    "Requests made to each platform, by response status, or error if no response was received",
+    ("platform", "status"),
+)
+platform_request_duration = registry.histogram(
+    "platform_converter_platform_request_duration_seconds",
+    "Time until each platform responded, including waiting on rate limits and retries",
+    ("platform",),
+)
+http_requests = registry.counter(
+    "platform_converter_http_requests_total",
+    "Individual HTTP requests made through the shared session, by host and response status",
+    ("host", "status"),
+)
+http_response_bytes = registry.counter(
+    "platform_converter_http_response_bytes_total",
+    "Response body bytes received through the shared session, by host",
+    ("host",),
+)
+http_request_duration = registry.histogram(
+    "platform_converter_http_request_duration_seconds",
+    "Time taken by individual HTTP requests made through the shared session, by host",
+    ("host",),
+)
+conversions = registry.counter(
+    "platform_converter_conversions_total",
+    "Track conversions, by outcome",
+    ("source", "target", "result"),
+)
+conversion_cache_lookups = registry.counter(
+    "platform_converter_conversion_cache_lookups_total",
+    "Conversion cache lookups, by the tier that answered them, or miss",
+    ("tier",),
+)
+message_conversions_in_progress = registry.gauge(
+    "platform_converter_message_conversions_in_progress",
+    "Messages currently having their URLs converted",
+)
+command_duration = registry.histogram(
+    "platform_converter_command_duration_seconds",
+    "Time taken to handle each command",
+    ("command", "result"),
+)
+catalog_lookups = registry.counter(
+    "platform_converter_catalog_lookups_total",
+    "Searches looked up in the local track catalog, by whether it could answer them",
+    ("platform", "result"),
+)
+negative_cache_hits = registry.counter(
+    "platform_converter_negative_cache_hits_total",
+    "Lookups turned away because they recently failed, by platform and kind of failure",
+    ("platform", "kind"),
+)
+hedged_requests = registry.counter(
+    "platform_converter_hedged_requests_total",
+    "Requests which were slow enough for a second one to be sent, by platform and which of the two answered first",
+    ("platform", "winner"),
+)
+deadlines_exceeded = registry.counter(
+    "platform_converter_deadlines_exceeded_total",
+    "Conversions of a single URL, or of all the URLs in some text, that ran out of time",
+    ("scope",),
+)
+prefetches = registry.counter(
+    "platform_converter_prefetches_total",
+    "Conversions done ahead of time to warm the conversion cache, by outcome, or over_budget if not started",
+    ("result",),
+)
+scheduler_queue_depth = registry.gauge(
+    "platform_converter_scheduler_queue_depth",
+    "Conversions waiting in the scheduler's queue for a worker, by priority",
+    ("priority",),
+)
+scheduled_jobs = registry.counter(
+    "platform_converter_scheduled_jobs_total",
+    "Conversions submitted to the scheduler, by whether they were queued, coalesced, dropped or evicted",
+    ("result",),
+)
+token_refreshes = registry.counter(
+    "platform_converter_token_refreshes_total",
+    "Access token refreshes, by platform and outcome",
+    ("platform", "result"),
+)
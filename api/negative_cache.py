@@ -0,0 +1,58 @@
+import enum
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from . import metrics
+
+__all__ = [
+    "FailureKind",
+    "NegativeCache",
+]
+
+
+class FailureKind(enum.Enum):
+    """Why looking something up on a platform failed in a way that retrying straight away won't fix."""
+    # The track doesn't exist, for example because it was deleted
+    NOT_FOUND = "not_found"
+    # The track exists, but we aren't allowed to see it, such as private videos
+    PRIVATE = "private"
+    # Searching for the track found nothing
+    NO_MATCH = "no_match"
+
+
+class NegativeCache:
+    """Remembers lookups that failed for a short while, so that they can be turned away without any requests.
+
+    Failures are kept per platform, and for as long as ``ttls`` says for their kind of failure, a kind missing from
+    it is not remembered at all. Lookups of different things, such as a track id and a search query, are told apart
+    by ``lookup``.
+    """
+
+    def __init__(self, ttls: Mapping[FailureKind, float], *, max_size: int = 4096):
+        self.ttls = ttls
+        self.max_size = max_size
+        self._failures: OrderedDict[tuple[str, str, str], tuple[float, FailureKind]] = OrderedDict()
+
+    def get(self, platform: str, lookup: str, key: str) -> FailureKind | None:
+        cache_key = (platform, lookup, key)
+        if (entry := self._failures.get(cache_key)) is None:
+            return None
+        expires_at, kind = entry
+        if expires_at < time.monotonic():
+            del self._failures[cache_key]
+            return None
+        metrics.negative_cache_hits.inc(platform=platform, kind=kind.value)
+        return kind
+
+    def add(self, platform: str, lookup: str, key: str, kind: FailureKind) -> None:
+        if (ttl := self.ttls.get(kind, 0)) <= 0 or self.max_size <= 0:
+            return
+        cache_key = (platform, lookup, key)
+        self._failures[cache_key] = (time.monotonic() + ttl, kind)
+        self._failures.move_to_end(cache_key)
+        while len(self._failures) > self.max_size:
+            self._failures.popitem(last=False)
+
+    def clear(self) -> None:
+        self._failures.clear()
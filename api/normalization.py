@@ -0,0 +1,140 @@
+import re
+import unicodedata
+from collections.abc import Iterable
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .abc import UniversalTrack
+
+__all__ = [
+    "fold",
+    "clean_artist_name",
+    "split_title",
+    "clean_title",
+    "canonical_key",
+    "search_query",
+]
+
+# Words that only describe which release or upload of a track it is, not which track it is
+_NOISE_PATTERN = re.compile(
+    r"\b(?:"
+    r"official|music\s+video|lyric\s+video|lyrics?|audio|video|visuali[sz]er|hd|hq|4k|explicit|clean|"
+    r"(?:\d{4}\s+)?(?:digital(?:ly)?\s+)?remaster(?:ed)?(?:\s+version)?(?:\s+\d{4})?|"
+    r"live(?:\s+(?:at|from|in|on)\b.*)?|mono|stereo|radio\s+edit|single\s+version|album\s+version"
+    r")\b",
+    re.IGNORECASE,
+)
+_FEATURING_PATTERN = re.compile(r"^(?:feat\.?|ft\.?|featuring)\s+(?P<artists>.+)$", re.IGNORECASE)
+_INLINE_FEATURING_PATTERN = re.compile(r"\s+(?:feat\.?|ft\.?|featuring)\s+(?P<artists>.+)$", re.IGNORECASE)
+_BRACKETED_PATTERN = re.compile(r"\s*[(\[](?P<inner>[^)\]]*)[)\]]")
+_ARTIST_SEPARATOR_PATTERN = re.compile(r"\s*(?:,|&|\band\b)\s*", re.IGNORECASE)
+# YouTube's auto-generated channels are named "<artist> - Topic", and label run ones are "<artist>VEVO"
+_CHANNEL_NOISE_PATTERN = re.compile(r"(?:\s+-\s+topic|\s*vevo)$", re.IGNORECASE)
+_NON_WORD_PATTERN = re.compile(r"[\W_]+")
+
+
+def fold(text: str) -> str:
+    """Lowercases text and strips it of diacritics and compatibility characters, so that "Ｂéyoncé" is "beyonce"."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def _is_noise(text: str) -> bool:
+    # Years and punctuation are left behind by things like "Remastered 2011", and don't make it a different track
+    return not _NON_WORD_PATTERN.sub("", re.sub(r"\d", "", _NOISE_PATTERN.sub("", text)))
+
+
+def _split_artists(text: str) -> list[str]:
+    return [artist for artist in _ARTIST_SEPARATOR_PATTERN.split(text.strip()) if artist]
+
+
+def clean_artist_name(name: str) -> str:
+    """Removes YouTube channel noise such as " - Topic" and "VEVO" from an artist's name."""
+    return _CHANNEL_NOISE_PATTERN.sub("", name.strip()) or name.strip()
+
+
+def split_title(title: str, artist_names: Iterable[str] = ()) -> tuple[str, list[str]]:
+    """Removes everything from a title that doesn't identify the track, and returns it along with any featured artists.
+
+    Bracketed parts and " - " suffixes are removed if they only contain noise, such as "(Official Video)" or
+    "- Remastered 2011", or if they name featured artists, while parts like "(Taylor's Version)" are kept.
+    If the title starts with an "<artist> - " prefix naming one of ``artist_names``, the part after it is always
+    kept, since it's the track's actual title even if it's a noise word, such as "Taylor Swift - Clean".
+    """
+    featured: list[str] = []
+
+    def replace_bracketed(match: re.Match) -> str:
+        inner = match.group("inner").strip()
+        if featuring := _FEATURING_PATTERN.match(inner):
+            featured.extend(_split_artists(featuring.group("artists")))
+            return ""
+        return "" if _is_noise(inner) else match.group(0)
+
+    cleaned = _BRACKETED_PATTERN.sub(replace_bracketed, title)
+
+    parts = cleaned.split(" - ")
+    artist_keys = _artist_keys(artist_names)
+    kept_parts = 2 if len(parts) > 1 and _is_artist_prefix(parts[0], artist_keys) else 1
+    while len(parts) > kept_parts:
+        suffix = parts[-1].strip()
+        if featuring := _FEATURING_PATTERN.match(suffix):
+            featured.extend(_split_artists(featuring.group("artists")))
+        elif not _is_noise(suffix):
+            break
+        parts.pop()
+    cleaned = " - ".join(parts)
+
+    if featuring := _INLINE_FEATURING_PATTERN.search(cleaned):
+        featured.extend(_split_artists(featuring.group("artists")))
+        cleaned = cleaned[:featuring.start()]
+
+    cleaned = " ".join(cleaned.split())
+    # A title that is nothing but noise is better left as it is than emptied
+    return cleaned or title.strip(), featured
+
+
+def clean_title(title: str, artist_names: Iterable[str] = ()) -> str:
+    """Like :func:`split_title`, but also removes an "<artist> - " prefix, as is common in YouTube video titles."""
+    artist_names = list(artist_names)
+    cleaned, _ = split_title(title, artist_names)
+    prefix, separator, rest = cleaned.partition(" - ")
+    if separator and rest and _is_artist_prefix(prefix, _artist_keys(artist_names)):
+        return rest.strip()
+    return cleaned
+
+
+def _artist_keys(artist_names: Iterable[str]) -> set[str]:
+    return {_artist_key(clean_artist_name(name)) for name in artist_names}
+
+
+def _is_artist_prefix(prefix: str, artist_keys: set[str]) -> bool:
+    if not artist_keys:
+        return False
+    return _artist_key(prefix) in artist_keys or all(
+        _artist_key(artist) in artist_keys for artist in _split_artists(prefix)
+    )
+
+
+def _artist_key(name: str) -> str:
+    # Spaces are dropped too, since channel names like "TaylorSwiftVEVO" don't have any
+    return _NON_WORD_PATTERN.sub("", fold(name))
+
+
+def canonical_key(track: "UniversalTrack") -> str:
+    """A key which is the same for different releases and uploads of the same track.
+
+    It's made up of the folded title without any noise, and the set of every artist on the track,
+    including those only mentioned as featured in the title, so that their order doesn't matter.
+    """
+    artists = [clean_artist_name(name) for name in track.artist_names]
+    _, featured = split_title(track.title, artists)
+    title = clean_title(track.title, artists)
+    artist_keys = sorted({key for name in (*artists, *featured) if (key := _artist_key(name))})
+    title_key = " ".join(_NON_WORD_PATTERN.sub(" ", fold(title)).split())
+    return f"{title_key}|{','.join(artist_keys)}"
+
+
+def search_query(track: "UniversalTrack") -> str:
+    """A search query for a track, without any of the noise that would throw off searches on other platforms."""
+    artists = [clean_artist_name(name) for name in track.artist_names]
+    return unicodedata.normalize("NFKC", " ".join((clean_title(track.title, artists), *artists)))
@@ -1,8 +1,9 @@
 import re
 import urllib.parse
 
-from ..abc import AbstractAPI, UniversalTrack
+from ..abc import AbstractAPI, UniversalTrack, UrlPattern
 from ..errors import InvalidURLError
+from ..routing import match_url
 
 
 def beatsaver_map_to_universal(custom_map: dict) -> UniversalTrack:
@@ -15,20 +16,25 @@ def beatsaver_map_to_universal(custom_map: dict) -> UniversalTrack:
 
 class BeatSaverAPI(AbstractAPI):
     api_base = "https://api.beatsaver.com"
+    URL_PATTERNS = (
+        UrlPattern("track", ("beatsaver.com",), re.compile(r"/maps/([a-z0-9]+)")),
+    )
 
     def get_track_id(self, video_url: str, /) -> str:
-        if matches := re.match(r"^(?:https?://)?beatsaver.com/maps([a-z0-9]+)", video_url):
-            return matches[0]
+        if map_id := match_url(video_url, self.URL_PATTERNS, "track"):
+            return map_id
         else:
             raise InvalidURLError("Invalid beatsaver map url")
 
     async def track_from_id(self, track_id: str) -> UniversalTrack | None:
-        async with self.session.get(f"{self.api_base}/maps/id/{track_id}") as response:
-            map_metadata = (await response.json())["metadata"]
-            return beatsaver_map_to_universal(map_metadata)
+        async with self.request("GET", f"{self.api_base}/maps/id/{track_id}") as response:
+            if response.status == 404:
+                return None
+            return beatsaver_map_to_universal(await response.json())
 
     async def search_tracks(self, query: str) -> list[UniversalTrack] | None:
-        async with self.session.get(
+        async with self.request(
+            "GET",
             f"{self.api_base}/search/text/0?sortOrder=Rating&q={urllib.parse.quote(query)}",
         ) as response:
             maps = (await response.json())["docs"]
@@ -1,40 +1,88 @@
+import asyncio
+import math
 import re
-from datetime import timedelta, datetime
 
-from ..abc import AbstractOAuthAPI, UniversalTrack, UniversalAlbum, AbstractPlaylistAPI, UniversalPlaylist
+import aiohttp
+
+from ..abc import (
+    AbstractOAuthAPI, UniversalTrack, UniversalAlbum, AbstractPlaylistAPI, UniversalPlaylist, UrlPattern,
+    PlaylistTracks
+)
+from ..batching import MicroBatcher
 from ..errors import InvalidURLError
+from ..ratelimit import RateLimiter
+from ..routing import match_url
+
+
+def get_best_image_url(images: list[dict]) -> str | None:
+    if not images:
+        return None
+    return max(images, key=lambda image: (image.get("width") or 0) * (image.get("height") or 0))["url"]
+
+
+def spotify_album_to_universal(album: dict) -> UniversalAlbum:
+    return UniversalAlbum(
+        title=album["name"],
+        artist_names=[artist["name"] for artist in album["artists"]],
+        url=album["external_urls"].get("spotify"),
+        cover_url=get_best_image_url(album["images"]),
+        release_date=album["release_date"],
+    )
 
 
 def spotify_track_to_universal(track: dict) -> UniversalTrack:
+    album = track.get("album", {})
     return UniversalTrack(
         title=track["name"],
         artist_names=[artist["name"] for artist in track["artists"]],
-        album=UniversalAlbum(
-            title=album["name"],
-            artist_names=[artist["name"] for artist in album["artists"]],
-            url=album["external_urls"].get("spotify"),
-            cover_url=max(
-                album["images"],
-                key=lambda image: image.get("width", 0) * image.get("height", 0)
-            )["url"],
-            release_date=album["release_date"],
-        ) if (album := track.get("album", {})).get("album_type") == "album" else None,
+        album=spotify_album_to_universal(album) if album.get("album_type") == "album" else None,
         url=track["external_urls"].get("spotify"),
-        cover_url=max(
-            track["album"]["images"],
-            key=lambda image: image.get("width", 0) * image.get("height", 0)
-        )["url"]
+        cover_url=get_best_image_url(album.get("images")),
+        isrc=track.get("external_ids", {}).get("isrc"),
+        duration_ms=track.get("duration_ms"),
     )
 
 
+def spotify_playlist_items_to_universal(items: list[dict]) -> list[UniversalTrack]:
+    return [
+        spotify_track_to_universal(item["track"])
+        for item in items
+        if not item["is_local"] and item["track"] and item["track"].get("type") == "track"
+    ]
+
+
 class SpotifyAPI(AbstractOAuthAPI, AbstractPlaylistAPI):
     API_BASE = "https://api.spotify.com/v1"
+    TOKEN_URL = "https://accounts.spotify.com/api/token"
+    URL_PATTERNS = (
+        # Track ids are always 22 base62 characters, anything else would fail the whole batch it's looked up in
+        UrlPattern("track", ("open.spotify.com",), re.compile(r"/(?:intl-[a-z]+/)?track/([a-zA-Z0-9]{22})\b")),
+        UrlPattern("playlist", ("open.spotify.com",), re.compile(r"/(?:intl-[a-z]+/)?playlist/([a-zA-Z0-9]+)")),
+    )
+    RATE_LIMIT = (5, 10)
+    # The most ids the /tracks endpoint accepts in one request
+    MAX_TRACKS_PER_REQUEST = 50
+
+    def __init__(
+        self,
+        *,
+        client_id: str,
+        client_secret: str,
+        session: aiohttp.ClientSession,
+        rate_limiter: RateLimiter | None = None,
+    ):
+        super().__init__(client_id=client_id, client_secret=client_secret, session=session, rate_limiter=rate_limiter)
+        # Lookups from concurrent conversions are merged into a single request to the /tracks endpoint
+        self._track_batcher = MicroBatcher(self.tracks_from_ids, max_size=self.MAX_TRACKS_PER_REQUEST)
 
-    async def refresh_access_token(self):
-        if not self.should_update_token:
-            return
-        async with self.session.post(
-            "https://accounts.spotify.com/api/token",
+    async def close(self) -> None:
+        await self._track_batcher.close()
+        await super().close()
+
+    async def fetch_access_token(self) -> tuple[str, float]:
+        async with self.request(
+            "POST",
+            self.TOKEN_URL,
             data={
                 "grant_type": "client_credentials",
                 "client_id": self.client_id,
@@ -44,30 +92,51 @@ class SpotifyAPI(AbstractOAuthAPI, AbstractPlaylistAPI):
             data = await response.json()
             if data.get("error") == "invalid_client":
                 raise ValueError("Invalid spotify client id or secret")
-            self._token = data["access_token"]
-            self._token_expires_at = datetime.now() + timedelta(seconds=data["expires_in"])
+            return data["access_token"], data["expires_in"]
 
     def get_track_id(self, track_url: str) -> str:
-        if matches := re.match(r"https?://open\.spotify\.com/track/(\w+)", track_url, flags=re.ASCII):
-            return matches[1]
+        if track_id := match_url(track_url, self.URL_PATTERNS, "track"):
+            return track_id
         else:
             raise InvalidURLError("Invalid Spotify track url")
 
     async def track_from_id(self, track_id: str) -> UniversalTrack | None:
-        async with self.session.get(
-            f"{self.API_BASE}/tracks/{track_id}",
-            headers={"Authorization": f"Bearer {self._token}"}
+        return await self._track_batcher.submit(track_id)
+
+    async def tracks_from_ids(self, track_ids: list[str]) -> list[UniversalTrack | None]:
+        tracks: list[UniversalTrack | None] = []
+        for i in range(0, len(track_ids), self.MAX_TRACKS_PER_REQUEST):
+            tracks.extend(await self._fetch_tracks(track_ids[i:i + self.MAX_TRACKS_PER_REQUEST]))
+        return tracks
+
+    async def _fetch_tracks(self, track_ids: list[str]) -> list[UniversalTrack | None]:
+        async with self.authorized_request(
+            "GET",
+            f"{self.API_BASE}/tracks",
+            params={"ids": ",".join(track_ids)}
         ) as response:
             if response.status == 401:
                 raise RuntimeError("Invalid spotify token")
-            elif response.status != 200:
+            elif response.status == 200:
+                return [
+                    spotify_track_to_universal(track) if track else None
+                    for track in (await response.json())["tracks"]
+                ]
+            elif response.status != 400:
                 raise RuntimeError("Could not get track data")
-            return spotify_track_to_universal(await response.json())
+        if len(track_ids) == 1:
+            return [None]
+        # One invalid id gets the whole request rejected, so each id is looked up on its own to leave out just that one
+        return [
+            track
+            for tracks in await asyncio.gather(*(self._fetch_tracks([track_id]) for track_id in track_ids))
+            for track in tracks
+        ]
 
     async def search_tracks(self, query: str) -> list[UniversalTrack] | None:
-        async with self.session.get(
+        async with self.authorized_request(
+            "GET",
             f"{self.API_BASE}/search",
-            headers={"Authorization": f"Bearer {self._token}"},
             params={"q": query, "type": "track"}
         ) as response:
             if response.status == 401:
@@ -78,16 +147,31 @@ class SpotifyAPI(AbstractOAuthAPI, AbstractPlaylistAPI):
 
         return [spotify_track_to_universal(track) for track in tracks]
 
+    SUPPORTS_ISRC_LOOKUP = True
+
+    async def track_from_isrc(self, isrc: str) -> UniversalTrack | None:
+        async with self.authorized_request(
+            "GET",
+            f"{self.API_BASE}/search",
+            params={"q": f"isrc:{isrc}", "type": "track", "limit": 1}
+        ) as response:
+            if response.status == 401:
+                raise RuntimeError("Invalid spotify token")
+            elif response.status != 200:
+                return None
+            tracks = (await response.json())["tracks"]["items"]
+        return spotify_track_to_universal(tracks[0]) if tracks else None
+
     def get_playlist_id(self, playlist_url: str) -> str:
-        if matches := re.match(r"https?://open\.spotify\.com/playlist/(\w+)", playlist_url, flags=re.ASCII):
-            return matches[1]
+        if playlist_id := match_url(playlist_url, self.URL_PATTERNS, "playlist"):
+            return playlist_id
         else:
-            raise InvalidURLError("Invalid Spotify track url")
+            raise InvalidURLError("Invalid Spotify playlist url")
 
     async def get_playlist_content(self, playlist_id: str) -> UniversalPlaylist | None:
-        async with self.session.get(
+        async with self.authorized_request(
+            "GET",
             f"{self.API_BASE}/playlists/{playlist_id}",
-            headers={"Authorization": f"Bearer {self._token}"}
         ) as response:
             if response.status == 401:
                 raise RuntimeError("Invalid spotify token")
@@ -95,15 +179,30 @@ class SpotifyAPI(AbstractOAuthAPI, AbstractPlaylistAPI):
                 return None
             playlist = await response.json()
 
+        page_size = playlist["tracks"]["limit"] or len(playlist["tracks"]["items"]) or 1
+
+        async def fetch_page(index: int) -> list[UniversalTrack]:
+            async with self.authorized_request(
+                "GET",
+                f"{self.API_BASE}/playlists/{playlist_id}/tracks",
+                params={"offset": index * page_size, "limit": page_size}
+            ) as page_response:
+                if page_response.status == 401:
+                    raise RuntimeError("Invalid spotify token")
+                elif page_response.status != 200:
+                    raise RuntimeError("Could not get playlist tracks")
+                return spotify_playlist_items_to_universal((await page_response.json())["items"])
+
         return UniversalPlaylist(
             name=playlist["name"],
             description=playlist.get("description"),
             owner_names=[owner] if (owner := playlist["owner"].get("display_name")) else None,
             url=playlist["external_urls"]["spotify"],
             cover_url=playlist["images"][0]["url"],
-            tracks=[
-                spotify_track_to_universal(track["track"])
-                for track in playlist["tracks"]["items"]
-                if not track["is_local"] and track["track"].get("type") == "track"
-            ]
+            tracks=PlaylistTracks(
+                fetch_page,
+                first_page=spotify_playlist_items_to_universal(playlist["tracks"]["items"]),
+                total=playlist["tracks"]["total"],
+                page_count=math.ceil(playlist["tracks"]["total"] / page_size),
+            )
         )
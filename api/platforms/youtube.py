@@ -1,10 +1,10 @@
 import re
 
-# noinspection PyFromFutureImport
-from youtubesearchpython.__future__ import VideosSearch, Video, Playlist
+from ..abc import AbstractAPI, UniversalTrack, AbstractPlaylistAPI, UniversalPlaylist, UrlPattern, PlaylistTracks
+from ..errors import InvalidURLError, PrivateTrackError
+from ..routing import match_url
 
-from ..abc import AbstractAPI, UniversalTrack, AbstractPlaylistAPI, UniversalPlaylist
-from ..errors import InvalidURLError
+YOUTUBE_HOSTS = ("youtube.com", "www.youtube.com", "m.youtube.com", "music.youtube.com")
 
 
 def get_best_thumbnail(thumbnails: list[dict]) -> dict:
@@ -14,76 +14,230 @@ def get_best_thumbnail(thumbnails: list[dict]) -> dict:
     )
 
 
-def youtube_video_to_universal(video: dict) -> UniversalTrack:
+def get_best_thumbnail_url(thumbnails: list[dict]) -> str | None:
+    return get_best_thumbnail(thumbnails)["url"] if thumbnails else None
+
+
+def parse_duration_ms(duration: str | None) -> int | None:
+    """Parses durations such as "3:45" or "1:02:03" into milliseconds."""
+    if not duration:
+        return None
+    seconds = 0
+    for part in duration.split(":"):
+        if not part.isdigit():
+            return None
+        seconds = seconds * 60 + int(part)
+    return seconds * 1000
+
+
+def get_text(text: dict | None) -> str | None:
+    """Gets the plain text out of InnerTube's text objects, which are either a simpleText or a list of runs."""
+    if not text:
+        return None
+    if "simpleText" in text:
+        return text["simpleText"]
+    return "".join(run["text"] for run in text.get("runs", ())) or None
+
+
+def get_watch_url(video_id: str) -> str:
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+
+def youtube_video_renderer_to_universal(renderer: dict) -> UniversalTrack:
+    """Parses the videoRenderer and playlistVideoRenderer objects found in search results and playlists."""
+    length_seconds = renderer.get("lengthSeconds")
+    return UniversalTrack(
+        title=get_text(renderer["title"]),
+        artist_names=[get_text(
+            renderer.get("ownerText") or renderer.get("longBylineText") or renderer.get("shortBylineText")
+        ) or ""],
+        url=get_watch_url(renderer["videoId"]),
+        cover_url=get_best_thumbnail_url(renderer.get("thumbnail", {}).get("thumbnails")),
+        duration_ms=(
+            int(length_seconds) * 1000
+            if length_seconds and length_seconds.isdigit()
+            else parse_duration_ms(get_text(renderer.get("lengthText")))
+        ),
+    )
+
+
+def youtube_video_details_to_universal(details: dict) -> UniversalTrack:
+    """Parses the videoDetails object returned by the player endpoint."""
+    length_seconds = details.get("lengthSeconds")
     return UniversalTrack(
-        title=video["title"],
-        artist_names=[video["channel"]["name"]],
-        url=video["link"],
-        cover_url=get_best_thumbnail(video["thumbnails"])["url"],
+        title=details["title"],
+        artist_names=[details["author"]],
+        url=get_watch_url(details["videoId"]),
+        cover_url=get_best_thumbnail_url(details.get("thumbnail", {}).get("thumbnails")),
+        duration_ms=int(length_seconds) * 1000 if length_seconds and length_seconds.isdigit() else None,
     )
 
 
+def parse_playlist_items(items: list[dict]) -> tuple[list[UniversalTrack], str | None]:
+    """Parses a page of playlist items, returning its tracks and the continuation token for the next page."""
+    tracks = []
+    continuation = None
+    for item in items:
+        if (renderer := item.get("playlistVideoRenderer")) is not None:
+            # Deleted and private videos are still listed, but without a duration or byline
+            if renderer.get("isPlayable", True):
+                tracks.append(youtube_video_renderer_to_universal(renderer))
+        elif (renderer := item.get("continuationItemRenderer")) is not None:
+            continuation = renderer["continuationEndpoint"]["continuationCommand"]["token"]
+    return tracks, continuation
+
+
 class YoutubeAPI(AbstractAPI, AbstractPlaylistAPI):
+    URL_PATTERNS = (
+        UrlPattern("track", YOUTUBE_HOSTS, re.compile(r"/watch\?(?:\S*&)?v=([a-zA-Z0-9_\-]+)", flags=re.ASCII)),
+        UrlPattern("track", ("youtu.be",), re.compile(r"/([a-zA-Z0-9_\-]+)", flags=re.ASCII)),
+        UrlPattern("playlist", YOUTUBE_HOSTS, re.compile(r"/playlist\?(?:\S*&)?list=([a-zA-Z0-9_\-]+)", flags=re.ASCII)),
+    )
+    INNERTUBE_BASE = "https://www.youtube.com/youtubei/v1"
+    # Identifies us as YouTube's own web client, the version only has to be recent enough to be accepted
+    INNERTUBE_CLIENT_ID = "1"
+    INNERTUBE_CONTEXT = {
+        "client": {
+            "clientName": "WEB",
+            "clientVersion": "2.20240726.00.00",
+            "hl": "en",
+            "gl": "US",
+        },
+    }
+    # Restricts searches to videos, leaving out channels, playlists and shorts shelves
+    SEARCH_VIDEOS_PARAMS = "EgIQAQ=="
+    # The player endpoint mostly returns streaming data we have no use for, so we ask for just the video details
+    PLAYER_FIELD_MASK = ",".join((
+        *(f"videoDetails.{field}" for field in ("videoId", "title", "author", "lengthSeconds", "thumbnail")),
+        "playabilityStatus.status",
+    ))
+    # Statuses the player endpoint gives videos that exist but can't be watched without an account, if at all
+    PRIVATE_PLAYABILITY_STATUSES = ("LOGIN_REQUIRED", "UNPLAYABLE")
+
     def get_track_id(self, track_url: str) -> str:
-        if matches := re.match(
-            r"""
-            ^(?:https?://)?             # optionaly matches "http://" or "https://"
-            (?:
-                (?:(?:www|music)\.)?    # optionaly the subdomains "www." or "music."
-                youtube\.com/watch\?v=  # matches "youtube.com/watch?v="
-                |
-                youtu\.be/              # matches "youtu.be/", but NOT with a subdomain
-            )([a-zA-Z0-9_\-]+)          # matches the video id
-            """,
-            track_url,
-            flags=re.ASCII | re.VERBOSE,
-        ):
-            return matches[0]
+        if video_id := match_url(track_url, self.URL_PATTERNS, "track"):
+            return video_id
         else:
             raise InvalidURLError("Invalid Youtube video url")
 
+    def is_equivalent_to(self, other: AbstractAPI) -> bool:
+        # YouTube Music is YouTube with a different look, they have the same videos
+        return isinstance(other, YoutubeAPI) and other is not self
+
+    def adopt_track(self, track: UniversalTrack) -> UniversalTrack:
+        return track.replace(url=get_watch_url(match_url(track.url, YoutubeAPI.URL_PATTERNS, "track")))
+
+    async def _innertube(self, endpoint: str, body: dict, *, field_mask: str | None = None) -> dict | None:
+        """Calls an endpoint of InnerTube, the internal API used by YouTube's own web client."""
+        headers = {
+            "X-YouTube-Client-Name": self.INNERTUBE_CLIENT_ID,
+            "X-YouTube-Client-Version": self.INNERTUBE_CONTEXT["client"]["clientVersion"],
+        }
+        if field_mask is not None:
+            headers["X-Goog-FieldMask"] = field_mask
+        async with self.request(
+            "POST",
+            f"{self.INNERTUBE_BASE}/{endpoint}",
+            params={"prettyPrint": "false"},
+            headers=headers,
+            json={"context": self.INNERTUBE_CONTEXT, **body},
+            # Every endpoint we call only reads data, even though InnerTube wants them to be POSTed
+            idempotent=True,
+        ) as response:
+            if response.status != 200:
+                return None
+            return await response.json()
+
     async def track_from_id(self, track_id: str) -> UniversalTrack | None:
-        video = await Video.getInfo(track_id)
-        return youtube_video_to_universal(video)
+        data = await self._innertube("player", {"videoId": track_id}, field_mask=self.PLAYER_FIELD_MASK)
+        # Videos that don't exist still get a response, so this is the request itself failing
+        if data is None:
+            raise RuntimeError("Could not get video details")
+        # Age restricted videos also require logging in, but they still come with their details
+        if "videoDetails" not in data:
+            if data.get("playabilityStatus", {}).get("status") in self.PRIVATE_PLAYABILITY_STATUSES:
+                raise PrivateTrackError(f"Youtube video {track_id} is private")
+            return None
+        return youtube_video_details_to_universal(data["videoDetails"])
 
     async def search_tracks(self, query: str) -> list[UniversalTrack] | None:
-        videos = filter(
-            lambda vid: vid["type"] == "video",
-            (await VideosSearch(query).next())["result"],
+        data = await self._innertube("search", {"query": query, "params": self.SEARCH_VIDEOS_PARAMS})
+        if data is None:
+            return None
+        sections = (
+            data.get("contents", {})
+            .get("twoColumnSearchResultsRenderer", {})
+            .get("primaryContents", {})
+            .get("sectionListRenderer", {})
+            .get("contents", ())
         )
-        return [youtube_video_to_universal(video) for video in videos]
+        return [
+            youtube_video_renderer_to_universal(item["videoRenderer"])
+            for section in sections
+            for item in section.get("itemSectionRenderer", {}).get("contents", ())
+            if "videoRenderer" in item
+        ]
 
     def get_playlist_id(self, playlist_url: str) -> str:
-        if matches := re.match(
-            r"""
-            ^(?:https?://)?         # optionaly matches "http://" or "https://"
-            (?:(?:www|music)\.)?    # optionaly the subdomains "www." or "music."
-            youtube\.com/               
-            playlist\?list=
-            ([a-zA-Z0-9_\-]+)       # matches the playlist id
-            """,
-            playlist_url,
-            flags=re.ASCII | re.VERBOSE,
-        ):
-            return matches[1]
+        if playlist_id := match_url(playlist_url, self.URL_PATTERNS, "playlist"):
+            return playlist_id
         else:
             raise InvalidURLError("Invalid Youtube playlist url")
 
     async def get_playlist_content(self, playlist_id: str) -> UniversalPlaylist | None:
-        # Only accepts a url so we fake it
-        # https://github.com/alexmercerind/youtube-search-python/blob/fc12c05747f1f7bd89d71699403762b86b523da5/youtubesearchpython/core/playlist.py#L88
-        playlist: dict = await Playlist.get(f"list={playlist_id}")
-        playlist_info = playlist["info"]
+        data = await self._innertube("browse", {"browseId": f"VL{playlist_id}"})
+        if data is None or "sidebar" not in data:
+            return None
+
+        sidebar_items = data["sidebar"]["playlistSidebarRenderer"]["items"]
+        info = sidebar_items[0]["playlistSidebarPrimaryInfoRenderer"]
+        owner = next((
+            get_text(item["playlistSidebarSecondaryInfoRenderer"]["videoOwner"]["videoOwnerRenderer"]["title"])
+            for item in sidebar_items[1:]
+            if "videoOwner" in item.get("playlistSidebarSecondaryInfoRenderer", {})
+        ), None)
+        thumbnail_renderer = info.get("thumbnailRenderer", {})
+        thumbnails = (
+            thumbnail_renderer.get("playlistVideoThumbnailRenderer")
+            or thumbnail_renderer.get("playlistCustomThumbnailRenderer")
+            or {}
+        ).get("thumbnail", {}).get("thumbnails")
+        # The first stat is the number of videos, such as "1,234 videos"
+        video_count = (get_text(info["stats"][0]) or "").split(" ")[0].replace(",", "") if info.get("stats") else ""
+
+        video_list = (
+            data["contents"]["twoColumnBrowseResultsRenderer"]["tabs"][0]["tabRenderer"]["content"]
+            ["sectionListRenderer"]["contents"][0]["itemSectionRenderer"]["contents"][0]
+            .get("playlistVideoListRenderer", {})
+        )
+        first_page, continuation = parse_playlist_items(video_list.get("contents", []))
+
+        # noinspection PyUnusedLocal
+        async def fetch_page(index: int) -> list[UniversalTrack] | None:
+            # YouTube pages through playlists with continuation tokens, so pages can only be fetched in order
+            nonlocal continuation
+            if continuation is None:
+                return None
+            page_data = await self._innertube("browse", {"continuation": continuation})
+            if page_data is None:
+                raise RuntimeError("Could not get playlist videos")
+            items = next((
+                action["appendContinuationItemsAction"]["continuationItems"]
+                for action in page_data.get("onResponseReceivedActions", ())
+                if "appendContinuationItemsAction" in action
+            ), [])
+            tracks, continuation = parse_playlist_items(items)
+            return tracks
 
         return UniversalPlaylist(
-            name=playlist_info["title"],
-            # There actually is no description, but if there was then this is where it'd be at
-            description=playlist_info.get("description"),
-            owner_names=[channel_name] if (channel_name := playlist_info.get("channel", {}).get("name")) else None,
-            url=playlist_info["link"],
-            cover_url=get_best_thumbnail(playlist_info["thumbnails"])["url"],
-            tracks=[
-                youtube_video_to_universal(video)
-                for video in playlist["videos"]
-            ]
-        )
\ No newline at end of file
+            name=get_text(info["title"]),
+            description=get_text(info.get("description")),
+            owner_names=[owner] if owner else None,
+            url=f"https://www.youtube.com/playlist?list={playlist_id}",
+            cover_url=get_best_thumbnail_url(thumbnails),
+            tracks=PlaylistTracks(
+                fetch_page,
+                first_page=first_page,
+                total=int(video_count) if video_count.isdigit() else None,
+            )
+        )
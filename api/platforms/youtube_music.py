@@ -1,23 +1,33 @@
 import re
 
 from .youtube import YoutubeAPI
-from ..abc import UniversalTrack
+from ..abc import UniversalTrack, UrlPattern
 from ..errors import InvalidURLError
+from ..routing import match_url
+
+
+def to_youtube_music_url(url: str) -> str:
+    return re.sub(r"^https?://(www\.)?(youtu\.be|youtube\.[a-z]+)", "https://music.youtube.com", url)
 
 
 class YoutubeMusicAPI(YoutubeAPI):
+    # Both are served by the same backend
+    RATE_LIMIT_KEY = "YoutubeAPI"
+    URL_PATTERNS = (
+        UrlPattern("track", ("music.youtube.com",), re.compile(r"/watch\?(?:\S*&)?v=([a-zA-Z0-9_\-]+)", flags=re.ASCII)),
+        *(pattern for pattern in YoutubeAPI.URL_PATTERNS if pattern.kind == "playlist"),
+    )
+
     def get_track_id(self, track_url: str) -> str:
-        if matches := re.match(
-            r"^(?:https?://)?music\.youtube\.com/watch\?v=([a-zA-Z0-9_\-]+)",
-            track_url,
-            flags=re.ASCII,
-        ):
-            return matches[0]
+        if video_id := match_url(track_url, self.URL_PATTERNS, "track"):
+            return video_id
         else:
             raise InvalidURLError("Invalid Youtube Music url")
 
+    def adopt_track(self, track: UniversalTrack) -> UniversalTrack:
+        return track.replace(url=to_youtube_music_url(track.url))
+
     async def search_tracks(self, query: str) -> list[UniversalTrack] | None:
-        tracks = await super().search_tracks(query)
-        for track in tracks:
-            track.url = re.sub(r"^https?://(www\.)?(youtu\.be|youtube.[a-z]+)", "^https://music.youtube.com", track.url)
-        return tracks
+        if (tracks := await super().search_tracks(query)) is None:
+            return None
+        return [self.adopt_track(track) for track in tracks]
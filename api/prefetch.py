@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import time
+from collections.abc import Collection, Hashable, Iterable
+
+from . import metrics
+from .abc import UniversalTrack
+from .converter import TrackConverter
+from .ratelimit import Priority, request_priority
+from .routing import Route
+
+__all__ = [
+    "Prefetcher",
+]
+
+_logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """Warms the conversion cache in the background, so that conversions people ask for later are already done.
+
+    Prefetching is done at the lowest priority, and each guild may only start ``guild_budget`` conversions every
+    ``budget_window`` seconds, so that one busy guild can't use up the rate limits on its own.
+    """
+
+    def __init__(
+        self,
+        converter: TrackConverter,
+        *,
+        guild_budget: int = 30,
+        budget_window: float = 10 * 60,
+        max_concurrency: int = 4,
+    ):
+        self.converter = converter
+        self.guild_budget = guild_budget
+        self.budget_window = budget_window
+
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        # When each guild's current window started, and how much of its budget has been used in it
+        self._budgets: dict[Hashable, tuple[float, int]] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def _take_budget(self, guild_id: Hashable, amount: int) -> bool:
+        now = time.monotonic()
+        window_started_at, used = self._budgets.get(guild_id, (now, 0))
+        if now - window_started_at >= self.budget_window:
+            window_started_at, used = now, 0
+        if used + amount > self.guild_budget:
+            return False
+        self._budgets[guild_id] = (window_started_at, used + amount)
+        return True
+
+    def _spawn(self, coroutine) -> None:
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def prefetch_text(self, text: str, *, guild_id: Hashable, exclude: Collection[str] = ()) -> None:
+        """Starts converting every track URL in some text to every other platform, as far as the guild's budget goes.
+
+        Platforms in ``exclude`` are left out, for example because the text is already being converted to them.
+        """
+        for url in self.converter.router.find_urls(text):
+            if (route := self.converter.router.resolve(url, kind="track")) is None:
+                continue
+            targets = [
+                platform
+                for platform in self.converter.api_interfaces
+                if platform != route.platform and platform not in exclude
+            ]
+            # Looking the track itself up is part of the first conversion, so it doesn't cost anything extra
+            if not targets or not self._take_budget(guild_id, len(targets)):
+                metrics.prefetches.inc(result="over_budget")
+                continue
+            self._spawn(self._prefetch(route, targets))
+
+    async def _prefetch(self, route: Route, targets: Iterable[str]) -> None:
+        request_priority.set(Priority.PREFETCH)
+        async with self._semaphore:
+            # Resolved first, so that every target conversion shares the one lookup
+            if await self._convert(route, route.platform) is None:
+                return
+            await asyncio.gather(*(self._convert(route, target) for target in targets))
+
+    async def _convert(self, route: Route, target_platform: str) -> UniversalTrack | None:
+        try:
+            track = await self.converter.convert(route.platform, route.id, target_platform)
+        except Exception:
+            metrics.prefetches.inc(result="error")
+            _logger.debug(f"Could not prefetch {route.platform} track {route.id} for {target_platform}", exc_info=True)
+            return None
+        metrics.prefetches.inc(result="warmed" if track is not None else "not_found")
+        return track
+
+    def warm_up(self, urls: Iterable[str]) -> None:
+        """Looks up the tracks behind some URLs in the background, without using any guild's budget."""
+        routes = [route for url in urls if (route := self.converter.router.resolve(url, kind="track")) is not None]
+        if routes:
+            self._spawn(self._warm_up(routes))
+
+    async def _warm_up(self, routes: list[Route]) -> None:
+        request_priority.set(Priority.PREFETCH)
+        started_at = time.perf_counter()
+
+        async def resolve(route: Route) -> None:
+            async with self._semaphore:
+                await self._convert(route, route.platform)
+
+        await asyncio.gather(*map(resolve, routes))
+        _logger.info(f"Warmed up {len(routes)} tracks in {time.perf_counter() - started_at:.1f}s")
+
+    async def close(self) -> None:
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,183 @@
+import asyncio
+import contextlib
+import contextvars
+import email.utils
+import enum
+import heapq
+import itertools
+import random
+import time
+from collections.abc import AsyncIterator
+from datetime import datetime, timezone
+
+import aiohttp
+
+__all__ = [
+    "Priority",
+    "request_priority",
+    "TokenBucket",
+    "RateLimiter",
+]
+
+
+class Priority(enum.IntEnum):
+    """The order in which requests waiting on a rate limit are let through, lowest first."""
+    INTERACTIVE = 0
+    PASSIVE = 1
+    # Work nobody has asked for yet, such as warming the conversion cache
+    PREFETCH = 2
+
+
+# Set by whatever kicks off a request, for example to INTERACTIVE when handling a command
+request_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar(
+    "request_priority",
+    default=Priority.PASSIVE,
+)
+
+
+class TokenBucket:
+    """A token bucket which hands out tokens to waiters in order of priority, then arrival."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._waiters: list[tuple[Priority, int]] = []
+        self._counter = itertools.count()
+        self._condition = asyncio.Condition()
+
+    def _seconds_until_available(self) -> float:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+        if (blocked_for := self._blocked_until - now) > 0:
+            return blocked_for
+        return 0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    async def acquire(self, priority: Priority = Priority.PASSIVE) -> None:
+        entry = (priority, next(self._counter))
+        async with self._condition:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    wait = self._seconds_until_available()
+                    if self._waiters[0] != entry:
+                        # Only the first waiter in line keeps an eye on the clock, everyone else waits their turn
+                        await self._condition.wait()
+                        continue
+                    if wait <= 0:
+                        heapq.heappop(self._waiters)
+                        self._tokens -= 1
+                        return
+                    with contextlib.suppress(asyncio.TimeoutError):
+                        await asyncio.wait_for(self._condition.wait(), timeout=wait)
+            except BaseException:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                raise
+            finally:
+                self._condition.notify_all()
+
+    async def block_for(self, seconds: float) -> None:
+        """Stops handing out tokens for a while, for example after being told to back off by a 429."""
+        async with self._condition:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._tokens = 0
+            self._condition.notify_all()
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Parses a Retry-After header, which is either a number of seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class RateLimiter:
+    """Rate limits requests made through a shared session, keeping a token bucket per platform.
+
+    Requests which are rate limited (429) block the whole bucket for as long as the Retry-After header says,
+    or with exponential backoff if it's missing, and are then retried. Idempotent requests are also retried on
+    server errors and connection failures, with jittered exponential backoff.
+    """
+
+    RETRIED_STATUSES = frozenset({429, 500, 502, 503, 504})
+    IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+    def __init__(self, *, max_retries: int = 3, base_backoff: float = 0.5, max_backoff: float = 30):
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._buckets: dict[str, TokenBucket] = {}
+
+    def bucket(self, key: str, *, rate: float, capacity: int) -> TokenBucket:
+        if (bucket := self._buckets.get(key)) is None:
+            bucket = self._buckets[key] = TokenBucket(rate, capacity)
+        return bucket
+
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter", so that retries from a burst of failed requests don't all land at the same time
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+
+    @contextlib.asynccontextmanager
+    async def request(
+        self,
+        session: aiohttp.ClientSession,
+        bucket: TokenBucket,
+        method: str,
+        url: str,
+        *,
+        idempotent: bool | None = None,
+        **kwargs,
+    ) -> AsyncIterator[aiohttp.ClientResponse]:
+        """Makes a request once the bucket lets it through, retrying it if it fails.
+
+        ``idempotent`` marks a request as safe to retry, or not, regardless of its method. For example, a POST that
+        only reads data.
+        """
+        retryable = idempotent if idempotent is not None else method.upper() in self.IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            await bucket.acquire(request_priority.get())
+            try:
+                response = await session.request(method, url, **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+
+            if (
+                response.status not in self.RETRIED_STATUSES
+                or attempt >= self.max_retries
+                or (response.status != 429 and not retryable)
+            ):
+                break
+
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            response.release()
+            if response.status == 429:
+                await bucket.block_for(retry_after if retry_after is not None else self._backoff(attempt))
+            else:
+                await asyncio.sleep(retry_after if retry_after is not None else self._backoff(attempt))
+            attempt += 1
+
+        try:
+            yield response
+        finally:
+            response.release()
@@ -0,0 +1,94 @@
+import re
+import urllib.parse
+from typing import NamedTuple
+
+from .abc import UrlPattern
+from .types import APIInterface
+
+__all__ = [
+    "UrlPattern",
+    "Route",
+    "UrlRouter",
+    "match_url",
+]
+
+# URLs wrapped in <> have their embeds suppressed, and are matched only so that they can be skipped
+MESSAGE_URL_REGEX = re.compile(r"<?https?:\S+>?")
+
+
+class Route(NamedTuple):
+    platform: str
+    kind: str
+    id: str
+
+
+def _split_url(url: str) -> tuple[str, str] | None:
+    if "://" not in url:
+        url = f"https://{url}"
+    try:
+        parts = urllib.parse.urlsplit(url)
+        hostname = parts.hostname
+    except ValueError:
+        return None
+    if parts.scheme not in ("http", "https") or not hostname:
+        return None
+    return hostname, f"{parts.path}?{parts.query}" if parts.query else parts.path
+
+
+def match_url(url: str, patterns: tuple[UrlPattern, ...], kind: str) -> str | None:
+    """Returns the id from the first pattern of the given kind that matches the URL, if any."""
+    if (split_url := _split_url(url)) is None:
+        return None
+    hostname, path = split_url
+    for pattern in patterns:
+        if pattern.kind == kind and hostname in pattern.hosts and (matches := pattern.path.match(path)):
+            return matches[1]
+    return None
+
+
+class UrlRouter:
+    """Maps URLs to the platform, kind and id they point to.
+
+    Built once from the active platforms, so that every URL only has to be split and looked up by its hostname
+    rather than being tried against every platform in turn.
+    """
+
+    def __init__(self, api_interfaces: dict[str, APIInterface]):
+        self._patterns_by_host: dict[str, list[tuple[str, UrlPattern]]] = {}
+        for platform, api_interface in api_interfaces.items():
+            for pattern in api_interface.URL_PATTERNS:
+                for host in pattern.hosts:
+                    self._patterns_by_host.setdefault(host, []).append((platform, pattern))
+
+    @staticmethod
+    def might_contain_urls(text: str) -> bool:
+        """A cheap check to rule out text which can't contain any URLs before doing any real work."""
+        return "http" in text
+
+    def find_urls(self, text: str) -> list[str]:
+        """Finds all URLs in a piece of text that are not wrapped in <>."""
+        if not self.might_contain_urls(text):
+            return []
+        return [
+            url
+            for url in MESSAGE_URL_REGEX.findall(text)
+            if not url.startswith("<") and not url.endswith(">")
+        ]
+
+    def resolve_all(self, url: str) -> list[Route]:
+        """Returns every route matching the URL, in the order the platforms were registered."""
+        if (split_url := _split_url(url)) is None:
+            return []
+        hostname, path = split_url
+        return [
+            Route(platform, pattern.kind, matches[1])
+            for platform, pattern in self._patterns_by_host.get(hostname, ())
+            if (matches := pattern.path.match(path))
+        ]
+
+    def resolve(self, url: str, *, kind: str | None = None, exclude: tuple[str, ...] = ()) -> Route | None:
+        """Returns the first route matching the URL, optionally only of a given kind and skipping some platforms."""
+        for route in self.resolve_all(url):
+            if (kind is None or route.kind == kind) and route.platform not in exclude:
+                return route
+        return None
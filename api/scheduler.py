@@ -0,0 +1,178 @@
+import asyncio
+from collections import OrderedDict, deque
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any, TypeVar
+
+from . import metrics
+from .errors import QueueFullError
+from .ratelimit import Priority, request_priority
+
+__all__ = [
+    "ConversionScheduler",
+]
+
+T = TypeVar("T")
+
+
+class _Job:
+    __slots__ = ("function", "priority", "guild_id", "channel_id", "key", "future")
+
+    def __init__(
+        self,
+        function: Callable[[], Awaitable[Any]],
+        priority: Priority,
+        guild_id: Hashable,
+        channel_id: Hashable,
+        key: Hashable | None,
+    ):
+        self.function = function
+        self.priority = priority
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.key = key
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class ConversionScheduler:
+    """A bounded queue of conversions, worked through by a fixed number of workers.
+
+    Jobs are taken in order of priority. Within a priority, guilds take turns, and so do the channels within each
+    guild, so that one busy channel can't hold up everyone else. Jobs submitted with the same key while one is
+    still queued or running share its result instead of being queued again.
+
+    Once ``max_queued`` jobs are waiting, new jobs are dropped by raising :class:`QueueFullError`, unless a job of
+    a lower priority is queued, in which case the most recently queued of those is dropped to make room.
+    """
+
+    def __init__(self, *, workers: int = 8, max_queued: int = 100):
+        self.worker_count = max(1, workers)
+        self.max_queued = max_queued
+
+        # Priority -> guild -> channel -> jobs, where the guilds and channels are kept in the order they take turns
+        self._queues: dict[Priority, OrderedDict[Hashable, OrderedDict[Hashable, deque[_Job]]]] = {
+            priority: OrderedDict() for priority in Priority
+        }
+        self._jobs_by_key: dict[Hashable, _Job] = {}
+        self._queued_count = 0
+        self._ready = asyncio.Semaphore(0)
+        self._workers: list[asyncio.Task] = []
+
+    def __len__(self) -> int:
+        return self._queued_count
+
+    def start(self) -> None:
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.worker_count)]
+
+    async def submit(
+        self,
+        function: Callable[[], Awaitable[T]],
+        *,
+        priority: Priority = Priority.PASSIVE,
+        guild_id: Hashable = None,
+        channel_id: Hashable = None,
+        key: Hashable | None = None,
+    ) -> T:
+        """Queues ``function`` to be called by a worker, and waits for its result."""
+        if key is not None and (job := self._jobs_by_key.get(key)) is not None:
+            metrics.scheduled_jobs.inc(result="coalesced")
+            return await asyncio.shield(job.future)
+
+        evicted = False
+        if self._queued_count >= self.max_queued:
+            if not (evicted := self._evict_lower_than(priority)):
+                metrics.scheduled_jobs.inc(result="dropped")
+                raise QueueFullError("Too many conversions are queued")
+
+        job = _Job(function, priority, guild_id, channel_id, key)
+        self._queues[priority].setdefault(guild_id, OrderedDict()).setdefault(channel_id, deque()).append(job)
+        if key is not None:
+            self._jobs_by_key[key] = job
+        self._queued_count += 1
+        metrics.scheduler_queue_depth.inc(priority=priority.name.lower())
+        metrics.scheduled_jobs.inc(result="queued")
+        # An evicted job's permit is handed over to the job that took its place
+        if not evicted:
+            self._ready.release()
+        return await asyncio.shield(job.future)
+
+    def _evict_lower_than(self, priority: Priority) -> bool:
+        for lower_priority in sorted((p for p in Priority if p > priority), reverse=True):
+            guilds = self._queues[lower_priority]
+            if not guilds:
+                continue
+            # The newest job of the guild whose turn is furthest away has waited the least
+            guild_id, channels = next(reversed(guilds.items()))
+            channel_id, jobs = next(reversed(channels.items()))
+            job = jobs.pop()
+            self._remove_if_empty(lower_priority, guild_id, channel_id)
+            self._dequeued(job)
+            self._finished(job)
+            job.future.set_exception(QueueFullError("Dropped to make room for a more important conversion"))
+            # Marks the exception as retrieved, in case nobody is waiting on the job anymore
+            job.future.exception()
+            metrics.scheduled_jobs.inc(result="evicted")
+            return True
+        return False
+
+    def _remove_if_empty(self, priority: Priority, guild_id: Hashable, channel_id: Hashable) -> None:
+        channels = self._queues[priority][guild_id]
+        if not channels[channel_id]:
+            del channels[channel_id]
+        if not channels:
+            del self._queues[priority][guild_id]
+
+    def _dequeued(self, job: _Job) -> None:
+        self._queued_count -= 1
+        metrics.scheduler_queue_depth.dec(priority=job.priority.name.lower())
+
+    def _finished(self, job: _Job) -> None:
+        if job.key is not None and self._jobs_by_key.get(job.key) is job:
+            del self._jobs_by_key[job.key]
+
+    def _next_job(self) -> _Job:
+        for priority in Priority:
+            guilds = self._queues[priority]
+            if not guilds:
+                continue
+            guild_id, channels = next(iter(guilds.items()))
+            channel_id, jobs = next(iter(channels.items()))
+            job = jobs.popleft()
+            # Send the guild and channel to the back of the line, so that the others get a turn first
+            channels.move_to_end(channel_id)
+            guilds.move_to_end(guild_id)
+            self._remove_if_empty(priority, guild_id, channel_id)
+            self._dequeued(job)
+            return job
+        raise RuntimeError("No job is queued")
+
+    async def _work(self) -> None:
+        while True:
+            await self._ready.acquire()
+            job = self._next_job()
+            request_priority.set(job.priority)
+            try:
+                result = await job.function()
+            except asyncio.CancelledError:
+                job.future.cancel()
+                # A job may be cancelled from within, which shouldn't take its worker down with it
+                if asyncio.current_task().cancelling():
+                    raise
+            except Exception as error:
+                job.future.set_exception(error)
+                # Marks the exception as retrieved, in case whoever submitted the job stopped waiting for it
+                job.future.exception()
+            else:
+                job.future.set_result(result)
+            finally:
+                self._finished(job)
+
+    async def close(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for priority_queues in self._queues.values():
+            for channels in priority_queues.values():
+                for jobs in channels.values():
+                    for job in jobs:
+                        job.future.cancel()
@@ -0,0 +1,247 @@
+"""Offline benchmarks for the platform adapters and the conversion pipeline.
+
+Everything runs against the recorded responses in ``fixtures/``, served by a local stand-in server, so the numbers
+only reflect our own code (plus the loopback round trip) and can be compared between commits.
+
+Usage: python benchmarks/run.py [--iterations N] [--latency SECONDS] [--filter TEXT] [--json]
+"""
+import argparse
+import asyncio
+import gc
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, asdict
+from pathlib import Path
+
+import aiohttp
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from api.cache import ConversionCache  # noqa: E402
+from api.converter import TrackConverter  # noqa: E402
+from api.platforms import SpotifyAPI, BeatSaverAPI, YoutubeAPI  # noqa: E402
+from api.platforms.beatsaver import beatsaver_map_to_universal  # noqa: E402
+from api.platforms.spotify import spotify_track_to_universal, spotify_playlist_items_to_universal  # noqa: E402
+from api.platforms.youtube import youtube_video_renderer_to_universal  # noqa: E402
+from api.ratelimit import RateLimiter  # noqa: E402
+from api.routing import UrlRouter  # noqa: E402
+from server import FixtureServer, load_fixture  # noqa: E402
+
+SPOTIFY_TRACK_URL = "https://open.spotify.com/track/4uLU6hMCjMI75M1A2tKUQC?si=abcdef"
+SPOTIFY_PLAYLIST_ID = "37i9dQZF1DXcBWIGoYBM5M"
+YOUTUBE_PLAYLIST_ID = "PLFgquLnL59alCl_2TQvOiD5Vgm1hCaGSI"
+MESSAGE = (
+    f"have you heard this one {SPOTIFY_TRACK_URL} and also "
+    "<https://open.spotify.com/track/7ouMYWpwJ422jRcDASZB7P> https://beatsaver.com/maps/2f1a "
+    "https://example.com/not/a/track"
+)
+PLAIN_MESSAGE = "nothing to see here, just a regular message without any links in it at all"
+
+
+@dataclass
+class Result:
+    name: str
+    iterations: int
+    ops_per_second: float
+    p50_ms: float
+    p90_ms: float
+    p99_ms: float
+    peak_bytes_per_op: int
+
+
+def percentile(sorted_samples: list[float], fraction: float) -> float:
+    return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * fraction))]
+
+
+async def measure(name: str, function: Callable[[], Awaitable[object]], iterations: int) -> Result:
+    # A few rounds to warm up connections and caches that are meant to be warm
+    for _ in range(min(10, iterations)):
+        await function()
+
+    gc.collect()
+    samples: list[float] = []
+    started_at = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await function()
+        samples.append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - started_at
+
+    # Allocations are measured separately, as tracing them slows everything down
+    allocation_rounds = max(1, min(iterations, 50))
+    peak_bytes = 0
+    tracemalloc.start()
+    for _ in range(allocation_rounds):
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        await function()
+        peak_bytes += tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+
+    samples.sort()
+    return Result(
+        name=name,
+        iterations=iterations,
+        ops_per_second=iterations / elapsed,
+        p50_ms=percentile(samples, 0.5) * 1000,
+        p90_ms=percentile(samples, 0.9) * 1000,
+        p99_ms=percentile(samples, 0.99) * 1000,
+        peak_bytes_per_op=peak_bytes // allocation_rounds,
+    )
+
+
+def sync(function: Callable[[], object]) -> Callable[[], Awaitable[object]]:
+    async def wrapper() -> object:
+        return function()
+    return wrapper
+
+
+def create_apis(server: FixtureServer, session: aiohttp.ClientSession) -> dict:
+    # The platforms' rate limits would otherwise be all that gets measured
+    rate_limiter = RateLimiter()
+    for api in (SpotifyAPI, BeatSaverAPI, YoutubeAPI):
+        rate_limiter.bucket(api.RATE_LIMIT_KEY or api.__name__, rate=1e9, capacity=10 ** 9)
+
+    spotify = SpotifyAPI(client_id="benchmark", client_secret="benchmark", session=session, rate_limiter=rate_limiter)
+    spotify.API_BASE = f"{server.base_url}/spotify/v1"
+    spotify.TOKEN_URL = f"{server.base_url}/spotify/api/token"
+    beatsaver = BeatSaverAPI(session=session, rate_limiter=rate_limiter)
+    beatsaver.api_base = f"{server.base_url}/beatsaver"
+    youtube = YoutubeAPI(session=session, rate_limiter=rate_limiter)
+    youtube.INNERTUBE_BASE = f"{server.base_url}/youtube/youtubei/v1"
+    return {"spotify": spotify, "beatsaver": beatsaver, "youtube": youtube}
+
+
+async def library_benchmarks(server: FixtureServer) -> dict[str, Callable[[], Awaitable[object]]]:
+    """The youtubesearchpython path the YouTube adapter used to go through, for comparison, if it's installed."""
+    try:
+        # noinspection PyFromFutureImport
+        from youtubesearchpython.__future__ import VideosSearch
+        from youtubesearchpython.core.requests import RequestCore
+    except ImportError:
+        return {}
+
+    # The library always requests youtube.com, with a new client for every request
+    post_request = RequestCore.asyncPostRequest
+
+    async def local_post_request(self: RequestCore):
+        self.url = self.url.replace("https://www.youtube.com", f"{server.base_url}/youtube")
+        return await post_request(self)
+
+    RequestCore.asyncPostRequest = local_post_request
+
+    async def search() -> list:
+        return (await VideosSearch("midnight city").next())["result"]
+
+    try:
+        await search()
+    except Exception as error:
+        # Newer versions of httpx have dropped arguments the library still passes
+        print(f"Skipping youtubesearchpython, it doesn't work in this environment: {error!r}", file=sys.stderr)
+        return {}
+    return {"youtube.search_tracks.youtubesearchpython": search}
+
+
+def benchmarks(
+    apis: dict,
+    router: UrlRouter,
+    cold_converter: TrackConverter,
+    warm_converter: TrackConverter,
+) -> dict[str, Callable[[], Awaitable[object]]]:
+    spotify: SpotifyAPI = apis["spotify"]
+    beatsaver: BeatSaverAPI = apis["beatsaver"]
+    youtube: YoutubeAPI = apis["youtube"]
+    spotify_track = load_fixture("spotify/track.json")
+    spotify_playlist_items = load_fixture("spotify/playlist_tracks.json")["items"]
+    beatsaver_map = load_fixture("beatsaver/map.json")
+    youtube_search = load_fixture("youtube/search.json")
+    youtube_videos = [
+        item["videoRenderer"]
+        for section in youtube_search["contents"]["twoColumnSearchResultsRenderer"]["primaryContents"]
+        ["sectionListRenderer"]["contents"]
+        for item in section.get("itemSectionRenderer", {}).get("contents", ())
+        if "videoRenderer" in item
+    ]
+
+    async def spotify_playlist() -> list:
+        playlist = await spotify.get_playlist_content(SPOTIFY_PLAYLIST_ID)
+        return await playlist.tracks.to_list()
+
+    async def youtube_playlist() -> list:
+        playlist = await youtube.get_playlist_content(YOUTUBE_PLAYLIST_ID)
+        return await playlist.tracks.to_list()
+
+    return {
+        "routing.find_and_resolve": sync(lambda: [router.resolve(url) for url in router.find_urls(MESSAGE)]),
+        "routing.plain_message": sync(lambda: router.find_urls(PLAIN_MESSAGE)),
+        "parse.spotify_track": sync(lambda: spotify_track_to_universal(spotify_track)),
+        "parse.spotify_playlist_page": sync(lambda: spotify_playlist_items_to_universal(spotify_playlist_items)),
+        "parse.beatsaver_map": sync(lambda: beatsaver_map_to_universal(beatsaver_map)),
+        "parse.youtube_search": sync(lambda: [youtube_video_renderer_to_universal(video) for video in youtube_videos]),
+        "spotify.track_from_id": lambda: spotify.track_from_id("4uLU6hMCjMI75M1A2tKUQC"),
+        "spotify.search_tracks": lambda: spotify.search_tracks("midnight city"),
+        "spotify.playlist": spotify_playlist,
+        "beatsaver.search_tracks": lambda: beatsaver.search_tracks("midnight city"),
+        "youtube.track_from_id": lambda: youtube.track_from_id("dX3k_QDnzHE"),
+        "youtube.search_tracks": lambda: youtube.search_tracks("midnight city"),
+        "youtube.playlist": youtube_playlist,
+        "convert_text.cold": lambda: cold_converter.convert_text(MESSAGE, "youtube"),
+        "convert_text.warm": lambda: warm_converter.convert_text(MESSAGE, "youtube"),
+    }
+
+
+async def main(arguments: argparse.Namespace) -> list[Result]:
+    results: list[Result] = []
+    async with FixtureServer(latency=arguments.latency) as server, aiohttp.ClientSession() as session:
+        apis = create_apis(server, session)
+        router = UrlRouter(apis)
+
+        with tempfile.TemporaryDirectory() as storage_path:
+            # The cold converter never caches anything, so every conversion goes all the way to the platforms
+            cold_converter = TrackConverter(
+                apis,
+                cache=ConversionCache(Path(storage_path) / "cold.db", memory_size=0, disk_ttl=0),
+                router=router,
+            )
+            warm_converter = TrackConverter(
+                apis,
+                cache=ConversionCache(Path(storage_path) / "warm.db"),
+                router=router,
+            )
+            converters = (cold_converter, warm_converter)
+            for converter in converters:
+                await converter.cache.connect()
+            cases = benchmarks(apis, router, cold_converter, warm_converter) | await library_benchmarks(server)
+            try:
+                for name, function in cases.items():
+                    if arguments.filter and arguments.filter not in name:
+                        continue
+                    result = await measure(name, function, arguments.iterations)
+                    results.append(result)
+                    if not arguments.json:
+                        print(
+                            f"{result.name:<42} {result.ops_per_second:>12,.1f} ops/s"
+                            f"  p50 {result.p50_ms:>8.3f}ms  p90 {result.p90_ms:>8.3f}ms  p99 {result.p99_ms:>8.3f}ms"
+                            f"  {result.peak_bytes_per_op:>10,} B/op"
+                        )
+            finally:
+                for converter in converters:
+                    await converter.cache.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200, help="how many times to run each benchmark")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the local server waits before replying")
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON, for comparing runs")
+    args = parser.parse_args()
+
+    run_results = asyncio.run(main(args))
+    if args.json:
+        print(json.dumps([asdict(result) for result in run_results], indent=2))
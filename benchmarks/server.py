@@ -0,0 +1,157 @@
+import asyncio
+import json
+from pathlib import Path
+
+from aiohttp import web
+
+__all__ = [
+    "FixtureServer",
+]
+
+FIXTURES_PATH = Path(__file__).parent / "fixtures"
+
+
+def load_fixture(name: str) -> dict:
+    with open(FIXTURES_PATH / name, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+class FixtureServer:
+    """A local stand-in for the platform APIs, answering every request from the recorded fixtures.
+
+    Responses are delayed by ``latency`` seconds, to get a rough idea of how things behave when they have to wait on
+    the network rather than just on parsing.
+    """
+
+    # How many tracks the served Spotify playlist claims to have, its pages are the recorded page repeated
+    SPOTIFY_PLAYLIST_TOTAL = 250
+
+    def __init__(self, *, latency: float = 0.0):
+        self.latency = latency
+        self.request_count = 0
+
+        self._spotify_token = load_fixture("spotify/token.json")
+        self._spotify_track = load_fixture("spotify/track.json")
+        self._spotify_search = load_fixture("spotify/search.json")
+        self._spotify_playlist = load_fixture("spotify/playlist.json")
+        self._spotify_playlist_items = load_fixture("spotify/playlist_tracks.json")["items"]
+        self._beatsaver_map = load_fixture("beatsaver/map.json")
+        self._beatsaver_search = load_fixture("beatsaver/search.json")
+        self._youtube_search = load_fixture("youtube/search.json")
+        self._youtube_player = load_fixture("youtube/player.json")
+        self._youtube_playlist = load_fixture("youtube/browse_playlist.json")
+        self._youtube_playlist_continuation = load_fixture("youtube/browse_continuation.json")
+
+        self._runner: web.AppRunner | None = None
+        self.base_url: str | None = None
+
+    def _app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        app.add_routes([
+            web.post("/spotify/api/token", self._spotify_token_handler),
+            web.get("/spotify/v1/tracks", self._spotify_tracks_handler),
+            web.get("/spotify/v1/search", self._spotify_search_handler),
+            web.get("/spotify/v1/playlists/{id}", self._spotify_playlist_handler),
+            web.get("/spotify/v1/playlists/{id}/tracks", self._spotify_playlist_tracks_handler),
+            web.get("/beatsaver/maps/id/{id}", self._beatsaver_map_handler),
+            web.get("/beatsaver/search/text/{page}", self._beatsaver_search_handler),
+            web.post("/youtube/youtubei/v1/search", self._youtube_search_handler),
+            web.post("/youtube/youtubei/v1/player", self._youtube_player_handler),
+            web.post("/youtube/youtubei/v1/browse", self._youtube_browse_handler),
+        ])
+        return app
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler) -> web.StreamResponse:
+        self.request_count += 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        return await handler(request)
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self._app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.base_url = f"http://{host}:{port}"
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "FixtureServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.close()
+
+    async def _spotify_token_handler(self, _: web.Request) -> web.Response:
+        return web.json_response(self._spotify_token)
+
+    def _spotify_track_with_id(self, track_id: str) -> dict:
+        return {
+            **self._spotify_track,
+            "id": track_id,
+            "external_urls": {"spotify": f"https://open.spotify.com/track/{track_id}"},
+        }
+
+    async def _spotify_tracks_handler(self, request: web.Request) -> web.Response:
+        track_ids = request.query.get("ids", "").split(",")
+        return web.json_response({"tracks": [self._spotify_track_with_id(track_id) for track_id in track_ids]})
+
+    async def _spotify_search_handler(self, request: web.Request) -> web.Response:
+        if request.query.get("q", "").startswith("isrc:"):
+            return web.json_response({"tracks": {**self._spotify_search["tracks"], "items": [self._spotify_track]}})
+        return web.json_response(self._spotify_search)
+
+    def _spotify_playlist_page(self, offset: int, limit: int) -> dict:
+        count = max(0, min(limit, self.SPOTIFY_PLAYLIST_TOTAL - offset))
+        items = self._spotify_playlist_items
+        return {
+            "items": [items[(offset + i) % len(items)] for i in range(count)],
+            "limit": limit,
+            "offset": offset,
+            "total": self.SPOTIFY_PLAYLIST_TOTAL,
+        }
+
+    async def _spotify_playlist_handler(self, _: web.Request) -> web.Response:
+        return web.json_response({**self._spotify_playlist, "tracks": self._spotify_playlist_page(0, 100)})
+
+    async def _spotify_playlist_tracks_handler(self, request: web.Request) -> web.Response:
+        offset = int(request.query.get("offset", 0))
+        limit = int(request.query.get("limit", 100))
+        return web.json_response(self._spotify_playlist_page(offset, limit))
+
+    async def _beatsaver_map_handler(self, request: web.Request) -> web.Response:
+        return web.json_response({**self._beatsaver_map, "id": request.match_info["id"]})
+
+    async def _beatsaver_search_handler(self, _: web.Request) -> web.Response:
+        return web.json_response(self._beatsaver_search)
+
+    async def _youtube_search_handler(self, _: web.Request) -> web.Response:
+        return web.json_response(self._youtube_search)
+
+    async def _youtube_player_handler(self, _: web.Request) -> web.Response:
+        return web.json_response(self._youtube_player)
+
+    async def _youtube_browse_handler(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        if "continuation" not in body:
+            return web.json_response(self._youtube_playlist)
+        if body["continuation"] != "NEXT":
+            return web.json_response(self._youtube_playlist_continuation)
+
+        # The recorded continuation again, but as the last page
+        actions = self._youtube_playlist_continuation["onResponseReceivedActions"]
+        items = actions[0]["appendContinuationItemsAction"]["continuationItems"]
+        return web.json_response({
+            **self._youtube_playlist_continuation,
+            "onResponseReceivedActions": [{
+                "appendContinuationItemsAction": {
+                    "continuationItems": [item for item in items if "continuationItemRenderer" not in item],
+                },
+            }],
+        })
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The api package is imported on its own, like the benchmarks do, since the module around it needs the bot framework
+sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from api.batching import MicroBatcher
+
+
+def test_lookups_are_batched():
+    async def main():
+        batches = []
+
+        async def lookup(items: list[int]) -> list[int]:
+            batches.append(items)
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(lookup, window=0.01)
+        assert await asyncio.gather(*map(batcher.submit, [1, 2, 3, 2])) == [2, 4, 6, 4]
+        assert batches == [[1, 2, 3]]
+
+    asyncio.run(main())
+
+
+def test_short_batch_fails_the_unmatched_lookups():
+    async def main():
+        async def lookup(items: list[str]) -> list[str]:
+            return items[:1]
+
+        batcher = MicroBatcher(lookup, window=0.01)
+        first, second = await asyncio.gather(batcher.submit("a"), batcher.submit("b"), return_exceptions=True)
+        assert first == "a"
+        assert isinstance(second, RuntimeError)
+
+    asyncio.run(main())
+
+
+def test_failed_batch_fails_every_lookup():
+    async def main():
+        async def lookup(items: list[str]) -> list[str]:
+            raise ValueError("Nope")
+
+        batcher = MicroBatcher(lookup, window=0.01)
+        results = await asyncio.gather(batcher.submit("a"), batcher.submit("b"), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+
+    asyncio.run(main())
+
+
+def test_close_cancels_pending_lookups():
+    async def main():
+        async def lookup(items: list[str]) -> list[str]:
+            await asyncio.sleep(10)
+            return items
+
+        batcher = MicroBatcher(lookup, window=0.01)
+        gathering = asyncio.create_task(batcher.submit("a"))
+        await asyncio.sleep(0.05)
+        sent = asyncio.create_task(batcher.submit("b"))
+        await asyncio.sleep(0)
+        await batcher.close()
+        for task in (gathering, sent):
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+import asyncio
+from pathlib import Path
+
+from api.abc import UniversalTrack
+from api.cache import ConversionCache
+
+TRACK = UniversalTrack(
+    title="Never Gonna Give You Up",
+    artist_names=["Rick Astley"],
+    url="https://youtu.be/dQw4w9WgXcQ",
+)
+
+
+def test_read_through(tmp_path: Path):
+    async def main():
+        cache = ConversionCache(tmp_path / "cache.db")
+        await cache.connect()
+        assert await cache.get("spotify", "abc", "youtube") is None
+        await cache.set("spotify", "abc", "youtube", TRACK)
+        assert await cache.get("spotify", "abc", "youtube") == TRACK
+        # Another direction of the same conversion is a different entry
+        assert await cache.get("youtube", "abc", "spotify") is None
+        await cache.close()
+
+    asyncio.run(main())
+
+
+def test_write_back_survives_restart(tmp_path: Path):
+    async def main():
+        cache = ConversionCache(tmp_path / "cache.db")
+        await cache.connect()
+        await cache.set("spotify", "abc", "youtube", TRACK)
+        await cache.set_by_isrc("gbarl9300135", "youtube", TRACK)
+        await cache.set_by_canonical_key("rick astley - never gonna give you up", "youtube", TRACK)
+        # Queued writes are flushed on close, nothing has to be awaited for them to be kept
+        await cache.close()
+
+        cache = ConversionCache(tmp_path / "cache.db")
+        await cache.connect()
+        assert await cache.get("spotify", "abc", "youtube") == TRACK
+        assert await cache.get_by_isrc("gbarl9300135", "youtube") == TRACK
+        assert await cache.get_by_canonical_key("rick astley - never gonna give you up", "youtube") == TRACK
+        assert await cache.get_by_isrc("gbarl9300135", "spotify") is None
+        assert await cache.get_by_canonical_key("rick astley - never gonna give you up", "spotify") is None
+        await cache.close()
+
+    asyncio.run(main())
+
+
+def test_lookups_do_not_collide(tmp_path: Path):
+    async def main():
+        cache = ConversionCache(tmp_path / "cache.db", disk_ttl=0)
+        await cache.connect()
+        other_track = TRACK.replace(url="https://youtu.be/other")
+        await cache.set("isrc", "key", "youtube", TRACK)
+        await cache.set_by_isrc("key", "youtube", other_track)
+        await cache.set_by_canonical_key("key", "youtube", other_track)
+        assert await cache.get("isrc", "key", "youtube") == TRACK
+        assert await cache.get_by_isrc("KEY", "youtube") is None
+        assert await cache.get_by_isrc("key", "youtube") == other_track
+        await cache.close()
+
+    asyncio.run(main())
+
+
+def test_expired_entries_are_not_returned(tmp_path: Path):
+    async def main():
+        cache = ConversionCache(tmp_path / "cache.db", memory_ttl=-1, disk_ttl=-1)
+        await cache.connect()
+        await cache.set("spotify", "abc", "youtube", TRACK)
+        await cache.database.flush()
+        assert await cache.get("spotify", "abc", "youtube") is None
+        await cache.close()
+
+    asyncio.run(main())
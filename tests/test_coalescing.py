@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from api.coalescing import SingleFlight, coalesced, uncoalesced
+from api.ratelimit import Priority, request_priority
+
+
+def test_concurrent_calls_share_one_call():
+    async def main():
+        single_flight = SingleFlight()
+        calls = 0
+
+        async def lookup(value: int) -> int:
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return value * 2
+
+        results = await asyncio.gather(*(single_flight.run("key", lookup, 21) for _ in range(5)))
+        assert results == [42] * 5
+        assert calls == 1
+        assert len(single_flight) == 0
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_does_not_cancel_the_others():
+    async def main():
+        single_flight = SingleFlight()
+        started = asyncio.Event()
+        calls = 0
+
+        async def lookup() -> str:
+            nonlocal calls
+            calls += 1
+            started.set()
+            await asyncio.sleep(0.05)
+            return "result"
+
+        impatient = asyncio.create_task(single_flight.run("key", lookup))
+        patient = asyncio.create_task(single_flight.run("key", lookup))
+        await started.wait()
+        impatient.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await impatient
+        assert await patient == "result"
+        assert calls == 1
+
+    asyncio.run(main())
+
+
+def test_prefetches_are_not_shared_with_other_priorities():
+    async def main():
+        single_flight = SingleFlight()
+        calls = 0
+
+        async def lookup() -> None:
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+
+        async def run_at(priority: Priority) -> None:
+            request_priority.set(priority)
+            await single_flight.run("key", lookup)
+
+        await asyncio.gather(run_at(Priority.PREFETCH), run_at(Priority.INTERACTIVE), run_at(Priority.PASSIVE))
+        assert calls == 2
+
+    asyncio.run(main())
+
+
+class _API:
+    def __init__(self):
+        self._single_flight = SingleFlight()
+        self.requests = 0
+
+    @coalesced
+    async def lookup(self, value: int) -> int:
+        self.requests += 1
+        await asyncio.sleep(0.01)
+        return value
+
+
+class _SubclassAPI(_API):
+    @coalesced
+    async def lookup(self, value: int) -> int:
+        return await super().lookup(value) + 1
+
+
+def test_uncoalesced_reaches_overridden_methods():
+    async def main():
+        api = _SubclassAPI()
+        shared = asyncio.create_task(api.lookup(1))
+        await asyncio.sleep(0)
+        assert await uncoalesced(api.lookup)(1) == 2
+        assert await shared == 2
+        assert api.requests == 2
+
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+import asyncio
+import importlib
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+from api.abc import UniversalTrack
+from api.catalog import CATALOG_MIGRATIONS, TrackCatalog
+from api.database import AsyncDatabase
+
+
+def _database_migrations() -> tuple[str, ...]:
+    # They belong to the module itself, which can't be imported without the bot framework
+    pytest.importorskip("breadcord")
+    package_path = Path(__file__).parent.parent
+    sys.path.insert(0, str(package_path.parent))
+    try:
+        return importlib.import_module(package_path.name).DATABASE_MIGRATIONS
+    finally:
+        sys.path.remove(str(package_path.parent))
+
+
+def test_migrates_the_baseline_database(tmp_path: Path):
+    migrations = _database_migrations()
+    path = tmp_path / "platform_converter.db"
+    # The schema from before there were migrations, which left the user_version at 0
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS community_playlist ("
+        "    track_url TEXT UNIQUE,"
+        "    addition_author_id INTEGER,"
+        "    rejected INT,"
+        "    PRIMARY KEY (track_url)"
+        ")"
+    )
+    connection.execute("INSERT INTO community_playlist VALUES ('https://youtu.be/dQw4w9WgXcQ', 1234, 0)")
+    connection.commit()
+    connection.close()
+
+    async def main():
+        database = AsyncDatabase(path, migrations=migrations)
+        await database.connect()
+        assert await database.fetchone("PRAGMA user_version") == (len(migrations),)
+        assert await database.fetchall(
+            "SELECT track_url, addition_author_id, rejected, canonical_key FROM community_playlist"
+        ) == [("https://youtu.be/dQw4w9WgXcQ", 1234, 0, None)]
+        assert await database.fetchall("SELECT * FROM playlist_messages") == []
+        await database.close()
+
+    asyncio.run(main())
+
+
+def test_failed_migration_is_rolled_back(tmp_path: Path):
+    async def main():
+        database = AsyncDatabase(tmp_path / "test.db", migrations=(
+            "CREATE TABLE first (value INTEGER)",
+            "CREATE TABLE second (value INTEGER);INSERT INTO missing VALUES (1)",
+        ))
+        with pytest.raises(sqlite3.OperationalError):
+            await database.connect()
+        assert await database.fetchone("PRAGMA user_version") == (1,)
+        assert await database.fetchone("SELECT name FROM sqlite_master WHERE name = 'second'") is None
+        await database.close()
+
+    asyncio.run(main())
+
+
+def test_migrates_the_catalog_to_explicit_ids(tmp_path: Path):
+    path = tmp_path / "catalog.db"
+    track = UniversalTrack(title="Bohemian Rhapsody", artist_names=["Queen"], url="https://youtu.be/fJ9rUzIMcZQ")
+
+    async def main():
+        # The catalog as it was before its tracks had an id, whose search index used their implicit rowids
+        database = AsyncDatabase(path, migrations=CATALOG_MIGRATIONS[:2])
+        await database.connect()
+        await database.execute(
+            "INSERT INTO catalog_tracks (platform, url, title, artists, track, last_seen, refreshed_at) "
+            "VALUES ('youtube', 'https://youtu.be/removed', 'Removed', 'Nobody', '{}', 0, 0)"
+        )
+        await database.execute(
+            "INSERT INTO catalog_tracks (platform, url, title, artists, track, last_seen, refreshed_at) "
+            "VALUES ('youtube', ?, ?, ?, ?, 0, 0)",
+            (track.url, track.title, "Queen", json.dumps(track.to_dict()))
+        )
+        await database.execute("DELETE FROM catalog_tracks WHERE title = 'Removed'")
+        await database.execute(
+            "INSERT INTO catalog_search (rowid, title, artists, query) "
+            "SELECT rowid, title, artists, query FROM catalog_tracks"
+        )
+        await database.close()
+
+        catalog = TrackCatalog(path, {})
+        await catalog.database.connect()
+        assert await catalog.database.fetchall("SELECT id, url FROM catalog_tracks") == [(2, track.url)]
+        assert await catalog.search("youtube", "queen bohemian rhapsody") == [track]
+        await catalog.remove("youtube", track.url)
+        await catalog.database.flush()
+        assert await catalog.database.fetchall("SELECT rowid FROM catalog_search") == []
+        await catalog.database.close()
+
+    asyncio.run(main())
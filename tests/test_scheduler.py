@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from api.errors import QueueFullError
+from api.ratelimit import Priority
+from api.scheduler import ConversionScheduler
+
+
+def test_worker_survives_a_cancelled_job():
+    async def main():
+        scheduler = ConversionScheduler(workers=1)
+        scheduler.start()
+
+        async def cancelled() -> None:
+            raise asyncio.CancelledError
+
+        async def answer() -> int:
+            return 42
+
+        with pytest.raises(asyncio.CancelledError):
+            await scheduler.submit(cancelled)
+        assert await asyncio.wait_for(scheduler.submit(answer), 1) == 42
+        assert not any(worker.done() for worker in scheduler._workers)
+        await scheduler.close()
+
+    asyncio.run(main())
+
+
+def test_close_stops_busy_workers():
+    async def main():
+        scheduler = ConversionScheduler(workers=1)
+        scheduler.start()
+        job = asyncio.create_task(scheduler.submit(lambda: asyncio.sleep(10)))
+        await asyncio.sleep(0.01)
+        await asyncio.wait_for(scheduler.close(), 1)
+        with pytest.raises(asyncio.CancelledError):
+            await job
+
+    asyncio.run(main())
+
+
+def test_jobs_with_the_same_key_are_coalesced():
+    async def main():
+        scheduler = ConversionScheduler(workers=2)
+        scheduler.start()
+        calls = 0
+
+        async def convert() -> str:
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "converted"
+
+        results = await asyncio.gather(*(scheduler.submit(convert, key="same links") for _ in range(3)))
+        assert results == ["converted"] * 3
+        assert calls == 1
+        await scheduler.close()
+
+    asyncio.run(main())
+
+
+def test_full_queue_evicts_lower_priorities_first():
+    async def main():
+        # Not started, so that every job stays queued
+        scheduler = ConversionScheduler(max_queued=1)
+        prefetch = asyncio.create_task(scheduler.submit(lambda: asyncio.sleep(0), priority=Priority.PREFETCH))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(scheduler.submit(lambda: asyncio.sleep(0), priority=Priority.INTERACTIVE))
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError):
+            await prefetch
+        with pytest.raises(QueueFullError):
+            await scheduler.submit(lambda: asyncio.sleep(0), priority=Priority.INTERACTIVE)
+        await scheduler.close()
+        with pytest.raises(asyncio.CancelledError):
+            await interactive
+
+    asyncio.run(main())